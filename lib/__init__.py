@@ -1,7 +1,15 @@
 from .cl_types import *
+from .stats import *
 from .parser import *
+from .arena import *
 from .util import *
+from .emitter import *
+from .binary import *
 from .type_checking_rules import *
+from .cache import *
+from .astcache import *
+from .batch import *
+from .daemon import *
 
 
-__all__ = ['cl_types', 'parser', 'type_checking_rules', 'util']
\ No newline at end of file
+__all__ = ['cl_types', 'stats', 'parser', 'arena', 'emitter', 'binary', 'type_checking_rules', 'util', 'cache', 'astcache', 'batch', 'daemon']
\ No newline at end of file
@@ -0,0 +1,372 @@
+import sys
+from array import array
+from collections.abc import Callable, Generator
+
+from .cl_types import *
+from .parser import COOLParser, ParseStates
+
+# Every kind of node an arena stores: the kinds of expression, then identifiers,
+# let bindings and case branches
+ARENA_KINDS = ('assign', 'dynamic_dispatch', 'static_dispatch', 'self_dispatch',
+               'if', 'while', 'block', 'new', 'isvoid',
+               'plus', 'minus', 'times', 'divide', 'lt', 'le', 'eq', 'not', 'negate',
+               'integer', 'string', 'identifier', 'true', 'false', 'let', 'case',
+               'ident', 'let_binding_no_init', 'let_binding_init', 'case_branch')
+ARENA_KIND_IDX = {k: i for i, k in enumerate(ARENA_KINDS)}
+
+ARENA_BINARY = {
+    'plus': CLPlus,
+    'minus': CLMinus,
+    'times': CLTimes,
+    'divide': CLDivide,
+    'lt': CLLT,
+    'le': CLLE,
+    'eq': CLEQ,
+}
+ARENA_UNARY = {
+    'isvoid': CLIsvoid,
+    'not': CLNOT,
+    'negate': CLNegate,
+}
+
+class CLArena:
+    """Flat storage for the expressions of a COOL program: one int handle per node
+    instead of one Python object per node.
+
+    A node is a row of the parallel columns below. Its children are
+    kids[first[h]:first[h] + count[h]]; nodes are appended in post-order, so the
+    children of a node always come before it. Children are listed in the order
+    they appear in the cl-ast: e.g. a static dispatch has its caller, its static
+    type, its method name, then its args; a let has its bindings, then its body;
+    a case has its expr, then its branches
+
+    Attributes:
+        kind (array): index in `ARENA_KINDS` of each node
+        line (array): line number of each node
+        value (array): index in `strings` of the name of an identifier, the text of a constant or the kind of a let binding; -1 if none
+        first (array): offset of the first child of each node in `kids`
+        count (array): number of children of each node
+        kids (array): child handles of every node, node after node
+        s_type (array): index in `annots` of the static type of each expression; -1 until it is type checked
+        strings (list[str]): string table; each name or constant text is stored once
+        string_idx (dict[str, int]): index of each string in `strings`
+        annots (list[CLType]): static types assigned to expressions
+        annot_idx (dict[CLType, int]): index in `annots` of each (interned) static type
+    """
+    def __init__(self):
+        self.kind = array('B')
+        self.line = array('i')
+        self.value = array('i')
+        self.first = array('i')
+        self.count = array('i')
+        self.kids = array('i')
+        self.s_type = array('i')
+        self.strings = []
+        self.string_idx = dict()
+        self.annots = []
+        self.annot_idx = dict()
+
+    def __len__(self):
+        return len(self.kind)
+
+    def intern(self, s: str) -> int:
+        """Return the index of `s` in the string table, adding it if needed"""
+        idx = self.string_idx.get(s)
+        if (idx is None):
+            idx = len(self.strings)
+            self.strings.append(sys.intern(s))
+            self.string_idx[s] = idx
+        return idx
+
+    def add(self, kind: str, line: int, value: int, kids: list[int]) -> int:
+        """Append a node and return its handle"""
+        h = len(self.kind)
+        self.kind.append(ARENA_KIND_IDX[kind])
+        self.line.append(line)
+        self.value.append(value)
+        self.first.append(len(self.kids))
+        self.count.append(len(kids))
+        self.kids.extend(kids)
+        self.s_type.append(-1)
+        return h
+
+    def children(self, h: int) -> array:
+        return self.kids[self.first[h]:self.first[h] + self.count[h]]
+
+    def get_s_type(self, h: int) -> CLType | None:
+        idx = self.s_type[h]
+        return None if idx < 0 else self.annots[idx]
+
+    def set_s_type(self, h: int, t: CLType | None):
+        if (t is None):
+            self.s_type[h] = -1
+            return
+        idx = self.annot_idx.get(t)
+        if (idx is None):
+            idx = len(self.annots)
+            self.annots.append(t)
+            self.annot_idx[t] = idx
+        self.s_type[h] = idx
+
+    def expr(self, h: int) -> 'CLArenaExpr':
+        return CLArenaExpr(self, h)
+
+    def ident(self, h: int, cls: type) -> CLClassIdent|CLMethodIdent|CLVarIdent|CLSelfIdent|CLTypeIdent:
+        return cls(self.line[h], self.strings[self.value[h]])
+
+    def body(self, h: int):
+        """Build the body of expression `h`, the same node the parser would build,
+        with its sub-expressions as `CLArenaExpr`s"""
+        return self.node(h, self.expr)
+
+    def node(self, h: int, sub: Callable[[int], CLExpr]):
+        """Build the body of expression `h`, with `sub` building each of its sub-expressions"""
+        k = ARENA_KINDS[self.kind[h]]
+        kids = self.children(h)
+        match k:
+            case 'integer'|'string'|'true'|'false':
+                return mkCLConstant(self.strings[self.value[h]])
+            case 'identifier':
+                name = self.strings[self.value[kids[0]]]
+                return self.ident(kids[0], CLSelfIdent if name == 'self' else CLVarIdent)
+            case 'new':
+                return CLNew(self.ident(kids[0], CLTypeIdent))
+            case 'assign':
+                return CLAssign(self.ident(kids[0], CLVarIdent), sub(kids[1]))
+            case 'isvoid'|'not'|'negate':
+                return ARENA_UNARY[k](sub(kids[0]))
+            case 'plus'|'minus'|'times'|'divide'|'lt'|'le'|'eq':
+                return ARENA_BINARY[k](sub(kids[0]), sub(kids[1]))
+            case 'while':
+                return CLWhile(sub(kids[0]), sub(kids[1]))
+            case 'if':
+                return CLIf(sub(kids[0]), sub(kids[1]), sub(kids[2]))
+            case 'block':
+                return CLBlock([sub(e) for e in kids])
+            case 'dynamic_dispatch':
+                return CLDynDispatch(sub(kids[0]),
+                                     self.ident(kids[1], CLMethodIdent),
+                                     [sub(e) for e in kids[2:]])
+            case 'static_dispatch':
+                return CLStaticDispatch(sub(kids[0]),
+                                        self.ident(kids[1], CLTypeIdent),
+                                        self.ident(kids[2], CLMethodIdent),
+                                        [sub(e) for e in kids[3:]])
+            case 'self_dispatch':
+                return CLSelfDispatch(self.ident(kids[0], CLMethodIdent),
+                                      [sub(e) for e in kids[1:]])
+            case 'let':
+                bind_list = []
+                for b in kids[:-1]:
+                    b_kids = self.children(b)
+                    bind_list.append(CLLetBindingElem(self.strings[self.value[b]],
+                                                      self.ident(b_kids[0], CLVarIdent),
+                                                      self.ident(b_kids[1], CLTypeIdent),
+                                                      sub(b_kids[2]) if len(b_kids) == 3 else None))
+                return CLLet(bind_list, sub(kids[-1]))
+            case 'case':
+                case_list = []
+                for b in kids[1:]:
+                    b_kids = self.children(b)
+                    case_list.append(CLCaseElem(self.ident(b_kids[0], CLVarIdent),
+                                                self.ident(b_kids[1], CLTypeIdent),
+                                                sub(b_kids[2])))
+                return CLCase(self.line[h], sub(kids[0]), case_list)
+
+    def materialize(self) -> list[CLExpr | None]:
+        """Build every expression of the arena as a plain `CLExpr`, the same objects
+        the parser would build. Handles are visited in order, so the sub-expressions
+        of a node are always built before it and no stack is needed
+
+        :return: the `CLExpr` of each expression handle; None for the other nodes
+        :rtype: list(CLExpr | None)
+        """
+        built: list[CLExpr | None] = [None] * len(self.kind)
+        sub = built.__getitem__
+        n_exprs = ARENA_KIND_IDX['ident']
+        for h, k in enumerate(self.kind):
+            # Expression kinds come first in `ARENA_KINDS`
+            if (k < n_exprs):
+                built[h] = CLExpr(self.line[h], ARENA_KINDS[k], self.node(h, sub))
+        return built
+
+    def read_ident(self, parser: COOLParser) -> int:
+        line_num = int(parser.it)
+        parser.get_next()
+
+        name = parser.it
+        parser.get_next()
+
+        return self.add('ident', line_num, self.intern(name), [])
+
+    def read_expr(self, parser: COOLParser) -> 'CLArenaExpr':
+        """Read one expression, and all of its sub-expressions, into the arena without
+        recursion; the same walk as `read_expr`, with the generator steps in `ARENA_READERS`"""
+        stack: list[Generator[None, int, int]] = []
+        while (True):
+            h = arena_read_expr_start(self, parser, stack)
+            while (h is not None):
+                if (not stack):
+                    return self.expr(h)
+                try:
+                    stack[-1].send(h)
+                    h = None
+                except StopIteration as done:
+                    stack.pop()
+                    h = done.value
+
+class CLArenaExpr(CLExpr):
+    """Handle to an expression in a `CLArena` that reads like a `CLExpr`, so the type
+    checker and printer run on an arena unchanged. It is built on demand and holds no
+    state of its own: line_num, type and s_type are read from (and s_type written to)
+    the arena's columns, and each access to body builds the body anew
+
+    Attributes:
+        arena (CLArena): arena the expression is stored in
+        h (int): handle of the expression in `arena`
+    """
+    __slots__ = ('arena', 'h')
+
+    def __init__(self, arena: CLArena, h: int):
+        self.arena = arena
+        self.h = h
+
+    @property
+    def line_num(self) -> int:
+        return self.arena.line[self.h]
+
+    @property
+    def type(self) -> str:
+        return ARENA_KINDS[self.arena.kind[self.h]]
+
+    @property
+    def body(self):
+        return self.arena.body(self.h)
+
+    @property
+    def s_type(self) -> CLType | None:
+        return self.arena.get_s_type(self.h)
+
+    @s_type.setter
+    def s_type(self, t: CLType | None):
+        self.arena.set_s_type(self.h, t)
+
+def arena_read_expr_start(arena: CLArena,
+                          parser: COOLParser,
+                          stack: list[Generator[None, int, int]]) -> int | None:
+    """Read the line number and kind of the next expression. Return its handle if
+    it is already complete, else push its generator step on `stack` and return None"""
+    parser.set_parse_state(ParseStates.CLEXPR)
+
+    expr_line_num = int(parser.it)
+    parser.get_next()
+
+    expr_type = parser.it
+    parser.get_next()
+
+    match expr_type:
+        case 'true' | 'false':
+            return arena.add(expr_type, expr_line_num, arena.intern(expr_type), [])
+        case 'integer' | 'string':
+            const_val = str(parser.it)
+            parser.get_next()
+            return arena.add(expr_type, expr_line_num, arena.intern(const_val), [])
+        case 'identifier' | 'new':
+            return arena.add(expr_type, expr_line_num, -1, [arena.read_ident(parser)])
+        case _ if expr_type in ARENA_READERS:
+            step = ARENA_READERS[expr_type](arena, parser, expr_line_num, expr_type)
+            try:
+                next(step)
+            except StopIteration as done:
+                return done.value
+            stack.append(step)
+            return None
+        case _:     # Unknown error
+            raise ValueError(f'unknown expr type {expr_type} at line {expr_line_num}')
+
+def arena_read_expr_assign(arena: CLArena, parser: COOLParser, expr_line_num: int, expr_type: str) -> Generator[None, int, int]:
+    var = arena.read_ident(parser)
+    rhs = yield
+    return arena.add(expr_type, expr_line_num, -1, [var, rhs])
+
+def arena_read_expr_sub_exprs(arena: CLArena, parser: COOLParser, expr_line_num: int, expr_type: str) -> Generator[None, int, int]:
+    # unary, binary, if and while: a fixed number of sub-expressions
+    kids = []
+    for i in range(ARENA_SUB_EXPRS[expr_type]):
+        kids.append((yield))
+    return arena.add(expr_type, expr_line_num, -1, kids)
+
+def arena_read_expr_dispatch(arena: CLArena, parser: COOLParser, expr_line_num: int, expr_type: str) -> Generator[None, int, int]:
+    kids = []
+    if (expr_type != 'self_dispatch'):
+        kids.append((yield))
+    if (expr_type == 'static_dispatch'):
+        kids.append(arena.read_ident(parser))
+    kids.append(arena.read_ident(parser))
+
+    argc = int(parser.it)
+    parser.get_next()
+
+    parser.set_parse_state(ParseStates.CLLIST)
+    for i in range(argc):
+        kids.append((yield))
+    return arena.add(expr_type, expr_line_num, -1, kids)
+
+def arena_read_expr_block(arena: CLArena, parser: COOLParser, expr_line_num: int, expr_type: str) -> Generator[None, int, int]:
+    exp_cnt = int(parser.it)
+    parser.get_next()
+
+    kids = []
+    parser.set_parse_state(ParseStates.CLLIST)
+    for i in range(exp_cnt):
+        kids.append((yield))
+    return arena.add(expr_type, expr_line_num, -1, kids)
+
+def arena_read_expr_let(arena: CLArena, parser: COOLParser, expr_line_num: int, expr_type: str) -> Generator[None, int, int]:
+    bind_cnt = int(parser.it)
+    parser.get_next()
+
+    kids = []
+    parser.set_parse_state(ParseStates.CLLIST)
+    for i in range(bind_cnt):
+        bind_type = parser.it
+        parser.get_next()
+
+        b_kids = [arena.read_ident(parser), arena.read_ident(parser)]
+        if (bind_type == 'let_binding_init'):
+            b_kids.append((yield))
+        kids.append(arena.add(bind_type, expr_line_num, arena.intern(bind_type), b_kids))
+
+    kids.append((yield))
+    return arena.add(expr_type, expr_line_num, -1, kids)
+
+def arena_read_expr_case(arena: CLArena, parser: COOLParser, expr_line_num: int, expr_type: str) -> Generator[None, int, int]:
+    kids = [(yield)]
+    case_cnt = int(parser.it)
+    parser.get_next()
+
+    parser.set_parse_state(ParseStates.CLLIST)
+    for i in range(case_cnt):
+        b_kids = [arena.read_ident(parser), arena.read_ident(parser)]
+        b_kids.append((yield))
+        kids.append(arena.add('case_branch', expr_line_num, -1, b_kids))
+    return arena.add(expr_type, expr_line_num, -1, kids)
+
+# Number of sub-expressions of the kinds read by `arena_read_expr_sub_exprs`
+ARENA_SUB_EXPRS = {
+    'isvoid': 1, 'not': 1, 'negate': 1,
+    'plus': 2, 'minus': 2, 'times': 2, 'divide': 2, 'lt': 2, 'le': 2, 'eq': 2,
+    'while': 2, 'if': 3,
+}
+
+# Generator step of `CLArena.read_expr` for each kind of non-leaf expression
+ARENA_READERS = {
+    'assign': arena_read_expr_assign,
+    'dynamic_dispatch': arena_read_expr_dispatch,
+    'static_dispatch': arena_read_expr_dispatch,
+    'self_dispatch': arena_read_expr_dispatch,
+    'block': arena_read_expr_block,
+    'let': arena_read_expr_let,
+    'case': arena_read_expr_case,
+    **{k: arena_read_expr_sub_exprs for k in ARENA_SUB_EXPRS},
+}
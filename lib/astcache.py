@@ -0,0 +1,171 @@
+import hashlib
+import marshal
+import os
+import sys
+import zlib
+from array import array
+
+from .cl_types import *
+from .parser import *
+from .arena import CLArena
+from .binary import stream_tokens
+
+# Version of the .cl-astc format; part of the header of every file, so files written
+# by another version are rebuilt instead of read
+AST_CACHE_VERSION = 1
+# Size in bytes of each read from a .cl-ast file by `input_digest`
+AST_CACHE_DIGEST_CHUNK = 1 << 20
+# zlib level of a .cl-astc's payload: the fastest, which still makes it several times
+# smaller than the .cl-ast
+AST_CACHE_COMPRESSION = 1
+# Columns of a `CLArena` stored in a .cl-astc, in order
+AST_CACHE_COLUMNS = ('kind', 'line', 'value', 'first', 'count', 'kids')
+
+def ast_cache_path(path: str) -> str:
+    """Return the path of the .cl-astc kept for the .cl-ast (text or binary) at `path`, next to it"""
+    return os.path.splitext(path)[0] + '.cl-astc'
+
+def input_digest(path: str) -> str:
+    """Return the sha256 of the bytes of the file at `path`"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        chunk = f.read(AST_CACHE_DIGEST_CHUNK)
+        while (chunk):
+            h.update(chunk)
+            chunk = f.read(AST_CACHE_DIGEST_CHUNK)
+    return h.hexdigest()
+
+def ast_cache_header(digest: str) -> bytes:
+    """Return the first line of the .cl-astc of an input with sha256 `digest`: the format
+    version, the byte order of the columns and the digest. A file is only read if its
+    first line is exactly this one"""
+    return f'cl-astc {AST_CACHE_VERSION} {sys.byteorder} {digest}\n'.encode()
+
+def dump_ast(ast: CLAST, arena: CLArena) -> bytes:
+    """Serialize a program read into `arena` (see `read_prog`): the arena's string table
+    and columns, and the classes and features as nested tuples of names, line numbers
+    and expression handles
+
+    :return: the payload of a .cl-astc, compressed
+    :rtype: bytes
+    """
+    classes = []
+    for c in ast.classes:
+        features = []
+        for f in c.features:
+            if (f.f_type == 'method'):
+                t, e = f.m_type, f.m_body.h
+            else:
+                t, e = f.att_type, f.att_init.h if (f.f_type == 'attribute_init') else -1
+            features.append((f.f_type, f.f_ident.line, f.f_ident.name, t.line, t.name,
+                             tuple((fl.name.line, fl.name.name, fl.type.line, fl.type.name)
+                                   for fl in f.m_formals),
+                             e))
+        superclass = (c.superclass.line, c.superclass.name) if (c.inherits) else None
+        classes.append((c.ident.line, c.ident.name, superclass, tuple(features)))
+    columns = tuple(getattr(arena, col).tobytes() for col in AST_CACHE_COLUMNS)
+    return zlib.compress(marshal.dumps((arena.strings, columns, tuple(classes))), AST_CACHE_COMPRESSION)
+
+def load_ast(payload: bytes) -> tuple[CLAST, CLArena]:
+    """Rebuild a program serialized by `dump_ast`, its features holding `CLArenaExpr` handles
+
+    :return: (the program X the arena its expressions are stored in)
+    :rtype: tuple(CLAST, CLArena)
+    """
+    strings, columns, classes = marshal.loads(zlib.decompress(payload))
+    arena = CLArena()
+    for col, data in zip(AST_CACHE_COLUMNS, columns, strict=True):
+        getattr(arena, col).frombytes(data)
+    n = len(arena.kind)
+    if (any(len(getattr(arena, col)) != n for col in AST_CACHE_COLUMNS[1:-1])):
+        raise ValueError('columns of different lengths')
+    arena.s_type = array('i', [-1]) * n
+    arena.strings = strings
+    arena.string_idx = {s: i for i, s in enumerate(strings)}
+
+    class_list: list[CLClass] = []
+    for line, name, superclass, features in classes:
+        feature_list: list[CLFeature] = []
+        for f_type, n_line, n_name, t_line, t_name, formals, e in features:
+            t = CLTypeIdent(t_line, t_name)
+            match f_type:
+                case 'attribute_no_init':
+                    feature_list.append(CLFeature(f_type, CLVarIdent(n_line, n_name), t))
+                case 'attribute_init':
+                    feature_list.append(CLFeature(f_type, CLVarIdent(n_line, n_name), t,
+                                                  None, arena.expr(e)))
+                case 'method':
+                    formal_list = [CLFormal(CLVarIdent(fn_line, fn_name), CLTypeIdent(ft_line, ft_name))
+                                   for fn_line, fn_name, ft_line, ft_name in formals]
+                    feature_list.append(CLFeature(f_type, CLMethodIdent(n_line, n_name), t,
+                                                  formal_list, None, arena.expr(e)))
+        super_id = None if (superclass is None) else CLClassIdent(*superclass)
+        class_list.append(CLClass(CLClassIdent(line, name), feature_list,
+                                  superclass is not None, super_id))
+    return (CLAST(class_list), arena)
+
+def materialize_prog(ast: CLAST, arena: CLArena):
+    """Replace the `CLArenaExpr` handles of the features of `ast` by plain `CLExpr`s,
+    built from `arena` by `CLArena.materialize`"""
+    built = arena.materialize()
+    for c in ast.classes:
+        for f in c.features:
+            if (f.f_type == 'method'):
+                f.m_body = built[f.m_body.h]
+            elif (f.f_type == 'attribute_init'):
+                f.att_init = built[f.att_init.h]
+
+def read_ast_cache(path: str, digest: str) -> tuple[CLAST, CLArena] | None:
+    """Load the .cl-astc of the .cl-ast at `path`, whose sha256 is `digest`.
+    Return None if there is none, or if it is stale (another input or format version)
+    or corrupt (zlib checks the payload)"""
+    header = ast_cache_header(digest)
+    try:
+        with open(ast_cache_path(path), 'rb') as f:
+            if (f.read(len(header)) != header):
+                return None
+            return load_ast(f.read())
+    except Exception:
+        return None
+
+def write_ast_cache(path: str, digest: str, ast: CLAST, arena: CLArena):
+    """Write the .cl-astc of the .cl-ast at `path`, whose sha256 is `digest`.
+    The file is replaced atomically; if it can't be written, the next run parses again"""
+    payload = dump_ast(ast, arena)
+    cache_path = ast_cache_path(path)
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(ast_cache_header(digest))
+            f.write(payload)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        if (os.path.exists(tmp_path)):
+            os.remove(tmp_path)
+
+def read_prog_cached(path: str, arena: bool = False) -> CLAST:
+    """Read the program in the .cl-ast at `path` from its .cl-astc, next to it, instead
+    of parsing it. If the .cl-astc is missing or stale, the input is parsed into an
+    arena and the .cl-astc is (re)written; a program that doesn't parse (see `read_prog`)
+    is never cached
+
+    :param path: path of the .cl-ast file
+    :type path: str
+    :param arena: return features holding `CLArenaExpr` handles, as `read_prog` does with
+        a `CLArena`; else they hold plain `CLExpr`s
+    :type arena: bool
+    :rtype: CLAST
+    """
+    digest = input_digest(path)
+    loaded = read_ast_cache(path, digest)
+    if (loaded is None):
+        p = COOLStreamParser(stream_tokens(path))
+        p.reset_parser()
+        cl_arena = CLArena()
+        ast = read_prog(p, cl_arena)
+        write_ast_cache(path, digest, ast, cl_arena)
+    else:
+        ast, cl_arena = loaded
+    if (not arena):
+        materialize_prog(ast, cl_arena)
+    return ast
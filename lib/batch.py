@@ -0,0 +1,347 @@
+import io
+import os
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import IO
+
+from .parser import *
+from .arena import CLArena
+from .util import *
+from .emitter import CLEmitter
+from .type_checking_rules import *
+from .cache import CLCheckCache, type_check_cached
+from .astcache import read_prog_cached
+from .binary import CLBinaryEmitter, bytes_tokens, stream_tokens
+from .stats import CLStats, phase
+
+# Number of files each worker may have queued in a batch, on top of the one it is checking
+BATCH_QUEUE_DEPTH = 2
+
+def cl_type_path(path: str, binary: bool = False) -> str:
+    """Return the path of the .cl-type (or binary .cl-typeb) written for the .cl-ast at `path`, next to it"""
+    return os.path.splitext(path)[0] + ('.cl-typeb' if (binary) else '.cl-type')
+
+def check_file(path: str,
+               arena: bool = False,
+               workers: int = 1,
+               cache: str | None = None,
+               ast_cache: bool = False,
+               binary: bool = False,
+               all_errors: bool = False,
+               stats: CLStats | None = None):
+    """Type check the .cl-ast at `path`, in the text or binary format, and write its
+    .cl-type next to it. Raises a `CLCheckError` on the first type error, in which case
+    nothing is written
+
+    :param path: path of the .cl-ast file
+    :type path: str
+    :param arena: store expressions in a `CLArena` instead of one object per node
+    :type arena: bool
+    :param workers: number of processes checking the classes, see `tc_classes_parallel`;
+        more than one raises a ValueError where they can't be forked, see `tc_check_workers`
+    :type workers: int
+    :param cache: directory of a `CLCheckCache`; only classes not found in it are checked
+    :type cache: str | None
+    :param ast_cache: load the program from its .cl-astc instead of parsing it, see `read_prog_cached`
+    :type ast_cache: bool
+    :param binary: write the binary .cl-typeb instead, see `CLBinaryEmitter`
+    :type binary: bool
+    :param all_errors: check the whole program, then raise a `CLCheckErrors` with every
+        type error found, instead of stopping at the first
+    :type all_errors: bool
+    :param stats: where the time and memory of each phase and the counts of the program
+        are recorded, see `CLStats`
+    :type stats: CLStats | None
+    """
+    with phase(stats, 'read_prog'):
+        if (ast_cache):
+            ast = read_prog_cached(path, arena)
+        else:
+            # Stream the lines from the file and give them to a parser object
+            p = COOLStreamParser(stream_tokens(path))
+            p.reset_parser()
+
+            ast = read_prog(p, CLArena() if (arena) else None)
+    ctx = check_prog(ast, workers, cache, all_errors, stats)
+    with open(cl_type_path(path, binary), 'wb' if (binary) else 'w') as out_file:
+        write_cl_type(out_file, ctx, binary, stats)
+    return
+
+def check_prog(ast: CLAST,
+               workers: int = 1,
+               cache: str | None = None,
+               all_errors: bool = False,
+               stats: CLStats | None = None) -> CLCheckContext:
+    """Type check a program read by `read_prog`, annotating its expressions with their
+    static types. Raises a `CLCheckError` on the first type error, or with `all_errors`
+    a `CLCheckErrors` once the whole program is checked; see `check_file` for the
+    parameters. Only the context made here is changed, so programs can be checked at
+    the same time on several threads
+
+    :return: the context the program was checked in
+    :rtype: CLCheckContext
+    """
+    if (stats is not None):
+        stats.counts.update(count_program(ast))
+    ctx = init_context(ast, all_errors, stats)
+    if (stats is not None):
+        stats.counts['classes'] = len(ctx.classes)
+        stats.counts['max_hierarchy_depth'] = max(ctx.classes.hierarchy.depth.values())
+    # This should annotate ast_ext nodes' s_type field with the static types calculated
+    with phase(stats, 'type_check'):
+        if (cache is None):
+            type_check(ctx.classes, ctx.me, ctx.oe, workers, ctx.errors)
+        else:
+            check_cache = CLCheckCache(cache)
+            try:
+                _, ctx.fragments = type_check_cached(ctx.classes, ctx.me, ctx.oe, check_cache, workers, ctx.errors)
+            finally:
+                check_cache.close()
+    if (ctx.errors):
+        raise CLCheckErrors(ctx.errors)
+    return ctx
+
+def write_cl_type(out_file: IO, ctx: CLCheckContext, binary: bool = False, stats: CLStats | None = None):
+    """Write the cl-type of a program checked by `check_prog` to `out_file`, in the
+    binary format if `binary` (`out_file` must then take bytes). Each map is a phase
+    of `stats`, if given; the lines still buffered are written in the phase 'flush'"""
+    # Lines are buffered by the emitter and written to the file in large chunks
+    em = CLBinaryEmitter(out_file) if (binary) else CLEmitter(out_file)
+    # The text of cached expressions is spliced in instead of rendered
+    for e, text in ctx.fragments:
+        em.add_fragment(e, text)
+    with phase(stats, 'emit_class_map'):
+        emit_class_map(em, ctx.classes)
+    with phase(stats, 'emit_implementation_map'):
+        emit_implementation_map(em, ctx.classes)
+    with phase(stats, 'emit_parent_map'):
+        emit_parent_map(em, ctx.classes)
+    with phase(stats, 'emit_annot_ast'):
+        emit_annot_ast(em, ctx.ast)
+    with phase(stats, 'flush'):
+        em.flush()
+
+class CLCheckResult:
+    """What `check` finds for one program. Only `error` and `errors` are set if the
+    program doesn't type check; the expressions checked before the error keep their
+    static types (all of them do with `all_errors`, the ones in error having the
+    error type)
+
+    Attributes:
+        error (CLCheckError | None): the first type error; None iff the program type checks
+        errors (list[CLCheckError]): every type error found: only the first, unless
+            checked with `all_errors`
+        ast (CLAST | None): the program, each expression annotated with its static type
+            (`s_type`); None if it couldn't be read
+        classes (CLClassTable | None): the class table, basic classes included
+        class_map (list | None): the class map, see `gen_class_map_a`
+        implementation_map (list | None): the implementation map, see `gen_implementation_map`
+        parent_map (list[tuple[str, str]] | None): the parent map, see `gen_parent_map`
+        context (CLCheckContext | None): the context the program was checked in, see `check_prog`
+    """
+    error: CLCheckError | None
+    errors: list[CLCheckError]
+    ast: CLAST | None
+    classes: CLClassTable | None
+    class_map: list[tuple[str, list[tuple[str, str, CLConstant | CLExpr]]]] | None
+    implementation_map: list[tuple[str, list[tuple[CLFeature, CLClass]]]] | None
+    parent_map: list[tuple[str, str]] | None
+    context: CLCheckContext | None
+
+    def __init__(self):
+        self.error = None
+        self.errors = []
+        self.ast = None
+        self.classes = None
+        self.class_map = None
+        self.implementation_map = None
+        self.parent_map = None
+        self.context = None
+
+    @property
+    def ok(self) -> bool:
+        """Whether the program type checks"""
+        return self.error is None
+
+    def write(self, out_file: IO, binary: bool = False):
+        """Write the cl-type of the program to `out_file`, see `write_cl_type`.
+        Raises a ValueError if the program doesn't type check (see `ok`), as it has none"""
+        if (not self.ok):
+            raise ValueError('program does not type check')
+        write_cl_type(out_file, self.context, binary)
+
+    def cl_type(self, binary: bool = False) -> bytes:
+        """Return the cl-type of the program, as `main.py` writes it. Raises a ValueError
+        if the program doesn't type check, see `write`"""
+        out_file = io.BytesIO()
+        self.write(out_file, binary)
+        return out_file.getvalue()
+
+def check(data: bytes,
+          arena: bool = False,
+          workers: int = 1,
+          cache: str | None = None,
+          all_errors: bool = False,
+          stats: CLStats | None = None) -> CLCheckResult:
+    """Type check a .cl-ast held in memory, in the text or binary format. The library
+    counterpart of `check_file`: nothing is printed or written, and a type error is
+    returned in the result instead of raised, so it can be called any number of times
+    in one process, and on several threads at once, each with one worker (more than one
+    raises a ValueError while other threads run, see `tc_check_workers`). An input that
+    isn't a .cl-ast at all still raises
+
+    :param data: the bytes of the .cl-ast
+    :type data: bytes
+    :return: the annotated program, its maps, or its type error
+    :rtype: CLCheckResult
+    """
+    result = CLCheckResult()
+    try:
+        with phase(stats, 'read_prog'):
+            p = COOLStreamParser(bytes_tokens(data))
+            p.reset_parser()
+            result.ast = read_prog(p, CLArena() if (arena) else None)
+        result.context = check_prog(result.ast, workers, cache, all_errors, stats)
+        result.classes = result.context.classes
+    except CLCheckErrors as e:
+        result.errors = e.errors
+        result.error = e.errors[0]
+        return result
+    except CLCheckError as e:
+        result.errors = [e]
+        result.error = e
+        return result
+    result.class_map = gen_class_map_a(result.classes)
+    result.implementation_map = gen_implementation_map(result.classes)
+    result.parent_map = gen_parent_map(result.classes)
+    return result
+
+def batch_check_file(path: str,
+                     arena: bool = False,
+                     cache: str | None = None,
+                     ast_cache: bool = False,
+                     binary: bool = False,
+                     all_errors: bool = False) -> tuple[str, str, str]:
+    """Run `check_file` in a batch worker, turning its errors into a status
+
+    :return: (path X status X message), where status is 'ok', 'error' (a type error,
+        the message is what `main.py` prints for it, one line per error with `all_errors`)
+        or 'crash' (any other exception)
+    :rtype: tuple(str, str, str)
+    """
+    try:
+        check_file(path, arena, cache=cache, ast_cache=ast_cache, binary=binary, all_errors=all_errors)
+    except CLCheckError as e:
+        return (path, 'error', e.text)
+    except Exception as e:
+        return (path, 'crash', f'{type(e).__name__}: {e}')
+    return (path, 'ok', '')
+
+def batch_inputs(args: Iterable[str]) -> list[str]:
+    """Expand the inputs of a batch: a file is checked as is, a directory stands for
+    the .cl-ast and .cl-astb files in it and `@manifest` for the paths listed in a manifest file,
+    one per line (blank lines and lines starting with `#` are skipped)
+
+    :param args: files, directories and `@manifest`s
+    :type args: Iterable[str]
+    :return: the files to check, largest first
+    :rtype: list[str]
+    """
+    paths: list[str] = []
+    for arg in args:
+        if (arg.startswith('@')):
+            with open(arg[1:]) as manifest:
+                for line in manifest:
+                    line = line.strip()
+                    if (line and (not line.startswith('#'))):
+                        paths.append(line)
+        elif (os.path.isdir(arg)):
+            paths += [os.path.join(arg, f) for f in sorted(os.listdir(arg)) if f.endswith(('.cl-ast', '.cl-astb'))]
+        else:
+            paths.append(arg)
+    # Largest first, so a big file isn't left running alone at the end of the batch
+    return sorted(paths, key=lambda f: os.path.getsize(f) if os.path.exists(f) else 0, reverse=True)
+
+def batch_check(paths: list[str],
+                workers: int | None = None,
+                arena: bool = False,
+                cache: str | None = None,
+                ast_cache: bool = False,
+                binary: bool = False,
+                all_errors: bool = False) -> Iterator[tuple[str, str, str]]:
+    """Type check many files on a pool of worker processes, submitted in the order given.
+    At most `BATCH_QUEUE_DEPTH` + 1 files per worker are in flight at any time
+
+    :param paths: files to check, see `batch_inputs`
+    :type paths: list[str]
+    :param workers: number of worker processes; all the CPUs when None
+    :type workers: int | None
+    :param arena: store expressions in a `CLArena`, see `check_file`
+    :type arena: bool
+    :param cache: directory of a `CLCheckCache` shared by the workers, see `check_file`
+    :type cache: str | None
+    :param ast_cache: load each program from its .cl-astc, see `check_file`
+    :type ast_cache: bool
+    :param binary: write binary .cl-typeb files, see `check_file`
+    :type binary: bool
+    :param all_errors: report every type error of each file, see `check_file`
+    :type all_errors: bool
+    :return: the result of `batch_check_file` for each file, as each one completes
+    :rtype: Iterator[tuple(str, str, str)]
+    """
+    workers = workers or os.cpu_count() or 1
+    pending = iter(paths)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight: set[Future] = set()
+        for path in pending:
+            in_flight.add(pool.submit(batch_check_file, path, arena, cache, ast_cache, binary, all_errors))
+            if (len(in_flight) >= workers * (BATCH_QUEUE_DEPTH + 1)):
+                break
+        while (in_flight):
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                yield fut.result()
+                path = next(pending, None)
+                if (path is not None):
+                    in_flight.add(pool.submit(batch_check_file, path, arena, cache, ast_cache, binary, all_errors))
+
+def batch_main(args: list[str]) -> int:
+    """Entry point of `main.py --batch [-j N] [--arena] [--cache DIR] [--ast-cache] [--binary] [--all-errors] inputs...`:
+    checks every input, printing one status line per file as it completes (one per
+    type error with `--all-errors`) and a summary
+
+    :param args: command line arguments after `--batch`
+    :type args: list[str]
+    :return: exit status; 1 iff a file crashed the checker
+    :rtype: int
+    """
+    workers = None
+    arena = False
+    cache = None
+    ast_cache = False
+    binary = False
+    all_errors = False
+    inputs: list[str] = []
+    args = iter(args)
+    for arg in args:
+        if (arg in {'-j', '--jobs'}):
+            workers = int(next(args))
+        elif (arg == '--arena'):
+            arena = True
+        elif (arg == '--cache'):
+            cache = next(args)
+        elif (arg == '--ast-cache'):
+            ast_cache = True
+        elif (arg == '--binary'):
+            binary = True
+        elif (arg == '--all-errors'):
+            all_errors = True
+        else:
+            inputs.append(arg)
+
+    counts = {'ok': 0, 'error': 0, 'crash': 0}
+    for path, status, msg in batch_check(batch_inputs(inputs), workers, arena, cache, ast_cache, binary, all_errors):
+        counts[status] += 1
+        print('\n'.join(f'{status}: {path}' + (f': {m}' if m else '') for m in msg.split('\n')), flush=True)
+    print(f"{counts['ok']} ok, {counts['error']} type errors, {counts['crash']} crashed")
+    return 1 if counts['crash'] else 0
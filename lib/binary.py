@@ -0,0 +1,291 @@
+import io
+import re
+import sys
+import zlib
+from array import array
+from collections.abc import Iterable, Iterator
+from itertools import islice
+from typing import IO
+
+from .parser import stream_lines
+from .emitter import CLEmitter, EMIT_BUFFER_LINES, EMIT_SPLICE_DIRECT
+
+# First bytes of a binary .cl-ast/.cl-type: 'CLB' and the version of the format
+CLBIN_MAGIC = b'CLB\x01'
+# Values every binary file starts its table with, so the node tags of the cl-ast and
+# cl-type formats (the cases of `read_expr`, and the kinds of features, let bindings
+# and map entries) are never spelled out
+CLBIN_TAGS = ('assign', 'dynamic_dispatch', 'static_dispatch', 'self_dispatch',
+              'if', 'while', 'block', 'new', 'isvoid',
+              'plus', 'minus', 'times', 'divide', 'lt', 'le', 'eq', 'not', 'negate',
+              'integer', 'string', 'identifier', 'true', 'false', 'let', 'case', 'internal',
+              'let_binding_no_init', 'let_binding_init',
+              'attribute_no_init', 'attribute_init', 'method', 'inherits', 'no_inherits',
+              'class_map', 'implementation_map', 'parent_map', 'no_initializer', 'initializer',
+              'Object', 'IO', 'Int', 'String', 'Bool', 'SELF_TYPE', 'self')
+# Longest line stored as an int; longer decimals are stored as strings, so every int
+# fits the widest of `CLBIN_WIDTHS`
+CLBIN_INT_DIGITS = 9
+# Lines stored as ints, see `is_int_token`
+CLBIN_INT_LINE = re.compile(f'0|[1-9][0-9]{{0,{CLBIN_INT_DIGITS - 1}}}')
+# Typecodes of the arrays of a chunk, narrowest first
+CLBIN_WIDTHS = ('B', 'H', 'I')
+# zlib level of the chunks of a binary file
+CLBIN_COMPRESSION = 1
+
+def varint(n: int) -> bytes:
+    """Encode a non-negative int in LEB128: 7 bits per byte, least significant first,
+    the high bit set on every byte but the last"""
+    out = bytearray()
+    while (n >= 0x80):
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+def read_varint(data: bytes, i: int) -> tuple[int, int]:
+    """Decode the varint at offset `i` of `data`: (its value X the offset after it)"""
+    n = 0
+    shift = 0
+    while (True):
+        b = data[i]
+        i += 1
+        n |= (b & 0x7f) << shift
+        if (b < 0x80):
+            return (n, i)
+        shift += 7
+
+def read_chunk_size(f: IO) -> int | None:
+    """Read the varint length of the next chunk of a binary file; None at the end of the file"""
+    n = 0
+    shift = 0
+    for b in iter(lambda: f.read(1), b''):
+        n |= (b[0] & 0x7f) << shift
+        if (b[0] < 0x80):
+            return n
+        shift += 7
+    if (shift):
+        raise ValueError('truncated chunk length')
+    return None
+
+def pack_ints(ints: Iterable[int], top: int | None = None) -> bytes:
+    """Encode ints < 2**32 as the narrowest array that holds them, little-endian,
+    preceded by its typecode. `top`, if given, is a bound on the ints"""
+    if (top is None):
+        ints = list(ints)
+        top = max(ints, default=0)
+    width = next(w for w in CLBIN_WIDTHS if (top < 1 << (8 * array(w).itemsize)))
+    if (isinstance(ints, array) and (ints.itemsize >= array(width).itemsize)):
+        # Already in an array at least as wide: kept as is, converting would cost more
+        # than compressing its zero bytes
+        width = ints.typecode
+    packed = ints if (isinstance(ints, array) and (ints.typecode == width)) else array(width, ints)
+    if (sys.byteorder == 'big'):
+        packed.byteswap()
+    return width.encode() + packed.tobytes()
+
+def unpack_ints(data: bytes, i: int, n: int | None = None) -> tuple[array, int]:
+    """Decode `n` ints (all the rest of `data` if None) encoded by `pack_ints` at
+    offset `i` of `data`: (the ints X the offset after them)"""
+    ints = array(chr(data[i]))
+    end = len(data) if (n is None) else i + 1 + n * ints.itemsize
+    ints.frombytes(data[i + 1:end])
+    if (sys.byteorder == 'big'):
+        ints.byteswap()
+    return (ints, end)
+
+def is_int_token(s: str) -> bool:
+    """Whether the line `s` is stored as an int: a decimal without sign or leading
+    zeros, which `str` gives back exactly, of at most `CLBIN_INT_DIGITS` digits"""
+    return CLBIN_INT_LINE.fullmatch(s) is not None
+
+def is_binary(path: str) -> bool:
+    """Whether the file at `path` is in the binary format"""
+    with open(path, 'rb') as f:
+        return f.read(len(CLBIN_MAGIC)) == CLBIN_MAGIC
+
+class CLBinaryEmitter(CLEmitter):
+    """`CLEmitter` writing the binary format, a drop-in for the emitters of
+    `type_checking_rules` and for `text_to_binary`.
+
+    Every distinct line is a value in a table: an int if `is_int_token`, else a
+    string. The table starts with `CLBIN_TAGS`, and each line is written as its
+    index in the table. The file is `CLBIN_MAGIC`, then chunks, one per flush: the
+    byte length of the chunk as a varint, then the chunk compressed with zlib:
+        - the number of values the chunk adds to the table, as a varint, then the
+          kind of each one, a byte: 0 for an int, 1 for a string
+        - the ints among them (see `pack_ints`)
+        - the byte length of the strings among them, as a varint, then the
+          strings in utf-8, separated by newlines (a line has none)
+        - the index of each line of the chunk (see `pack_ints`)
+    Numbers are stored in fixed-width arrays rather than one varint each, so that
+    they are decoded by `array` instead of a Python loop; compression takes care
+    of their zero bytes. The encoding of a line only depends on its text, so the
+    file converts back to exactly the text a `CLEmitter` writes.
+
+    Fragments are encoded once, when they are added, and kept as arrays of indices.
+    A spliced fragment is only marked at its position in `parts`
+
+    Attributes:
+        index (dict): index in the table of each value, and of each line emitted so
+            far (int, str or other object)
+        size: number of values in the table
+        new (list[int | str]): values added to the table since the last chunk was written
+        marks (list[tuple[int, array]]): (position in `parts` X indices) of each
+            fragment spliced since the last flush
+    """
+    __slots__ = ('index', 'size', 'new', 'marks')
+
+    def __init__(self, sink: IO, limit: int = EMIT_BUFFER_LINES):
+        super().__init__(sink, limit)
+        if (not self.binary):
+            raise ValueError('CLBinaryEmitter needs a binary sink')
+        self.index = {s: i for i, s in enumerate(CLBIN_TAGS)}
+        self.size = len(CLBIN_TAGS)
+        self.new = []
+        self.marks = []
+        sink.write(CLBIN_MAGIC)
+
+    def define(self, lines: list):
+        """Give an index to each of `lines` not seen before, adding the values not in the table yet"""
+        index = self.index
+        int_line = CLBIN_INT_LINE.fullmatch
+        for x in [x for x in dict.fromkeys(lines) if (x not in index)]:
+            s = x if isinstance(x, str) else str(x)
+            # `is_int_token`, inlined
+            v = int(s) if (int_line(s)) else s
+            idx = index.get(v)
+            if (idx is None):
+                idx = self.size
+                self.size += 1
+                index[v] = idx
+                self.new.append(v)
+            index[x] = idx
+
+    def splice(self, x) -> bool:
+        entry = self.fragments.get(id(x))
+        if (entry is None):
+            return False
+        self.marks.append((len(self.parts), entry[1]))
+        self.spliced += len(entry[1])
+        if (len(self.parts) + self.spliced >= self.limit):
+            self.flush()
+        return True
+
+    def add_fragment(self, x, text: str):
+        # Split a slice of the text at a time, so a long fragment is never held as one line per object
+        ids = array('I')
+        start = 0
+        while (start < len(text)):
+            end = text.find('\n', start + EMIT_SPLICE_DIRECT)
+            end = len(text) - 1 if (end < 0) else end
+            lines = text[start:end].split('\n')
+            self.define(lines)
+            ids.extend(map(self.index.__getitem__, lines))
+            start = end + 1
+        self.fragments[id(x)] = (x, ids)
+
+    def flush(self):
+        parts = self.parts
+        if ((not parts) and (not self.marks)):
+            return
+        self.define(parts)
+        get = self.index.__getitem__
+        ids = array('I')
+        prev = 0
+        for pos, frag in self.marks:
+            ids.extend(map(get, parts[prev:pos]))
+            ids += frag
+            prev = pos
+        ids.extend(map(get, parts[prev:]))
+        parts.clear()
+        self.marks.clear()
+        self.spliced = 0
+
+        new = self.new
+        self.new = []
+        kinds = bytes(isinstance(v, str) for v in new)
+        strs = '\n'.join([v for v in new if isinstance(v, str)]).encode(self.encoding)
+        data = b''.join((varint(len(new)), kinds,
+                         pack_ints([v for v in new if isinstance(v, int)]),
+                         varint(len(strs)), strs,
+                         pack_ints(ids, self.size)))
+        data = zlib.compress(data, CLBIN_COMPRESSION)
+        self.sink.write(varint(len(data)) + data)
+
+def decode_chunk(data: bytes, table: list[int | str]) -> list[int | str]:
+    """Decode the lines of one chunk, adding the values it defines to `table`"""
+    data = zlib.decompress(data)
+    n_new, i = read_varint(data, 0)
+    kinds = data[i:i + n_new]
+    n_strs = kinds.count(1)
+    ints, i = unpack_ints(data, i + n_new, n_new - n_strs)
+    size, i = read_varint(data, i)
+    strs = map(sys.intern, data[i:i + size].decode().split('\n')) if (n_strs) else iter(())
+    # Each kind picks the next int or the next string, in order
+    table += map(next, map((iter(ints), strs).__getitem__, kinds))
+    ids, _ = unpack_ints(data, i + size)
+    return list(map(table.__getitem__, ids))
+
+def binary_tokens(path: str) -> Iterator[int | str]:
+    """Lazily yield the lines of a binary file, one chunk at a time: an int for each
+    int line and a str for every other line. `int` and `str` of a line give what they
+    would give on the line of the text file"""
+    with open(path, 'rb') as f:
+        yield from read_binary_tokens(f)
+
+def read_binary_tokens(f: IO) -> Iterator[int | str]:
+    """Lazily yield the lines of the binary file-like object `f`, see `binary_tokens`"""
+    if (f.read(len(CLBIN_MAGIC)) != CLBIN_MAGIC):
+        raise ValueError(f'{getattr(f, "name", "input")} is not a binary cl-ast/cl-type')
+    table: list[int | str] = list(CLBIN_TAGS)
+    size = read_chunk_size(f)
+    while (size is not None):
+        data = f.read(size)
+        if (len(data) != size):
+            raise ValueError('truncated chunk')
+        yield from decode_chunk(data, table)
+        size = read_chunk_size(f)
+
+def stream_tokens(path: str) -> Iterator[int | str]:
+    """The lines of a .cl-ast in either format, for a `COOLStreamParser`:
+    `binary_tokens` or `stream_lines`"""
+    return binary_tokens(path) if is_binary(path) else stream_lines(path)
+
+def bytes_tokens(data: bytes) -> Iterator[int | str]:
+    """The lines of a .cl-ast in either format held in memory, like `stream_tokens`"""
+    if (data.startswith(CLBIN_MAGIC)):
+        return read_binary_tokens(io.BytesIO(data))
+    lines = data.decode().split('\n')
+    # Like `stream_lines`, no line after the last newline
+    if (not lines[-1]):
+        lines.pop()
+    return (l.strip() for l in lines)
+
+def write_tokens(em: CLEmitter, tokens: Iterable):
+    """Emit every line of `tokens`, a batch of lines at a time"""
+    tokens = iter(tokens)
+    batch = list(islice(tokens, em.limit))
+    while (batch):
+        em.lines(batch)
+        batch = list(islice(tokens, em.limit))
+    em.flush()
+
+def text_to_binary(src: str, dst: str):
+    """Convert a text .cl-ast or .cl-type to the binary format"""
+    with open(dst, 'wb') as out_file:
+        write_tokens(CLBinaryEmitter(out_file), stream_lines(src))
+
+def binary_to_text(src: str, dst: str):
+    """Convert a binary .cl-ast or .cl-type back to the text format"""
+    with open(dst, 'w') as out_file:
+        write_tokens(CLEmitter(out_file), binary_tokens(src))
+
+def convert_main(args: list[str]) -> int:
+    """Entry point of `main.py --convert SRC DST`: converts SRC to the other format"""
+    src, dst = args
+    if (is_binary(src)):
+        binary_to_text(src, dst)
+    else:
+        text_to_binary(src, dst)
+    return 0
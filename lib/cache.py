@@ -0,0 +1,329 @@
+import hashlib
+import marshal
+import os
+import pickle
+import sqlite3
+import time
+
+from .cl_types import *
+from .util import *
+from .type_checking_rules import *
+
+# Version of the entries a `CLCheckCache` stores; it is part of every key, so entries
+# written by another version are never looked up (and are evicted in time)
+CLCACHE_VERSION = 2
+# Default bound on the total size of the files of a `CLCheckCache`
+CLCACHE_MAX_BYTES = 64 << 20
+# Number of keys `CLCheckCache.get_many` looks up per query
+CLCACHE_BATCH_KEYS = 500
+
+class CLCheckCache:
+    """On-disk cache of the type checking results of classes: a SQLite database of
+    entries by class key, in `directory`.
+
+    An entry is a tuple (lined digest X `tc_class` result X static type of each
+    expression of the class, in `class_exprs` order X text of each feature expression
+    of the class, see `feature_exprs`). The key of a class does not depend on line
+    numbers, since they don't change how it type checks; the texts, which do print
+    line numbers, are only reused when the lined digest matches too.
+
+    Entries record when they were last used, and the least recently used ones are
+    evicted once the entries take more than `max_bytes`. Changes are committed by
+    `close`, in one transaction; SQLite's locking lets several processes share a cache
+
+    Attributes:
+        directory: where the database is stored
+        max_bytes: bound on the total size of the entries
+        db: connection to the database
+        used: keys of the entries found by `get`, marked used on `close`
+        hits: number of entries found by `get`
+        misses: number of entries not found by `get`
+    """
+    directory: str
+    max_bytes: int
+    db: sqlite3.Connection
+    used: list[str]
+    hits: int
+    misses: int
+
+    def __init__(self, directory: str, max_bytes: int = CLCACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.used = []
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(directory, 'cl-check-cache.db'), timeout=60)
+        self.db.execute('CREATE TABLE IF NOT EXISTS entries '
+                        '(key TEXT PRIMARY KEY, used INTEGER, size INTEGER, data BLOB)')
+
+    def get(self, key: str) -> tuple | None:
+        """Return the entry of `key`, or None if there is none (or it can't be read)"""
+        row = self.db.execute('SELECT data FROM entries WHERE key = ?', (key,)).fetchone()
+        try:
+            entry = None if (row is None) else pickle.loads(row[0])
+        except Exception:
+            # A corrupt entry is a miss; it is replaced once the class is checked again
+            entry = None
+        if (entry is None):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.used.append(key)
+        return entry
+
+    def get_many(self, keys: list[str]) -> dict[str, tuple]:
+        """Return the entries of the `keys` found, by key, like `get` does for each key
+        but with one query per `CLCACHE_BATCH_KEYS` keys"""
+        found: dict[str, tuple] = dict()
+        for i in range(0, len(keys), CLCACHE_BATCH_KEYS):
+            batch = keys[i:i + CLCACHE_BATCH_KEYS]
+            rows = self.db.execute(f'SELECT key, data FROM entries WHERE key IN ({",".join("?" * len(batch))})',
+                                   batch)
+            for key, data in rows:
+                try:
+                    found[key] = pickle.loads(data)
+                except Exception:
+                    # A corrupt entry is a miss, see `get`
+                    pass
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        self.used += found.keys()
+        return found
+
+    def put(self, key: str, entry: tuple):
+        """Store the entry of `key`, replacing any previous one"""
+        data = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        self.db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)',
+                        (key, time.time_ns(), len(data), data))
+
+    def evict(self):
+        """Remove the least recently used entries until they take at most `max_bytes`"""
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if (total <= self.max_bytes):
+            return
+        old: list[tuple[str]] = []
+        for key, size in self.db.execute('SELECT key, size FROM entries ORDER BY used'):
+            if (total <= self.max_bytes):
+                break
+            old.append((key,))
+            total -= size
+        self.db.executemany('DELETE FROM entries WHERE key = ?', old)
+
+    def close(self):
+        """Mark the entries found as used, evict, and commit all changes"""
+        now = time.time_ns()
+        for i in range(0, len(self.used), CLCACHE_BATCH_KEYS):
+            batch = self.used[i:i + CLCACHE_BATCH_KEYS]
+            self.db.execute(f'UPDATE entries SET used = ? WHERE key IN ({",".join("?" * len(batch))})',
+                            [now, *batch])
+        self.used = []
+        self.evict()
+        self.db.commit()
+        self.db.close()
+
+def feature_exprs(c: CLClass) -> list[CLExpr]:
+    """Return the expression of each feature of a class that has one: initializers and method bodies"""
+    return [f.m_body if (f.f_type == 'method') else f.att_init
+            for f in c.features if (f.f_type != 'attribute_no_init')]
+
+def class_digests(c: CLClass) -> tuple[str, str, set[str], list[CLExpr]]:
+    """Digest the AST of a class, in one pass over its expressions.
+
+    The data of each node (everything but line numbers) and its line numbers are
+    appended to two flat lists, hashed with `marshal`, which is cheap enough for a
+    warm run to cost less than checking. Each node appends its kind first and then
+    a fixed number of fields for that kind, counts of sub-nodes included, so the
+    lists can't be the same for two different classes
+
+    :return: (digest of everything but line numbers X digest of the line numbers
+        X names of the methods the class declares or dispatches to X every expression
+        of the class, in `class_exprs` order)
+    :rtype: tuple(str, str, set(str), list(CLExpr))
+    """
+    free: list = [c.ident.name, c.superclass.name if (c.inherits) else None, len(c.features)]
+    lined: list = [c.ident.line, c.superclass.line if (c.inherits) else None]
+    names: set[str] = set()
+    exprs: list[CLExpr] = []
+    for f in c.features:
+        free += (f.f_type, f.f_ident.name)
+        lined.append(f.f_ident.line)
+        if (f.f_type == 'method'):
+            names.add(f.f_ident.name)
+            free += (len(f.m_formals), f.m_type.name)
+            lined.append(f.m_type.line)
+            for fl in f.m_formals:
+                free += (fl.name.name, fl.type.name)
+                lined += (fl.name.line, fl.type.line)
+            stack = [f.m_body]
+        else:
+            free.append(f.att_type.name)
+            lined.append(f.att_type.line)
+            stack = [f.att_init] if (f.f_type == 'attribute_init') else []
+        # Pre-order walk, as `walk_exprs`
+        while (stack):
+            e = stack.pop()
+            exprs.append(e)
+            kind = e.type
+            body = e.body
+            free.append(kind)
+            lined.append(e.line_num)
+            match(kind):
+                case 'integer'|'string'|'internal':
+                    free.append(body.value)
+                case 'identifier':
+                    free.append(body.name)
+                    lined.append(body.line)
+                case 'new':
+                    free.append(body.type_id.name)
+                    lined.append(body.type_id.line)
+                case 'assign':
+                    free.append(body.var.name)
+                    lined.append(body.var.line)
+                    stack.append(body.rhs)
+                case 'isvoid'|'not'|'negate':
+                    stack.append(body.expr)
+                case 'plus'|'minus'|'times'|'divide'|'lt'|'le'|'eq':
+                    stack += (body.rhs, body.lhs)
+                case 'while':
+                    stack += (body.body, body.pred)
+                case 'if':
+                    stack += (body.false_case, body.true_case, body.pred)
+                case 'block':
+                    free.append(len(body.expr_list))
+                    stack.extend(reversed(body.expr_list))
+                case 'self_dispatch':
+                    names.add(body.method_name.name)
+                    free += (body.method_name.name, len(body.args))
+                    lined.append(body.method_name.line)
+                    stack.extend(reversed(body.args))
+                case 'dynamic_dispatch'|'static_dispatch':
+                    names.add(body.method_name.name)
+                    if (kind == 'static_dispatch'):
+                        free.append(body.type.name)
+                        lined.append(body.type.line)
+                    free += (body.method_name.name, len(body.args))
+                    lined.append(body.method_name.line)
+                    stack.extend(reversed(body.args))
+                    stack.append(body.caller)
+                case 'let':
+                    free.append(len(body.bind_list))
+                    for bd in body.bind_list:
+                        free += (bd.bind_type, bd.v_name.name, bd.v_type.name)
+                        lined += (bd.v_name.line, bd.v_type.line)
+                    stack.append(body.let_body)
+                    stack.extend(bd.v_init for bd in reversed(body.bind_list) if (bd.bind_type == 'let_binding_init'))
+                case 'case':
+                    free.append(len(body.c_list))
+                    for cs in body.c_list:
+                        free += (cs.ident.name, cs.type.name)
+                        lined += (cs.ident.line, cs.type.line)
+                    stack.extend(cs.body for cs in reversed(body.c_list))
+                    stack.append(body.c_expr)
+    return (hashlib.sha256(marshal.dumps(free)).hexdigest(),
+            hashlib.sha256(marshal.dumps(lined)).hexdigest(),
+            names,
+            exprs)
+
+def type_check_cached(cst: dict[str, CLClass],
+                      me: CLEnv,
+                      oe: CLObjectEnv,
+                      cache: CLCheckCache,
+                      workers: int = 1,
+                      errors: list[CLCheckError] | None = None) -> tuple[list[list[CLType]] | None, list[tuple[CLExpr, str]]]:
+    """Type check like `type_check`, only re-checking the classes whose results are not in the cache.
+
+    The key of a class digests its own AST (see `class_digests`) and everything checking
+    it depends on: the inheritance hierarchy of the program, the attributes of its
+    ancestors, and the signatures of every method named like one it declares
+    (overrides) or dispatches to, in any class. Only classes that type check are
+    stored, so the first error reported is the same as without a cache.
+
+    When collecting errors in `errors` (see `type_check`), nothing is stored from a
+    program with errors, and nothing is looked up once an error was found before the
+    classes are checked, since the environments may then be patched up (see
+    `init_context`) in ways the keys don't see.
+
+    :param cache: where the results are looked up and stored
+    :type cache: CLCheckCache
+    :param workers: number of processes re-checking classes, see `tc_classes_parallel`
+    :type workers: int
+    :param errors: where errors are collected, see `report_error`; None to abort on the first
+    :type errors: list[CLCheckError] | None
+    :return: (the `type_check` result X (expression X text) of every feature expression,
+        to be added to the output emitter's fragments)
+    :rtype: tuple(list(list(CLType)) | None, list(tuple(CLExpr, str)))
+    """
+    tc_basic_class_inheritance(cst, errors)
+    tc_main_method(cst, errors)
+    tc_class_self_type(cst, errors)
+
+    # Digests of what classes depend on, made once for all classes
+    def digest(x) -> str:
+        return hashlib.sha256(marshal.dumps(x)).hexdigest()
+    hierarchy = digest(sorted(gen_parent_map(cst)))
+    attrs = {name: digest([(f.f_ident.name, f.att_type.name) for f in c.features if (f.f_type != 'method')])
+             for name, c in cst.items()}
+    sigs: dict[str, list] = dict()
+    for name, c in cst.items():
+        for m in c.features:
+            if (m.f_type == 'method'):
+                sigs.setdefault(m.f_ident.name, []).append(
+                    (name, tuple(fl.type.name for fl in m.m_formals), m.m_type.name))
+    sigs = {name: digest(sig) for name, sig in sigs.items()}
+
+    # Look every class up
+    keys: dict[str, tuple[str, str, list[CLExpr]]] = dict()
+    entries: dict[str, tuple] = dict()
+    for name, c in cst.items():
+        if (isinstance(c, CLFrozen)):
+            # Builtin classes are annotated once for all programs, see `tc_class`
+            continue
+        free, lined, names, exprs = class_digests(c)
+        key = digest((CLCACHE_VERSION, free, hierarchy,
+                      [attrs[a.ident.name] for a in cst.hierarchy.ancestors[name]],
+                      sorted((n, sigs.get(n)) for n in names)))
+        keys[name] = (key, lined, exprs)
+    if (not errors):
+        found = cache.get_many([key for key, _, _ in keys.values()])
+        for name, (key, _, _) in keys.items():
+            if (key in found):
+                entries[name] = found[key]
+
+    # Check the classes not found, in class table order
+    missed = [c for name, c in cst.items() if (name not in entries)]
+    if (workers > 1):
+        missed_types = tc_classes_parallel(cst, me, oe, workers, missed, errors)
+    else:
+        missed_types = []
+        for c in missed:
+            missed_types.append(tc_class(cst, me, oe, c, errors))
+        if (None in missed_types):
+            missed_types = None
+    if ((missed_types is None) or errors):
+        return (None, [])
+    missed_types = iter(missed_types)
+
+    c_types = []
+    fragments: list[tuple[CLExpr, str]] = []
+    for name, c in cst.items():
+        if (isinstance(c, CLFrozen)):
+            c_types.append(next(missed_types))
+            continue
+        key, lined, exprs = keys[name]
+        entry = entries.get(name)
+        if (entry is None):
+            f_types = next(missed_types)
+            texts = [render_expr(e) for e in feature_exprs(c)]
+            cache.put(key, (lined, f_types, [e.s_type for e in exprs], texts))
+        else:
+            e_lined, f_types, annots, texts = entry
+            for e, t in zip(exprs, annots):
+                e.s_type = t
+            if (e_lined != lined):
+                # Same class on other lines: its types still hold, its text doesn't
+                texts = [render_expr(e) for e in feature_exprs(c)]
+                cache.put(key, (lined, f_types, annots, texts))
+        c_types.append(f_types)
+        fragments += zip(feature_exprs(c), texts)
+    return (c_types, fragments)
@@ -1,19 +1,23 @@
 from __future__ import annotations
 
+import sys
+import threading
+import weakref
+
 ##  Identifier classes
-#   Every Identifier type has a line number (str) and name (str)
+#   Every Identifier type has a line number (int) and name (str)
+#   Names are interned: the same identifier read many times shares one string
 class CLClassIdent:
     """
     Attributes:
-        line (str): line number where cool class appears
+        line (int): line number where cool class appears
         name (str): name of cool class
     """
-    line = ''
-    name = ''
+    __slots__ = ('line', 'name')
 
-    def __init__(self, l: str, n: str):
+    def __init__(self, l: int, n: str):
         self.line = l
-        self.name = n
+        self.name = sys.intern(n)
 
     def __str__(self):
         return self.name
@@ -24,15 +28,14 @@ class CLClassIdent:
 class CLSelfIdent:
     """
     Attributes:
-        line (str): line number where `self` appears
+        line (int): line number where `self` appears
         name (str): `self`
     """
-    line = ''
-    name = ''
+    __slots__ = ('line', 'name')
 
-    def __init__(self, l: str, n: str):
+    def __init__(self, l: int, n: str):
         self.line = l
-        self.name = n
+        self.name = sys.intern(n)
     
     def __str__(self):
         return self.name
@@ -41,19 +44,17 @@ class CLSelfIdent:
         return self.name
 
 class CLTypeIdent:
-    """
+    """A type as written in the program; see `CLType` for the static types computed by the type checker
+
     Attributes:
-        line (str): line number where cool TYPE appears
+        line (int): line number where cool TYPE appears
         name (str): name of cool TYPE
-        self_type_resolve (str): type of SELF_TYPE (?); empty if name != 'SELF_TYPE'
     """
-    line = ''
-    name = ''
-    self_type_resolve: str=''      # trying hot fix shit i hate self_type
+    __slots__ = ('line', 'name')
 
-    def __init__(self, l: str, n: str):
+    def __init__(self, l: int, n: str):
         self.line = l
-        self.name = n
+        self.name = sys.intern(n)
     
     def __str__(self):
         return self.name
@@ -61,19 +62,70 @@ class CLTypeIdent:
     def __repr__(self):
         return self.name
 
+class CLType:
+    """Static type computed by the type checker. Immutable and interned: `mkCLType` returns 
+    the one CLType of each type, so types are shared freely and can be compared by identity.
+    The interning table only holds types weakly, so the types of a program are freed with it
+
+    SELF_TYPE is parameterized by its enclosing class: SELF_TYPE_C is `mkCLType('SELF_TYPE', 'C')`. 
+    The SELF_TYPE written in a declaration, before its enclosing class is known, is `mkCLType('SELF_TYPE')`
+
+    Attributes:
+        name (str): name of a cool class, or 'SELF_TYPE'
+        self_type_resolve (str): C for SELF_TYPE_C; empty if name != 'SELF_TYPE' or C is not known
+    """
+    __slots__ = ('name', 'self_type_resolve', '__weakref__')
+
+    def __init__(self, n: str, c: str = ''):
+        object.__setattr__(self, 'name', n)
+        object.__setattr__(self, 'self_type_resolve', c)
+
+    def __setattr__(self, attr, v):
+        raise AttributeError(f'cannot set {attr} of {self!r}: CLType is immutable')
+
+    def __reduce__(self):
+        # Copies and unpickled types are the interned type itself
+        return (mkCLType, (self.name, self.self_type_resolve))
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        if (self.self_type_resolve):
+            return f'{self.name}_{self.self_type_resolve}'
+        return self.name
+
+# Every live CLType, by name and enclosing class. Held weakly: a type leaves the table
+# once nothing uses it, so checking many programs in one process doesn't pile up the
+# types of every class they declared. The builtin types are kept alive by the constants below
+CLTYPES: weakref.WeakValueDictionary[tuple[str, str], CLType] = weakref.WeakValueDictionary()
+# Taken to add a type, so threads making the same type at once get the same CLType
+CLTYPES_LOCK = threading.Lock()
+
+def mkCLType(n: str, c: str = '') -> CLType:
+    """return the interned CLType named `n`; for SELF_TYPE, `c` is the enclosing class"""
+    key = (n, c) if n == 'SELF_TYPE' else (n, '')
+    t = CLTYPES.get(key)
+    if (t is None):
+        with CLTYPES_LOCK:
+            t = CLTYPES.get(key)
+            if (t is None):
+                t = CLType(*key)
+                CLTYPES[key] = t
+    return t
+
 
 class CLVarIdent:
     """
     Attributes:
-        line (str): line number where variable appears
+        line (int): line number where variable appears
         name (str): name of variable
     """
-    line = ''
-    name = ''
+    __slots__ = ('line', 'name')
 
-    def __init__(self, l: str, n: str):
+    def __init__(self, l: int, n: str):
         self.line = l
-        self.name = n
+        self.name = sys.intern(n)
     
     def __str__(self):
         return self.name
@@ -84,15 +136,14 @@ class CLVarIdent:
 class CLMethodIdent:
     """
     Attributes:
-        line (str): line number where method appears
+        line (int): line number where method appears
         name (str): name of method
     """
-    line = ''
-    name = ''
+    __slots__ = ('line', 'name')
 
-    def __init__(self, l: str, n: str):
+    def __init__(self, l: int, n: str):
         self.line = l
-        self.name = n
+        self.name = sys.intern(n)
     
     def __str__(self):
         return self.name
@@ -103,14 +154,13 @@ class CLMethodIdent:
 class CLConstant:
     """
     Attributes:
-        type (CLTypeIdent): Bool | Int | String | SELF_TYPE
+        type (CLType | CLTypeIdent): Bool | Int | String | SELF_TYPE
         value (str | int): any cool constant as a string
 
 
     note: accd to CRM - "The special value void is a member of all types" -> implies void `can` be a constant ..?.. and the type of void is SELF_TYPE..? 
     """
-    type = None
-    value = None
+    __slots__ = ('type', 'value')
 
     def __init__(self, t: CLTypeIdent, v: (str | int)):
         self.type = t
@@ -128,8 +178,7 @@ class CLFormal:
         name (CLVarIdent): name of declared param
         type (CLTypeIdent): type of declared param
     """
-    name = None
-    type = None
+    __slots__ = ('name', 'type')
 
     def __init__(self, n: CLVarIdent, t: CLTypeIdent):
         self.name = n
@@ -149,28 +198,27 @@ class CLFeature:
         att_type (CLTypeIdent | None): CLTypeIdent iff f_type == 'attribute_no_init' | 'attribute_init'; declared type of variable name
         att_init (CLExpr | None): CLExpr iff f_type == 'attribute_init'; expr to evaluate and bind to variable
         m_type (CLTypeIdent | None): CLTypeIdent iff f_type == 'method'; declared return type of method
-        m_formals (list[CLFormal]): method params
+        m_formals (list[CLFormal] | tuple): method params; empty iff f_type != 'method'
         m_body (CLExpr | None): CLExpr iff f_type == 'method'; expr to evaluate on method dispatch
-        s_type (CLTypeIdent): static type evaluated at type-check
+        s_type (CLType): static type evaluated at type-check
     """
-    f_type: str = None
-    f_ident: (CLVarIdent|CLMethodIdent) = None
-    att_type: (CLTypeIdent|None) = None
-    att_init: (CLExpr|None) = None
-    m_type: (CLTypeIdent|None) = None
-    m_formals: list[CLFormal] = []
-    m_body: (CLExpr|None) = None
-    s_type: (CLTypeIdent|None) = None
+    __slots__ = ('f_type', 'f_ident', 'att_type', 'att_init', 'm_type', 'm_formals', 'm_body', 's_type')
 
     def __init__(self, 
                  f: str, 
                  n: (CLVarIdent | CLMethodIdent), 
                  t: CLTypeIdent, 
-                 fls: list[CLFormal] | list = [], 
+                 fls: list[CLFormal] | tuple = (), 
                  init: CLExpr | None = None, 
                  body: CLExpr | None = None):
         self.f_type = f
         self.f_ident = n
+        self.att_type = None
+        self.att_init = None
+        self.m_type = None
+        self.m_formals = ()
+        self.m_body = None
+        self.s_type = None
         match f:
             case 'attribute_no_init':
                 self.att_type = t
@@ -202,10 +250,7 @@ class CLClass:
         superclass (CLClassIdent | None): None iff ident is 'Object'; else some cool class if inherits is True
         features (list[CLFeature]): list of cool class features
     """
-    ident: CLClassIdent = None
-    inherits: bool = False
-    superclass: CLClassIdent = None
-    features: list[CLFeature] = []
+    __slots__ = ('ident', 'inherits', 'superclass', 'features')
 
     def __init__(self, 
                  id: CLClassIdent, 
@@ -229,7 +274,7 @@ class CLAST:
     Attributes:
         classes (list[CLClass]): list of declared classes in cool program
     """
-    classes: list[CLClass] = []
+    __slots__ = ('classes',)
 
     def __init__(self, l: list[CLClass]):
         self.classes = l
@@ -244,21 +289,18 @@ class CLExpr:
     """Expr node of AST
     
     Attributes:
-        line_num (str)  : line number where expr appears in prog
+        line_num (int)  : line number where expr appears in prog
         type (str)      : "type" of expression. Possible values: [assign | dynamic_dispatch | static_dispatch | self_dispatch | if | while | block | new | isvoid | plus | minus | times | divide | lt | le | eq | not | negate | integer | string | identifier | true | false | let | case] 
         body (CLAssign | CLDynDispatch | CLStaticDispatch | CLSelfDispatch | CLIf | CLWhile | CLBlock | CLNew | CLIsvoid | CLPlus | CLMinus | CLTimes | CLDivide | CLLT | CLLE | CLEQ | CLNOT | CLNegate | CLConstant | CLSelfIdent | CLVarIdent | CLLet | CLCase): node pointer to expr body
-        s_type (CLTypeIdent): static type evaluated at type-check
+        s_type (CLType): static type evaluated at type-check
     """
-    line_num = ''
-    type = ''
-    body: (CLAssign | CLDynDispatch | CLStaticDispatch | CLSelfDispatch | CLIf | CLWhile | CLBlock | CLNew | CLIsvoid | CLPlus | CLMinus | CLTimes | CLDivide | CLLT | CLLE | CLEQ | CLNOT | CLNegate | CLConstant | CLSelfIdent | CLVarIdent | CLLet | CLCase | None)
-    body = None
-    s_type: (CLTypeIdent|None) = None
+    __slots__ = ('line_num', 'type', 'body', 's_type')
 
-    def __init__(self, l: str, t: str, term: CLAssign | CLDynDispatch | CLStaticDispatch | CLSelfDispatch | CLIf | CLWhile | CLBlock | CLNew | CLIsvoid | CLPlus | CLMinus | CLTimes | CLDivide | CLLT | CLLE | CLEQ | CLNOT | CLNegate | CLConstant | CLSelfIdent | CLVarIdent | CLLet | CLCase):
+    def __init__(self, l: int, t: str, term: CLAssign | CLDynDispatch | CLStaticDispatch | CLSelfDispatch | CLIf | CLWhile | CLBlock | CLNew | CLIsvoid | CLPlus | CLMinus | CLTimes | CLDivide | CLLT | CLLE | CLEQ | CLNOT | CLNegate | CLConstant | CLSelfIdent | CLVarIdent | CLLet | CLCase):
         self.line_num = l
-        self.type = t
+        self.type = sys.intern(t)
         self.body = term
+        self.s_type = None
     
     def __str__(self):
         return f'expr,{self.type},{self.body.__str__()}'
@@ -271,15 +313,14 @@ class CLAssign:
     Attributes:
         var (CLVarIdent)    : node pointing to variable being assigned to
         rhs (CLExpr)        : node pointing to expr to assign variable to
-        s_type (CLTypeIdent): static type evaluated at type-check
+        s_type (CLType): static type evaluated at type-check
     """
-    var = None
-    rhs = None
-    s_type: (CLTypeIdent|None) = None
+    __slots__ = ('var', 'rhs', 's_type')
 
     def __init__(self, v: CLVarIdent, r: CLExpr):
         self.var = v
         self.rhs = r
+        self.s_type = None
     
     def __str__(self):
         return f'{self.var.__str__()},<-,{self.rhs.__str__()}'
@@ -294,17 +335,15 @@ class CLDynDispatch:
         caller (CLExpr): pointer to CLExpr object that evaluates to a cool object
         method_name (CLMethodIdent): name of method being dispatched on cool object
         args (list[CLExpr]): list of CLExpr objects that evalute to method arguments
-        s_type (CLTypeIdent): static type evaluated at type-check
+        s_type (CLType): static type evaluated at type-check
     """
-    caller = None
-    method_name = None
-    args = []
-    s_type: (CLTypeIdent|None) = None
+    __slots__ = ('caller', 'method_name', 'args', 's_type')
 
     def __init__(self, c: CLExpr, n: CLMethodIdent, a: list[CLExpr]):
         self.caller = c
         self.method_name = n
         self.args = a
+        self.s_type = None
     
     def __str__(self):
         return f'{self.caller.__str__()},.,{self.method_name.__str__()},{list(map(lambda a: f"{a.__str__()},", self.args))}'
@@ -319,19 +358,16 @@ class CLStaticDispatch:
         type (CLTypeIdent): name of class to dispatch method_name from
         method_name (CLMethodIdent): name of method being dispatched on cool object
         args (list[CLExpr]): list of CLExpr objects that evalute to method arguments
-        s_type (CLTypeIdent): static type evaluated at type-check
+        s_type (CLType): static type evaluated at type-check
     """
-    caller = None
-    type = None
-    method_name = None
-    args = []
-    s_type: (CLTypeIdent|None) = None
+    __slots__ = ('caller', 'type', 'method_name', 'args', 's_type')
 
     def __init__(self, c: CLExpr, t: CLTypeIdent, n: CLMethodIdent, a: list[CLExpr]):
         self.caller = c
         self.type = t
         self.method_name = n
         self.args = a
+        self.s_type = None
 
     def __str__(self):
         return f'{self.caller.__str__()},@,{self.type.__str__()},.,{self.method_name.__str__()},(,{list(map(lambda a: f"{a.__str__()},", self.args))})'
@@ -344,15 +380,14 @@ class CLSelfDispatch:
     Attributes:
         method_name (CLMethodIdent): name of method being dispatched on self (ie enclosing class)
         args (list[CLExpr]): list of CLExpr objects that evalute to method arguments
-        s_type (CLTypeIdent): static type evaluated at type-check
+        s_type (CLType): static type evaluated at type-check
     """
-    method_name = None
-    args = []
-    s_type: (CLTypeIdent|None) = None
+    __slots__ = ('method_name', 'args', 's_type')
 
     def __init__(self, n: CLMethodIdent, a: list[CLExpr]):
         self.method_name = n
         self.args = a
+        self.s_type = None
 
     def __str__(self):
         return f'{self.method_name.__str__()},(,{list(map(lambda a : f"{a.__str__()},", self.args))})'
@@ -366,17 +401,15 @@ class CLIf:
         pred (CLExpr): CLExpr object that evaluates to some bool to check
         true_case (CLExpr): CLExpr object to evaluate if pred is true
         false_case (CLExpr): CLExpr object to evaluate if pred is false
-        s_type (CLTypeIdent): static type evaluated at type-check
+        s_type (CLType): static type evaluated at type-check
     """
-    pred = None
-    true_case = None
-    false_case = None
-    s_type: (CLTypeIdent|None) = None
+    __slots__ = ('pred', 'true_case', 'false_case', 's_type')
 
     def __init__(self, p: CLExpr, t: CLExpr, f: CLExpr):
         self.pred = p
         self.true_case = t
         self.false_case = f
+        self.s_type = None
     
     def __str__(self):
         return f'if,{self.pred.__str__()},then,{self.true_case.__str__()},else,{self.false_case.__str__()}'
@@ -389,15 +422,14 @@ class CLWhile:
     Attributes:
         pred (CLExpr): CLExpr object that evaluates to some bool to check
         body (CLExpr): CLExpr object to evaluate if pred is true
-        s_type (CLTypeIdent): static type evaluated at type-check
+        s_type (CLType): static type evaluated at type-check
     """
-    pred = None
-    body = None
-    s_type: (CLTypeIdent|None) = None
+    __slots__ = ('pred', 'body', 's_type')
 
     def __init__(self, p: CLExpr, b: CLExpr):
         self.pred = p
         self.body = b
+        self.s_type = None
 
     def __str__(self):
         return f'while,{self.pred.__str__()},loop,{self.body.__str__()},pool'
@@ -409,13 +441,13 @@ class CLBlock:
     """
     Attributes:
         expr_list (list[CLExpr]): CLExpr objects to evaluate in block
-        s_type (CLTypeIdent): static type evaluated at type-check
+        s_type (CLType): static type evaluated at type-check
     """
-    expr_list = []
-    s_type: (CLTypeIdent|None) = None
+    __slots__ = ('expr_list', 's_type')
 
     def __init__(self, l: list[CLExpr]):
         self.expr_list = l
+        self.s_type = None
     
     def __str__(self):
         return f' {{ {list(map(lambda a : f"{a.__str__()},", self.expr_list))} }} '
@@ -427,13 +459,13 @@ class CLNew:
     """
     Attributes:
         type_id (CLTypeIdent): type to instantiate
-        s_type (CLTypeIdent): static type evaluated at type-check
+        s_type (CLType): static type evaluated at type-check
     """
-    type_id = None
-    s_type: (CLTypeIdent|None) = None
+    __slots__ = ('type_id', 's_type')
 
     def __init__(self, t: CLTypeIdent):
         self.type_id = t
+        self.s_type = None
 
     def __str__(self):
         return f'new,{self.type_id.__str__()}'
@@ -445,13 +477,13 @@ class CLIsvoid:
     """
     Attributes:
         expr (CLExpr): CLExpr object to evaluate and check if value is void
-        s_type (CLTypeIdent): static type evaluated at type-check
+        s_type (CLType): static type evaluated at type-check
     """
-    expr = None
-    s_type: (CLTypeIdent|None) = None
+    __slots__ = ('expr', 's_type')
 
     def __init__(self, e: CLExpr):
         self.expr = e
+        self.s_type = None
 
     def __str__(self):
         return f'isvoid,{self.expr.__str__()}'
@@ -464,15 +496,14 @@ class CLPlus:
     Attributes:
         lhs (CLExpr): CLExpr object to evaluate
         rhs (CLExpr): CLExpr object to evaluate
-        s_type (CLTypeIdent): static type evaluated at type-check
+        s_type (CLType): static type evaluated at type-check
     """
-    lhs = None
-    rhs = None
-    s_type: (CLTypeIdent|None) = None
+    __slots__ = ('lhs', 'rhs', 's_type')
 
     def __init__(self, l: CLExpr, r: CLExpr):
         self.lhs = l
         self.rhs = r
+        self.s_type = None
 
     def __str__(self):
         return f'{self.lhs.__str__()},+,{self.rhs.__str__()}'
@@ -485,15 +516,14 @@ class CLMinus:
     Attributes:
         lhs (CLExpr): CLExpr object to evaluate
         rhs (CLExpr): CLExpr object to evaluate
-        s_type (CLTypeIdent): static type evaluated at type-check
+        s_type (CLType): static type evaluated at type-check
     """
-    lhs = None
-    rhs = None
-    s_type: (CLTypeIdent|None) = None
+    __slots__ = ('lhs', 'rhs', 's_type')
 
     def __init__(self, l: CLExpr, r: CLExpr):
         self.lhs = l
         self.rhs = r
+        self.s_type = None
 
     def __str__(self):
         return f'{self.lhs.__str__()},-,{self.rhs.__str__()}'
@@ -506,15 +536,14 @@ class CLTimes:
     Attributes:
         lhs (CLExpr): CLExpr object to evaluate
         rhs (CLExpr): CLExpr object to evaluate
-        s_type (CLTypeIdent): static type evaluated at type-check
+        s_type (CLType): static type evaluated at type-check
     """
-    lhs = None
-    rhs = None
-    s_type: (CLTypeIdent|None) = None
+    __slots__ = ('lhs', 'rhs', 's_type')
 
     def __init__(self, l: CLExpr, r: CLExpr):
         self.lhs = l
         self.rhs = r
+        self.s_type = None
 
     def __str__(self):
         return f'{self.lhs.__str__()},*,{self.rhs.__str__()}'
@@ -527,15 +556,14 @@ class CLDivide:
     Attributes:
         lhs (CLExpr): CLExpr object to evaluate
         rhs (CLExpr): CLExpr object to evaluate
-        s_type (CLTypeIdent): static type evaluated at type-check
+        s_type (CLType): static type evaluated at type-check
     """
-    lhs = None
-    rhs = None
-    s_type: (CLTypeIdent|None) = None
+    __slots__ = ('lhs', 'rhs', 's_type')
 
     def __init__(self, l: CLExpr, r: CLExpr):
         self.lhs = l
         self.rhs = r
+        self.s_type = None
 
     def __str__(self):
         return f'{self.lhs.__str__()},/,{self.rhs.__str__()}'
@@ -548,15 +576,14 @@ class CLLT:
     Attributes:
         lhs (CLExpr): CLExpr object to evaluate
         rhs (CLExpr): CLExpr object to evaluate
-        s_type (CLTypeIdent): static type evaluated at type-check
+        s_type (CLType): static type evaluated at type-check
     """
-    lhs = None
-    rhs = None
-    s_type: (CLTypeIdent|None) = None
+    __slots__ = ('lhs', 'rhs', 's_type')
 
     def __init__(self, l: CLExpr, r: CLExpr):
         self.lhs = l
         self.rhs = r
+        self.s_type = None
 
     def __str__(self):
         return f'{self.lhs.__str__()},<,{self.rhs.__str__()}'
@@ -569,15 +596,14 @@ class CLLE:
     Attributes:
         lhs (CLExpr): CLExpr object to evaluate
         rhs (CLExpr): CLExpr object to evaluate
-        s_type (CLTypeIdent): static type evaluated at type-check
+        s_type (CLType): static type evaluated at type-check
     """
-    lhs = None
-    rhs = None
-    s_type: (CLTypeIdent|None) = None
+    __slots__ = ('lhs', 'rhs', 's_type')
 
     def __init__(self, l: CLExpr, r: CLExpr):
         self.lhs = l
         self.rhs = r
+        self.s_type = None
 
     def __str__(self):
         return f'{self.lhs.__str__()},<=,{self.rhs.__str__()}'
@@ -590,15 +616,14 @@ class CLEQ:
     Attributes:
         lhs (CLExpr): CLExpr object to evaluate
         rhs (CLExpr): CLExpr object to evaluate
-        s_type (CLTypeIdent): static type evaluated at type-check
+        s_type (CLType): static type evaluated at type-check
     """
-    lhs = None
-    rhs = None
-    s_type: (CLTypeIdent|None) = None
+    __slots__ = ('lhs', 'rhs', 's_type')
 
     def __init__(self, l: CLExpr, r: CLExpr):
         self.lhs = l
         self.rhs = r
+        self.s_type = None
 
     def __str__(self):
         return f'{self.lhs.__str__()},=,{self.rhs.__str__()}'
@@ -610,13 +635,13 @@ class CLNOT:
     """
     Attributes:
         expr (CLExpr): CLExpr object to evaluate
-        s_type (CLTypeIdent): static type evaluated at type-check
+        s_type (CLType): static type evaluated at type-check
     """
-    expr = None
-    s_type: (CLTypeIdent|None) = None
+    __slots__ = ('expr', 's_type')
 
     def __init__(self, e: CLExpr):
         self.expr = e
+        self.s_type = None
 
     def __str__(self):
         return f'not,{self.expr.__str__()}'
@@ -628,13 +653,13 @@ class CLNegate:
     """
     Attributes:
         expr (CLExpr): CLExpr object to evaluate
-        s_type (CLTypeIdent): static type evaluated at type-check
+        s_type (CLType): static type evaluated at type-check
     """
-    expr = None
-    s_type: (CLTypeIdent|None) = None
+    __slots__ = ('expr', 's_type')
 
     def __init__(self, e: CLExpr):
         self.expr = e
+        self.s_type = None
 
     def __str__(self):
         return f'~,{self.expr.__str__()}'
@@ -650,10 +675,7 @@ class CLLetBindingElem:
         v_type (CLTypeIdent): CLTypeIdent object representing the declared type of the varible
         v_init (None | CLExpr): CLExpr object to evaluate iff bind_type == 'let_binding_init'
     """
-    bind_type = ''
-    v_name = None
-    v_type = None
-    v_init = None
+    __slots__ = ('bind_type', 'v_name', 'v_type', 'v_init')
 
     def __init__(self, b: str, vn: CLVarIdent, vt: CLTypeIdent, vi: CLExpr | None=None):
         self.bind_type = b
@@ -672,16 +694,14 @@ class CLLet:
     Attributes:
         bind_list (list[CLLetBindingElem]): list of let bindings
         let_body (CLExpr): CLExpr object to evaluate
-        s_type (CLTypeIdent): static type evaluated at type-check
+        s_type (CLType): static type evaluated at type-check
     """
-    bind_list: list[CLLetBindingElem]
-    bind_list = []
-    let_body = None
-    s_type: (CLTypeIdent|None) = None
+    __slots__ = ('bind_list', 'let_body', 's_type')
 
     def __init__(self, l: list[CLLetBindingElem], b: CLExpr):
         self.bind_list = l
         self.let_body = b
+        self.s_type = None
     
     def __str__(self):
         return f'{list(map(lambda a : f"{a.__str__()},"))},{self.body.__str__}'
@@ -696,9 +716,7 @@ class CLCaseElem:
         type (CLTypeIdent): type of declared case variable
         body (CLExpr): CLExpr object to evaluate and resulting value of whole case expr
     """
-    ident = None
-    type = None
-    body = None
+    __slots__ = ('ident', 'type', 'body')
 
     def __init__(self, i: CLVarIdent, t: CLTypeIdent, b: CLExpr):
         self.ident = i
@@ -714,20 +732,18 @@ class CLCaseElem:
 class CLCase:
     """
     Attributes:
-        line_num (str): line number of case expr
+        line_num (int): line number of case expr
         c_expr (CLExpr): CLExpr object to evalute and check the dynamic type of
         c_list (list[CLCaseElem]): case elements to check c_expr against, choosing the least type
-        s_type (CLTypeIdent): static type evaluated at type-check
+        s_type (CLType): static type evaluated at type-check
     """
-    line_num = ''
-    c_expr = None
-    c_list: list[CLCaseElem] = []
-    s_type: (CLTypeIdent|None) = None
+    __slots__ = ('line_num', 'c_expr', 'c_list', 's_type')
 
-    def __init__(self, l: str, e: CLExpr, ls: list[CLCaseElem]):
+    def __init__(self, l: int, e: CLExpr, ls: list[CLCaseElem]):
         self.line_num = l
         self.c_expr = e
         self.c_list = ls
+        self.s_type = None
 
     def __str__(self):
         return f'{self.c_expr.__str__()},{list(map(lambda a : f"{a.__str__()},"))}'
@@ -735,151 +751,276 @@ class CLCase:
     def __repr__(self):
         return f'{self.c_expr.__str__()},{list(map(lambda a : f"{a.__str__()},"))}'
 
+## Errors
+class CLCheckError(Exception):
+    """Error in a program that ends its check: a type error, or a semantic error found
+    while reading it. Raised where the checker finds it; `main.py` prints `text` (the
+    `str` of the error) and exits
+
+    Attributes:
+        line: line number of the error in the COOL source; 0 if it has none
+        message: what is wrong
+        text: the error as printed by `main.py`
+    """
+    line: int
+    message: str
+    text: str
+
+    def __init__(self, line: int, message: str, text: str | None = None):
+        if (text is None):
+            text = f'ERROR: {line}: Type-Check: {message}'
+        super().__init__(line, message, text)
+        self.line = line
+        self.message = message
+        self.text = text
+
+    def __str__(self):
+        return self.text
+
+class CLCheckErrors(CLCheckError):
+    """Every error found in a program checked collecting all its errors (see `report_error`),
+    raised once the whole program is checked. The errors are in the order they were found,
+    so the first is the one a check stopping at the first error reports; an error found
+    twice (same line and message) is kept once. `line` and `message` are those of the
+    first error, and `text` the text of every error, one per line
+
+    Attributes:
+        errors: the errors
+    """
+    errors: list[CLCheckError]
+
+    def __init__(self, errors: list[CLCheckError]):
+        unique = list({e.text: e for e in errors}.values())
+        super().__init__(unique[0].line, unique[0].message, '\n'.join(e.text for e in unique))
+        self.errors = unique
+
+    def __reduce__(self):
+        return (CLCheckErrors, (self.errors,))
+
+def report_error(errors: list[CLCheckError] | None, e: CLCheckError):
+    """Report an error the checker can recover from: raise it when stopping at the first
+    error (`errors` is None), else record it in `errors` and return, for the caller to
+    carry on as if the program were right there"""
+    if (errors is None):
+        raise e
+    errors.append(e)
+
+## Static types of the builtin classes, and SELF_TYPE as declared (enclosing class not known yet)
+CLOBJECTTYPE = mkCLType('Object')
+CLIOTYPE = mkCLType('IO')
+CLINTTYPE = mkCLType('Int')
+CLSTRINGTYPE = mkCLType('String')
+CLBOOLTYPE = mkCLType('Bool')
+CLSELFTYPE = mkCLType('SELF_TYPE')
+# Static type of what failed to check when all the errors are collected (see `report_error`):
+# it conforms to every type and every type conforms to it, so an error isn't reported
+# again by every expression around it. No class can be named like it
+CLERRORTYPE = mkCLType('<error>')
+
+## Default values of attributes declared without an initializer, shared by every class map
+CLINTDEFAULT = CLConstant(CLINTTYPE, 0)
+CLSTRINGDEFAULT = CLConstant(CLSTRINGTYPE, '')
+CLBOOLDEFAULT = CLConstant(CLBOOLTYPE, 'false')
+CLVOIDDEFAULT = CLConstant(CLOBJECTTYPE, 'void')
+
+def mkCLConstant(const_val: str) -> CLConstant:
+    """return a CLConstant obj for the text of a constant read from a cl-ast; 
+    `true`/`false` are Bool, anything that reads as an integer is Int, else String"""
+    match const_val:
+        case 'true' | 'false':
+            return(CLConstant(CLBOOLTYPE, const_val))
+        case _:
+            try:
+                int_v = int(const_val)
+                return(CLConstant(CLINTTYPE, int_v))
+            except:
+                return(CLConstant(CLSTRINGTYPE, const_val))
+
 def mkCLObject() -> CLClass:
     """return a CLClass obj representing COOL's Object class 
 
     Object is the root of all types
     """
     CLObjectFtList = []
-    m_abort = CLExpr('0', 'internal', CLConstant(CLTypeIdent('0','Object'), 'Object.abort'))
-    m_abort_rtn_t = CLTypeIdent('0', 'Object')
-    m_abort.s_type = m_abort_rtn_t
+    m_abort = CLExpr(0, 'internal', CLConstant(CLOBJECTTYPE, 'Object.abort'))
+    m_abort_rtn_t = CLTypeIdent(0, 'Object')
+    m_abort.s_type = CLOBJECTTYPE
 
-    m_type_name = CLExpr('0', 'internal', CLConstant(CLTypeIdent('0','String'), 'Object.type_name'))
-    m_type_name_rtn_t = CLTypeIdent('0', 'String')
-    m_type_name.s_type = m_type_name_rtn_t
+    m_type_name = CLExpr(0, 'internal', CLConstant(CLSTRINGTYPE, 'Object.type_name'))
+    m_type_name_rtn_t = CLTypeIdent(0, 'String')
+    m_type_name.s_type = CLSTRINGTYPE
 
-    m_copy = CLExpr('0', 'internal', CLConstant(CLTypeIdent('0','SELF_TYPE'), 'Object.copy'))
-    m_copy_rtn_t = CLTypeIdent('0', 'SELF_TYPE')
-    m_copy.s_type = m_copy_rtn_t
+    m_copy = CLExpr(0, 'internal', CLConstant(CLSELFTYPE, 'Object.copy'))
+    m_copy_rtn_t = CLTypeIdent(0, 'SELF_TYPE')
+    m_copy.s_type = CLSELFTYPE
 
     CLObjectFtList.append(CLFeature('method', 
-                               CLMethodIdent('0', 'abort'), 
+                               CLMethodIdent(0, 'abort'), 
                                m_abort_rtn_t,
                                [], None,
                                m_abort)
     )
     
     CLObjectFtList.append(CLFeature('method',
-                               CLMethodIdent('0', 'type_name'),
+                               CLMethodIdent(0, 'type_name'),
                                m_type_name_rtn_t,
                                [], None,
                                m_type_name)
     )
 
     CLObjectFtList.append(CLFeature('method',
-                               CLMethodIdent('0', 'copy'),
+                               CLMethodIdent(0, 'copy'),
                                m_copy_rtn_t,
                                [], None,
                                m_copy)
     )
 
-    return(CLClass(CLClassIdent('0', 'Object'), CLObjectFtList))
+    return(CLClass(CLClassIdent(0, 'Object'), CLObjectFtList))
 
 def mkCLIO() -> CLClass:
     """return a CLClass obj representing COOL's IO class """
-    m_out_string_rtn_t = CLTypeIdent('0', 'SELF_TYPE')
-    m_out_string = CLExpr('0', 'internal', CLConstant(m_out_string_rtn_t, 'IO.out_string'))
-    m_out_string.s_type = m_out_string_rtn_t
+    m_out_string_rtn_t = CLTypeIdent(0, 'SELF_TYPE')
+    m_out_string = CLExpr(0, 'internal', CLConstant(CLSELFTYPE, 'IO.out_string'))
+    m_out_string.s_type = CLSELFTYPE
 
-    m_out_int_rtn_t = CLTypeIdent('0', 'SELF_TYPE')
-    m_out_int = CLExpr('0', 'internal', CLConstant(m_out_int_rtn_t, 'IO.out_int'))
-    m_out_int.s_type = m_out_int_rtn_t
+    m_out_int_rtn_t = CLTypeIdent(0, 'SELF_TYPE')
+    m_out_int = CLExpr(0, 'internal', CLConstant(CLSELFTYPE, 'IO.out_int'))
+    m_out_int.s_type = CLSELFTYPE
 
-    m_in_string_rtn_t = CLTypeIdent('0', 'String')
-    m_in_string = CLExpr('0', 'internal', CLConstant(m_in_string_rtn_t, 'IO.in_string'))
-    m_in_string.s_type = m_in_string_rtn_t
+    m_in_string_rtn_t = CLTypeIdent(0, 'String')
+    m_in_string = CLExpr(0, 'internal', CLConstant(CLSTRINGTYPE, 'IO.in_string'))
+    m_in_string.s_type = CLSTRINGTYPE
 
-    m_in_int_rtn_t = CLTypeIdent('0', 'Int') 
-    m_in_int = CLExpr('0', 'internal', CLConstant(m_in_int_rtn_t, 'IO.in_int'))
-    m_in_int.s_type = m_in_int_rtn_t
+    m_in_int_rtn_t = CLTypeIdent(0, 'Int')
+    m_in_int = CLExpr(0, 'internal', CLConstant(CLINTTYPE, 'IO.in_int'))
+    m_in_int.s_type = CLINTTYPE
     CLIOFtList = []
 
     CLIOFtList.append(CLFeature('method',
-                               CLMethodIdent('0', 'out_string'),
+                               CLMethodIdent(0, 'out_string'),
                                m_out_string_rtn_t,
-                               [CLFormal(CLVarIdent('0', 'x'), 
-                                         CLTypeIdent('0', 'String'))],
+                               [CLFormal(CLVarIdent(0, 'x'), 
+                                         CLTypeIdent(0, 'String'))],
                                 None,
                                 m_out_string)
     )
 
     CLIOFtList.append(CLFeature('method',
-                               CLMethodIdent('0', 'out_int'),
+                               CLMethodIdent(0, 'out_int'),
                                m_out_int_rtn_t,
-                               [CLFormal(CLVarIdent('0', 'x'), 
-                                         CLTypeIdent('0', 'Int'))],
+                               [CLFormal(CLVarIdent(0, 'x'), 
+                                         CLTypeIdent(0, 'Int'))],
                                 None,
                                 m_out_int)
     )
 
     CLIOFtList.append(CLFeature('method', 
-                               CLMethodIdent('0', 'in_string'), 
+                               CLMethodIdent(0, 'in_string'), 
                                m_in_string_rtn_t,
                                [], None,
                                m_in_string)
     )
 
     CLIOFtList.append(CLFeature('method', 
-                               CLMethodIdent('0', 'in_int'), 
+                               CLMethodIdent(0, 'in_int'), 
                                m_in_int_rtn_t,
                                [], None,
                                m_in_int)
     )
 
-    return(CLClass(CLClassIdent('0', 'IO'), CLIOFtList, True, mkCLObject().ident))
+    return(CLClass(CLClassIdent(0, 'IO'), CLIOFtList, True, mkCLObject().ident))
 
 def mkCLString() -> CLClass:
     """return a CLClass obj representing COOL's String class """
-    m_length_rtn_t = CLTypeIdent('0', 'Int')
-    m_concat_rtn_t = CLTypeIdent('0', 'String')
-    m_substr_rtn_t = CLTypeIdent('0', 'String')
-    m_length = CLExpr('0', 'internal', CLConstant(m_length_rtn_t, 'String.length'))
-    m_concat = CLExpr('0', 'internal', CLConstant(m_concat_rtn_t, 'String.concat'))
-    m_substr = CLExpr('0', 'internal', CLConstant(m_substr_rtn_t, 'String.substr'))
-    m_length.s_type = m_length_rtn_t
-    m_concat.s_type = m_concat_rtn_t
-    m_substr.s_type = m_substr_rtn_t
+    m_length_rtn_t = CLTypeIdent(0, 'Int')
+    m_concat_rtn_t = CLTypeIdent(0, 'String')
+    m_substr_rtn_t = CLTypeIdent(0, 'String')
+    m_length = CLExpr(0, 'internal', CLConstant(CLINTTYPE, 'String.length'))
+    m_concat = CLExpr(0, 'internal', CLConstant(CLSTRINGTYPE, 'String.concat'))
+    m_substr = CLExpr(0, 'internal', CLConstant(CLSTRINGTYPE, 'String.substr'))
+    m_length.s_type = CLINTTYPE
+    m_concat.s_type = CLSTRINGTYPE
+    m_substr.s_type = CLSTRINGTYPE
     CLStringFtList = []
     CLStringFtList.append(CLFeature('method', 
-                               CLMethodIdent('0', 'length'), 
+                               CLMethodIdent(0, 'length'), 
                                m_length_rtn_t,
                                [], None,
                                m_length)
     )
     
     CLStringFtList.append(CLFeature('method',
-                               CLMethodIdent('0', 'concat'),
+                               CLMethodIdent(0, 'concat'),
                                m_concat_rtn_t,
-                               [CLFormal(CLVarIdent('0', 's'), 
-                                         CLTypeIdent('0', 'String'))],
+                               [CLFormal(CLVarIdent(0, 's'), 
+                                         CLTypeIdent(0, 'String'))],
                                 None,
                                 m_concat)
     )
 
     CLStringFtList.append(CLFeature('method',
-                               CLMethodIdent('0', 'substr'),
+                               CLMethodIdent(0, 'substr'),
                                m_substr_rtn_t,
-                               [CLFormal(CLVarIdent('0', 'i'), 
-                                         CLTypeIdent('0', 'Int')),
-                                CLFormal(CLVarIdent('0', 'l'), 
-                                         CLTypeIdent('0', 'Int'))],
+                               [CLFormal(CLVarIdent(0, 'i'), 
+                                         CLTypeIdent(0, 'Int')),
+                                CLFormal(CLVarIdent(0, 'l'), 
+                                         CLTypeIdent(0, 'Int'))],
                                 None,
                                 m_substr)
     )
 
-    return(CLClass(CLClassIdent('0', 'String'), CLStringFtList, True, mkCLObject().ident))
+    return(CLClass(CLClassIdent(0, 'String'), CLStringFtList, True, mkCLObject().ident))
 
 def mkCLInt() -> CLClass:
     """return a CLClass obj representing COOL's Int class """
-    return(CLClass(CLClassIdent('0', 'Int'), [], True, mkCLObject().ident))
+    return(CLClass(CLClassIdent(0, 'Int'), [], True, mkCLObject().ident))
 
 def mkCLBool() -> CLClass:
     """return a CLClass obj representing COOL's Bool class """
-    return(CLClass(CLClassIdent('0', 'Bool'), [], True, mkCLObject().ident))
-
-CLOBJECTINSTANCE = mkCLObject()
-CLSTRINGINSTANCE = mkCLString()
-CLIOINSTANCE = mkCLIO()
-CLINTINSTANCE = mkCLInt()
-CLBOOLINSTANCE = mkCLBool()
+    return(CLClass(CLClassIdent(0, 'Bool'), [], True, mkCLObject().ident))
+
+## Builtin classes are shared by every program checked, possibly on several threads at
+#   once, so they are annotated once here and then frozen: no program can change them
+class CLFrozen:
+    """Base of the frozen node classes made by `freeze`: their attributes can't be set"""
+    __slots__ = ()
+
+    def __setattr__(self, attr, v):
+        raise AttributeError(f'cannot set {attr} of {self!r}: builtin classes are frozen')
+
+# Frozen subclass of each node class, made by `freeze`
+CLFROZEN_CLASSES: dict[type, type] = {}
+
+def freeze(x):
+    """Make the node `x` and every node it holds read-only, in place: its lists become
+    tuples, and its class a subclass that can't set attributes (see `CLFrozen`)"""
+    cls = type(x)
+    if (issubclass(cls, (CLFrozen, CLType))):
+        return x
+    for slot in [s for c in cls.__mro__ for s in getattr(c, '__slots__', ())]:
+        v = getattr(x, slot, None)
+        if (isinstance(v, (list, tuple))):
+            object.__setattr__(x, slot, tuple(map(freeze, v)))
+        elif (hasattr(type(v), '__slots__') and (not isinstance(v, (str, int)))):
+            freeze(v)
+    frozen = CLFROZEN_CLASSES.get(cls)
+    if (frozen is None):
+        frozen = CLFROZEN_CLASSES.setdefault(cls, type(cls.__name__, (CLFrozen, cls), {'__slots__': ()}))
+    x.__class__ = frozen
+    return x
+
+def mkCLBuiltin(c: CLClass) -> CLClass:
+    """Annotate a builtin class as checking it would (each method with its declared
+    return type; internal bodies are annotated when made) and freeze it"""
+    for f in c.features:
+        f.s_type = mkCLType(f.m_type.name)
+    return freeze(c)
+
+CLOBJECTINSTANCE = mkCLBuiltin(mkCLObject())
+CLSTRINGINSTANCE = mkCLBuiltin(mkCLString())
+CLIOINSTANCE = mkCLBuiltin(mkCLIO())
+CLINTINSTANCE = mkCLBuiltin(mkCLInt())
+CLBOOLINSTANCE = mkCLBuiltin(mkCLBool())
+# The builtin classes by name
+CLBUILTINS: dict[str, CLClass] = {c.ident.name: c for c in (CLOBJECTINSTANCE, CLSTRINGINSTANCE, CLIOINSTANCE,
+                                                           CLINTINSTANCE, CLBOOLINSTANCE)}
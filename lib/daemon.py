@@ -0,0 +1,247 @@
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .cl_types import *
+from .parser import *
+from .arena import CLArena
+from .astcache import read_prog_cached
+from .binary import bytes_tokens, stream_tokens
+from .batch import check_prog, cl_type_path, write_cl_type
+
+# Longest header line a daemon reads, in bytes
+DAEMON_HEADER_LIMIT = 1 << 16
+# Options of a request, passed on to the checker, see `daemon_check`
+DAEMON_OPTIONS = ('arena', 'binary', 'cache', 'ast_cache', 'all_errors')
+
+def daemon_check(request: dict, data: bytes | None) -> tuple[dict, bytes]:
+    """Serve one request in a worker of the daemon: check the .cl-ast at `request['path']`,
+    or held in `data`, into a cl-type in memory. `request` may also set the options of
+    `check_file` in `DAEMON_OPTIONS` (but not `workers`); `ast_cache` only applies to a path
+
+    :return: (the header of the reply X the cl-type, empty unless the status is 'ok').
+        The header has the status ('ok', 'error' for a type error, with the `line` and
+        `message` of the first error, the `text` main.py prints and the `line` and
+        `message` of each of the `errors`, or 'crash' for any other exception, with
+        a `message`) and `check_ms`, the time the worker took
+    :rtype: tuple(dict, bytes)
+    """
+    start = time.perf_counter()
+    result = io.BytesIO()
+    arena = bool(request.get('arena'))
+    try:
+        if ((data is None) and request.get('ast_cache')):
+            ast = read_prog_cached(request['path'], arena)
+        else:
+            p = COOLStreamParser(stream_tokens(request['path']) if (data is None) else bytes_tokens(data))
+            p.reset_parser()
+            ast = read_prog(p, CLArena() if (arena) else None)
+        ctx = check_prog(ast, cache=request.get('cache'), all_errors=bool(request.get('all_errors')))
+        write_cl_type(result, ctx, bool(request.get('binary')))
+        reply = {'status': 'ok'}
+    except CLCheckError as e:
+        reply = {'status': 'error', 'line': e.line, 'message': e.message, 'text': e.text,
+                 'errors': [{'line': x.line, 'message': x.message} for x in getattr(e, 'errors', [e])]}
+    except Exception as e:
+        reply = {'status': 'crash', 'message': f'{type(e).__name__}: {e}'}
+    reply['check_ms'] = (time.perf_counter() - start) * 1000
+    return (reply, result.getvalue() if (reply['status'] == 'ok') else b'')
+
+def daemon_warm_up() -> int:
+    """Trivial task, submitted to start the workers before the first request, so no request pays for it"""
+    return os.getpid()
+
+class CLDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server keeping the checker resident: one thread per connection
+    reads its requests and hands them to a pool of forked worker processes, which
+    have `lib` imported and the builtin classes built once and for all.
+
+    On a connection, a client sends requests and reads a reply to each, in turn. A
+    request is one line of JSON: either {"path": ...} for a .cl-ast (text or binary)
+    the daemon can read, or {"size": N} followed by the N bytes of a .cl-ast, plus any
+    of `DAEMON_OPTIONS`. The reply is one line of JSON with the header of
+    `daemon_check`, `latency_ms` (from the request read to the reply ready) and
+    `size`, followed by the `size` bytes of the cl-type.
+
+    Attributes:
+        workers: number of worker processes
+        pool: the worker processes
+        pool_lock: held while the pool is replaced
+        log_lock: held while a request is logged
+    """
+    daemon_threads = True
+    workers: int
+    pool: ProcessPoolExecutor
+    pool_lock: threading.Lock
+    log_lock: threading.Lock
+
+    def __init__(self, socket_path: str, workers: int):
+        self.workers = workers
+        self.pool_lock = threading.Lock()
+        self.log_lock = threading.Lock()
+        self.pool = self.start_pool()
+        super().__init__(socket_path, CLDaemonHandler)
+
+    def start_pool(self) -> ProcessPoolExecutor:
+        """Start the worker processes, waiting until they are all up"""
+        pool = ProcessPoolExecutor(max_workers=self.workers)
+        for fut in [pool.submit(daemon_warm_up) for _ in range(self.workers)]:
+            fut.result()
+        return pool
+
+    def check(self, request: dict, data: bytes | None) -> tuple[dict, bytes]:
+        """Run `daemon_check` on a worker. A worker that dies breaks the pool, which is replaced"""
+        pool = self.pool
+        try:
+            return pool.submit(daemon_check, request, data).result()
+        except BrokenProcessPool:
+            with self.pool_lock:
+                if (self.pool is pool):
+                    self.pool = self.start_pool()
+            return ({'status': 'crash', 'message': 'worker process died'}, b'')
+
+    def log(self, request: dict, reply: dict):
+        """Print one line for a request served"""
+        name = request.get('path', f"<{request.get('size', 0)} bytes>")
+        with self.log_lock:
+            print(f"{reply['status']}: {name} {reply['latency_ms']:.1f} ms", flush=True)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(cancel_futures=True)
+        if (os.path.exists(self.server_address)):
+            os.remove(self.server_address)
+
+class CLDaemonHandler(socketserver.StreamRequestHandler):
+    """Serves the requests of one connection to a `CLDaemon`, until the client closes it"""
+
+    def handle(self):
+        header = self.rfile.readline(DAEMON_HEADER_LIMIT)
+        while (header):
+            start = time.perf_counter()
+            data = None
+            try:
+                request = json.loads(header)
+                if ('size' in request):
+                    data = self.rfile.read(request['size'])
+                    if (len(data) != request['size']):
+                        return
+                elif ('path' not in request):
+                    raise ValueError('no path or size')
+                reply, cl_type = self.server.check(
+                    {k: v for k, v in request.items() if (k in DAEMON_OPTIONS + ('path',))}, data)
+            except (ValueError, TypeError) as e:
+                # Malformed JSON too; its input is unknown, so nothing is left to read
+                request = {}
+                reply, cl_type = ({'status': 'invalid', 'message': str(e)}, b'')
+            reply['latency_ms'] = (time.perf_counter() - start) * 1000
+            reply['size'] = len(cl_type)
+            self.wfile.write(json.dumps(reply).encode() + b'\n' + cl_type)
+            self.wfile.flush()
+            self.server.log(request, reply)
+            header = self.rfile.readline(DAEMON_HEADER_LIMIT)
+
+def daemon_request(sock: socket.socket,
+                   path: str | None = None,
+                   data: bytes | None = None,
+                   **options) -> tuple[dict, bytes]:
+    """Send a request to a `CLDaemon` on a connected socket and wait for its reply
+
+    :param sock: connection to the daemon
+    :type sock: socket.socket
+    :param path: path of a .cl-ast the daemon can read (made absolute); or
+    :type path: str | None
+    :param data: the bytes of a .cl-ast
+    :type data: bytes | None
+    :param options: any of `DAEMON_OPTIONS`
+    :return: (the header of the reply X the cl-type), see `CLDaemon`
+    :rtype: tuple(dict, bytes)
+    """
+    request = dict(options)
+    if (data is None):
+        request['path'] = os.path.abspath(path)
+    else:
+        request['size'] = len(data)
+    sock.sendall(json.dumps(request).encode() + b'\n' + (data or b''))
+    f = sock.makefile('rb')
+    try:
+        reply = json.loads(f.readline(DAEMON_HEADER_LIMIT))
+        cl_type = f.read(reply['size'])
+    finally:
+        f.close()
+    return (reply, cl_type)
+
+def daemon_main(args: list[str]) -> int:
+    """Entry point of `main.py --daemon SOCKET [-j N]`: serves checks on the Unix socket
+    SOCKET with N worker processes (default: all CPUs) until interrupted, printing one
+    line per request with its status and latency
+
+    :param args: command line arguments after `--daemon`
+    :type args: list[str]
+    :return: exit status
+    :rtype: int
+    """
+    socket_path = args[0]
+    workers = int(args[args.index('-j') + 1]) if ('-j' in args) else (os.cpu_count() or 1)
+    if (os.path.exists(socket_path)):
+        # Left by a daemon that is gone; never taken from one that still answers
+        probe = socket.socket(socket.AF_UNIX)
+        try:
+            probe.connect(socket_path)
+            print(f'a daemon is already listening on {socket_path}', file=sys.stderr)
+            return 1
+        except OSError:
+            os.remove(socket_path)
+        finally:
+            probe.close()
+    server = CLDaemon(socket_path, workers)
+    # Shut down cleanly on SIGTERM, and on SIGINT even when started in the background
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    print(f'listening on {socket_path} with {workers} workers', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+def client_main(args: list[str]) -> int:
+    """Entry point of `main.py --client SOCKET [--arena] [--binary] [--cache DIR] [--ast-cache] [--all-errors] input`:
+    checks the input on the daemon at SOCKET like `main.py input` would (same options),
+    writing its .cl-type next to it or printing its type error
+
+    :param args: command line arguments after `--client`
+    :type args: list[str]
+    :return: exit status; 1 iff the checker crashed
+    :rtype: int
+    """
+    socket_path = args[0]
+    options = {'arena': '--arena' in args, 'binary': '--binary' in args,
+               'ast_cache': '--ast-cache' in args, 'all_errors': '--all-errors' in args}
+    if ('--cache' in args):
+        options['cache'] = os.path.abspath(args[args.index('--cache') + 1])
+    path = [a for i, a in enumerate(args[1:], 1)
+            if ((not a.startswith('--')) and (args[i - 1] != '--cache'))][0]
+    with socket.socket(socket.AF_UNIX) as sock:
+        sock.connect(socket_path)
+        reply, cl_type = daemon_request(sock, path, **options)
+    match reply['status']:
+        case 'ok':
+            with open(cl_type_path(path, options['binary']), 'wb') as out_file:
+                out_file.write(cl_type)
+        case 'error':
+            print(reply['text'])
+        case _:
+            print(f"{reply['status']}: {reply['message']}", file=sys.stderr)
+            return 1
+    return 0
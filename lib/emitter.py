@@ -0,0 +1,91 @@
+import io
+from typing import IO
+
+# Number of lines a `CLEmitter` holds before it writes them to its sink in one call
+EMIT_BUFFER_LINES = 1 << 16
+# Length from which a cached fragment is written to the sink directly, instead of
+# being joined with the lines around it
+EMIT_SPLICE_DIRECT = 1 << 12
+# Number of characters of fragments joined with the lines that triggers a flush
+EMIT_SPLICE_BUFFER = 1 << 20
+
+class CLEmitter:
+    """Line-oriented writer for the serialized cl-type.
+
+    Lines are collected in `parts` as they are emitted and written to the sink
+    joined by newlines, one `write` call per `EMIT_BUFFER_LINES` lines, instead of
+    one `print` per line. Any object can be emitted as a line; it is converted
+    with `str` (as `print` would) when the buffer is flushed, so it must not
+    change until then.
+
+    Fragments of output that recur (an inherited method body is printed for
+    every subclass) can be rendered once and kept in `fragments`, keyed by the
+    identity of the node they were rendered from.
+
+    Attributes:
+        sink: the text or binary file-like object the lines are written to
+        binary: whether `sink` takes bytes, in which case lines are encoded with `encoding`
+        encoding: encoding of the lines written to a binary sink
+        parts: the lines emitted since the last flush
+        limit: number of lines in `parts` that triggers a flush
+        spliced: number of characters of the fragments in `parts`
+        fragments (dict[int, tuple[object, str]]): rendered text of each cached node, by id;
+            the node is kept with its text so that its id can't be reused by another object
+    """
+    __slots__ = ('sink', 'binary', 'encoding', 'parts', 'limit', 'spliced', 'fragments')
+
+    def __init__(self, sink: IO, limit: int = EMIT_BUFFER_LINES, encoding: str = 'utf-8'):
+        self.sink = sink
+        self.binary = (isinstance(sink, (io.RawIOBase, io.BufferedIOBase)) or
+                       ('b' in getattr(sink, 'mode', '')))
+        self.encoding = encoding
+        self.parts = []
+        self.limit = limit
+        self.spliced = 0
+        self.fragments = dict()
+
+    def line(self, x):
+        """Emit `x` as one line"""
+        self.parts.append(x)
+        if (len(self.parts) >= self.limit):
+            self.flush()
+
+    def lines(self, xs):
+        """Emit each item of `xs` as one line"""
+        self.parts.extend(xs)
+        if (len(self.parts) >= self.limit):
+            self.flush()
+
+    def splice(self, x) -> bool:
+        """Emit the fragment cached for `x` after the lines emitted so far.
+        Return False, emitting nothing, if there is none"""
+        entry = self.fragments.get(id(x))
+        if (entry is None):
+            return False
+        text = entry[1]
+        if (len(text) < EMIT_SPLICE_DIRECT):
+            # Joined with the other lines (without its own last newline)
+            self.parts.append(text[:-1])
+            self.spliced += len(text)
+            if ((len(self.parts) >= self.limit) or (self.spliced >= EMIT_SPLICE_BUFFER)):
+                self.flush()
+        else:
+            self.flush()
+            self.sink.write(text.encode(self.encoding) if (self.binary) else text)
+        return True
+
+    def add_fragment(self, x, text: str):
+        """Cache `text`, one or more complete lines, as rendered from `x`"""
+        self.fragments[id(x)] = (x, text)
+
+    def flush(self):
+        """Write the buffered lines to the sink.
+        `parts` is cleared in place, so callers may keep a reference to it"""
+        if (not self.parts):
+            return
+        data = '\n'.join(map(str, self.parts)) + '\n'
+        self.parts.clear()
+        self.spliced = 0
+        if (self.binary):
+            data = data.encode(self.encoding)
+        self.sink.write(data)
@@ -1,6 +1,12 @@
-import sys
+from collections import deque
+from collections.abc import Generator, Iterable, Iterator
 from .cl_types import *
 
+# Size in characters of each read from a .cl-ast file by `stream_lines`
+STREAM_CHUNK_SIZE = 1 << 20
+# Number of lines a `COOLStreamParser` keeps behind the current one for `push_back`
+STREAM_PUSHBACK_DEPTH = 4
+
 class ParseStates:
     CLPROG = 1
     CLCLASS = 2
@@ -90,25 +96,120 @@ class COOLParser:
         self.it = self.lines[0]
         self.parse_state = ParseStates.CLPROG
 
-def read_prog(parser: COOLParser) -> CLAST:
+def stream_lines(path: str, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[str]:
+    """Lazily yield the stripped lines of a serialized cl-ast file, 
+    reading it `chunk_size` characters at a time instead of all at once
+
+    :param path: path of the .cl-ast file
+    :type path: str
+    :param chunk_size: number of characters read from the file at a time
+    :type chunk_size: int
+    :return: the stripped lines of the file, in order
+    :rtype: Iterator[str]
+    """
+    with open(path, 'r') as f:
+        rest = ''
+        chunk = f.read(chunk_size)
+        while (chunk):
+            lines = (rest + chunk).split('\n')
+            # The last line of a chunk may continue in the next chunk
+            rest = lines.pop()
+            for l in lines:
+                yield l.strip()
+            chunk = f.read(chunk_size)
+        if (rest):
+            yield rest.strip()
+
+class COOLStreamParser(COOLParser):
+    """COOLParser that pulls the lines of the serialized cl-ast lazily from 
+    an iterable (see `stream_lines`), so the whole file never has to be held 
+    as a list of lines. Only the lines around the current one are kept, 
+    enough for `push_back` and `peek_next`
+    
+    Attributes:
+        idx: current position
+        it: current lexeme
+        tokens: iterator over the remaining lines
+        behind: the lines before the current one, most recent last
+        ahead: lines already pulled from `tokens` but not reached yet, next one last
+        line_len: None; the number of lines is unknown until the end of the stream
+        parse_state: one of ParseState
+    """
+    tokens: Iterator[str] = None
+    behind: deque[str] = None
+    ahead: list[str] = None
+
+    def __init__(self, l: Iterable[str]):
+        self.tokens = iter(l)
+        self.behind = deque(maxlen=STREAM_PUSHBACK_DEPTH)
+        self.ahead = []
+        self.idx = 0
+        self.it = next(self.tokens, '')
+        self.line_len = None
+        self.parse_state = ParseStates.CLPROG
+
+    def peek_next(self):
+        """Return as a tuple the index and next item of lines"""
+        if (not self.ahead):
+            it_next = next(self.tokens, None)
+            if (it_next is None):
+                return None
+            self.ahead.append(it_next)
+        return (self.idx + 1, self.ahead[-1])
+
+    def peek_prev(self):
+        if (not self.behind):
+            return None
+        return (self.idx - 1, self.behind[-1])
+
+    def get_next(self):
+        if (self.ahead):
+            it_next = self.ahead.pop()
+        else:
+            it_next = next(self.tokens, None)
+            if (it_next is None):
+                return None
+        self.behind.append(self.it)
+        self.idx += 1
+        self.it = it_next
+        return (self.idx, self.it)
+
+    def get_prev(self):
+        if (not self.behind):
+            return None
+        self.ahead.append(self.it)
+        self.idx -= 1
+        self.it = self.behind.pop()
+        return (self.idx, self.it)
+
+    def reset_parser(self):
+        # A stream can't be rewound; only the initial position can be "reset" to
+        if (self.idx != 0):
+            raise ValueError('cannot reset a streaming parser')
+        self.parse_state = ParseStates.CLPROG
+
+def read_prog(parser: COOLParser, arena=None) -> CLAST:
+    """Read a whole program. If a `CLArena` is given, the expressions of every 
+    feature are stored in it, and features hold `CLArenaExpr` handles to them"""
     parser.set_parse_state(ParseStates.CLPROG)
     class_list: list[CLClass] = []
+    class_names: set[str] = set()
     class_cnt = int(parser.it)
     parser.get_next()
 
     parser.set_parse_state(ParseStates.CLLIST)
     for i in range(class_cnt):
-        cl_cls = read_class(parser)
+        cl_cls = read_class(parser, arena)
 
-        if (cl_cls.ident.name in {c.ident.name for c in class_list}):
-            print(f'ERROR: {cl_cls.ident.line}: Type-Check: class {cl_cls.ident.name} redefined')
-            sys.exit()
+        if (cl_cls.ident.name in class_names):
+            raise CLCheckError(cl_cls.ident.line, f'class {cl_cls.ident.name} redefined')
             return
         class_list.append(cl_cls)
+        class_names.add(cl_cls.ident.name)
 
     return CLAST(class_list)
 
-def read_class(parser: COOLParser) -> CLClass:
+def read_class(parser: COOLParser, arena=None) -> CLClass:
     parser.set_parse_state(ParseStates.CLCLASS)
 
     curr_class_id = read_class_ident(parser)    # Returns a CLClassIdent & moves parser forward
@@ -119,24 +220,25 @@ def read_class(parser: COOLParser) -> CLClass:
     curr_superclass_id = None if not curr_class_inh else read_class_ident(parser)
 
     curr_class_feature_list: list[CLFeature] = []
+    curr_ms: set[str] = set()
 
     curr_class_feature_cnt = int(parser.it)
     parser.get_next()
 
     parser.set_parse_state(ParseStates.CLLIST)
     for i in range(curr_class_feature_cnt):
-        cl_ft = read_feature(parser)
-        curr_ms = {m.f_ident.name for m in filter(lambda f: f.f_type == 'method', curr_class_feature_list)}
+        cl_ft = read_feature(parser, arena)
         if (cl_ft.f_ident.name in curr_ms):
-            print(f'ERROR: {cl_ft.f_ident.line}: Type-Check: class {curr_class_id.name} redefines method {cl_ft.f_ident.name}')
-            sys.exit()
+            raise CLCheckError(cl_ft.f_ident.line, f'class {curr_class_id.name} redefines method {cl_ft.f_ident.name}')
             return
 
         curr_class_feature_list.append(cl_ft)
+        if (cl_ft.f_type == 'method'):
+            curr_ms.add(cl_ft.f_ident.name)
 
     return(CLClass(curr_class_id, curr_class_feature_list, curr_class_inh, curr_superclass_id))
 
-def read_feature(parser: COOLParser) -> CLFeature:
+def read_feature(parser: COOLParser, arena=None) -> CLFeature:
     parser.set_parse_state(ParseStates.CLFEATURE)
 
     feature_type = parser.it
@@ -151,7 +253,7 @@ def read_feature(parser: COOLParser) -> CLFeature:
         case 'attribute_init':
             attr_name = read_var_ident(parser)
             attr_type = read_type_ident(parser)
-            attr_init_expr = read_expr(parser)
+            attr_init_expr = read_expr(parser) if (arena is None) else arena.read_expr(parser)
             
             return CLFeature(feature_type, attr_name, attr_type, None, attr_init_expr)
         case 'method':
@@ -166,11 +268,11 @@ def read_feature(parser: COOLParser) -> CLFeature:
                 method_formals_ls.append(read_formal(parser))
 
             method_type = read_type_ident(parser)
-            method_body = read_expr(parser)
+            method_body = read_expr(parser) if (arena is None) else arena.read_expr(parser)
             
             return CLFeature(feature_type, method_name, method_type, method_formals_ls, None, method_body)
         case _:
-            sys.exit("how did we get here?")
+            raise ValueError(f'unknown feature type {feature_type}')
 
 def read_formal(parser: COOLParser) -> CLFormal:
     parser.set_parse_state(ParseStates.CLFORMAL)
@@ -180,11 +282,38 @@ def read_formal(parser: COOLParser) -> CLFormal:
     return CLFormal(formal_name, formal_type)
 
 def read_expr(parser: COOLParser) -> CLExpr:
+    """Read one expression, and all of its sub-expressions, without recursion.
+
+    Leaf expressions are built directly. Every other expression is built by 
+    one of the generator steps in `EXPR_READERS`, which yields each time it 
+    needs a sub-expression and is sent that sub-expression once it is read. 
+    Partially built expressions wait on an explicit stack, so nesting depth 
+    is only limited by memory
+    """
     # Every Expr must terminate =>
     # Every 'read_expr()' call will return a CLExpr object
+    stack: list[Generator[None, CLExpr, CLExpr]] = []
+    while (True):
+        expr = read_expr_start(parser, stack)
+        # Hand finished expressions up to the expressions waiting on them, 
+        # until one of those needs another sub-expression
+        while (expr is not None):
+            if (not stack):
+                return expr
+            try:
+                stack[-1].send(expr)
+                expr = None
+            except StopIteration as done:
+                stack.pop()
+                expr = done.value
+
+def read_expr_start(parser: COOLParser, 
+                    stack: list[Generator[None, CLExpr, CLExpr]]) -> CLExpr | None:
+    """Read the line number and kind of the next expression. Return the expression if 
+    it is already complete, else push its generator step on `stack` and return None"""
     parser.set_parse_state(ParseStates.CLEXPR)
 
-    expr_line_num = parser.it
+    expr_line_num = int(parser.it)
     parser.get_next()
 
     expr_type = parser.it
@@ -192,168 +321,178 @@ def read_expr(parser: COOLParser) -> CLExpr:
 
     match expr_type:
         case 'true' | 'false':
-            parser.push_back()
-            return(CLExpr(expr_line_num, expr_type, read_expr_constant(parser, expr_line_num)))
+            # The kind is the constant; nothing follows it to read
+            return(CLExpr(expr_line_num, expr_type, mkCLConstant(expr_type)))
         case 'integer' | 'string':
-            return(CLExpr(expr_line_num, expr_type, read_expr_constant(parser, expr_line_num)))
+            return(CLExpr(expr_line_num, expr_type, read_expr_constant(parser)))
         case 'identifier':
             return(CLExpr(expr_line_num, expr_type, read_expr_ident(parser)))
-        case 'assign':
-            var = read_var_ident(parser)
-            rhs = read_expr(parser)
-
-            return(CLExpr(expr_line_num, expr_type, CLAssign(var, rhs)))
         case 'new':
             return(CLExpr(expr_line_num, expr_type, CLNew(read_type_ident(parser))))
+        case _ if expr_type in EXPR_READERS:
+            step = EXPR_READERS[expr_type](parser, expr_line_num, expr_type)
+            try:
+                next(step)
+            except StopIteration as done:
+                return done.value
+            stack.append(step)
+            return None
+        case _:     # Unknown error
+            raise ValueError(f'unknown expr type {expr_type} at line {expr_line_num}')
+
+def read_expr_assign(parser: COOLParser, expr_line_num: int, expr_type: str) -> Generator[None, CLExpr, CLExpr]:
+    var = read_var_ident(parser)
+    rhs = yield
+
+    return(CLExpr(expr_line_num, expr_type, CLAssign(var, rhs)))
+
+def read_expr_unary(parser: COOLParser, expr_line_num: int, expr_type: str) -> Generator[None, CLExpr, CLExpr]:
+    e = yield
+    match expr_type:
         case 'isvoid':
-            return(CLExpr(expr_line_num, expr_type, CLIsvoid(read_expr(parser))))
+            return(CLExpr(expr_line_num, expr_type, CLIsvoid(e)))
         case 'not':
-            e = read_expr(parser)
             return(CLExpr(expr_line_num, expr_type, CLNOT(e)))
         case 'negate':
-            e = read_expr(parser)
             return(CLExpr(expr_line_num, expr_type, CLNegate(e)))
+
+def read_expr_binary(parser: COOLParser, expr_line_num: int, expr_type: str) -> Generator[None, CLExpr, CLExpr]:
+    lhs = yield
+    rhs = yield
+    match expr_type:
         case 'plus':
-            lhs = read_expr(parser)
-            rhs = read_expr(parser)
             return(CLExpr(expr_line_num, expr_type, CLPlus(lhs, rhs)))
         case 'minus':
-            lhs = read_expr(parser)
-            rhs = read_expr(parser)
             return(CLExpr(expr_line_num, expr_type, CLMinus(lhs, rhs)))
         case 'times':
-            lhs = read_expr(parser)
-            rhs = read_expr(parser)
             return(CLExpr(expr_line_num, expr_type, CLTimes(lhs, rhs)))
         case 'divide':
-            lhs = read_expr(parser)
-            rhs = read_expr(parser)
             return(CLExpr(expr_line_num, expr_type, CLDivide(lhs, rhs)))
         case 'lt':
-            lhs = read_expr(parser)
-            rhs = read_expr(parser)
             return(CLExpr(expr_line_num, expr_type, CLLT(lhs, rhs)))
         case 'le':
-            lhs = read_expr(parser)
-            rhs = read_expr(parser)
             return(CLExpr(expr_line_num, expr_type, CLLE(lhs, rhs)))
         case 'eq':
-            lhs = read_expr(parser)
-            rhs = read_expr(parser)
             return(CLExpr(expr_line_num, expr_type, CLEQ(lhs, rhs)))
-        case 'dynamic_dispatch':
-            caller_obj = read_expr(parser)
-            method_call = read_method_ident(parser)
 
-            argc = int(parser.it)
-            parser.get_next()
+def read_expr_dispatch(parser: COOLParser, expr_line_num: int, expr_type: str) -> Generator[None, CLExpr, CLExpr]:
+    caller_obj = None
+    typeclass = None
+    if (expr_type != 'self_dispatch'):
+        caller_obj = yield
+    if (expr_type == 'static_dispatch'):
+        typeclass = read_type_ident(parser)
+    method_call = read_method_ident(parser)
 
-            argv = []
+    argc = int(parser.it)
+    parser.get_next()
 
-            parser.set_parse_state(ParseStates.CLLIST)
-            for i in range(argc):
-                argv.append(read_expr(parser))
-            
+    argv = []
+
+    parser.set_parse_state(ParseStates.CLLIST)
+    for i in range(argc):
+        argv.append((yield))
+    
+    match expr_type:
+        case 'dynamic_dispatch':
             return(CLExpr(expr_line_num, expr_type, CLDynDispatch(caller_obj, method_call, argv)))
         case 'static_dispatch':
-            caller_obj = read_expr(parser)
-            typeclass = read_type_ident(parser)
-            method_call = read_method_ident(parser)
+            return(CLExpr(expr_line_num, expr_type, CLStaticDispatch(caller_obj, typeclass, method_call, argv)))
+        case 'self_dispatch':
+            return(CLExpr(expr_line_num, expr_type, CLSelfDispatch(method_call, argv)))
 
-            argc = int(parser.it)
-            parser.get_next()
+def read_expr_if(parser: COOLParser, expr_line_num: int, expr_type: str) -> Generator[None, CLExpr, CLExpr]:
+    predicate = yield
+    then_expr = yield
+    else_expr = yield
 
-            argv = []
+    return(CLExpr(expr_line_num, expr_type, CLIf(predicate, then_expr, else_expr)))
 
-            parser.set_parse_state(ParseStates.CLLIST)
-            for i in range(argc):
-                argv.append(read_expr(parser))
-            
-            return(CLExpr(expr_line_num, expr_type, CLStaticDispatch(caller_obj, typeclass, method_call, argv)))
-        case 'self_dispatch':
-            method_call = read_method_ident(parser)
+def read_expr_while(parser: COOLParser, expr_line_num: int, expr_type: str) -> Generator[None, CLExpr, CLExpr]:
+    predicate = yield
+    body = yield
 
-            argc = int(parser.it)
-            parser.get_next()
+    return(CLExpr(expr_line_num, expr_type, CLWhile(predicate, body)))
 
-            argv = []
+def read_expr_block(parser: COOLParser, expr_line_num: int, expr_type: str) -> Generator[None, CLExpr, CLExpr]:
+    exp_ls = []
+    exp_cnt = int(parser.it)
+    parser.get_next()
 
-            parser.set_parse_state(ParseStates.CLLIST)
-            for i in range(argc):
-                argv.append(read_expr(parser))
-            
-            return(CLExpr(expr_line_num, expr_type, CLSelfDispatch(method_call, argv)))
-        case 'if':
-            predicate = read_expr(parser)
-            then_expr = read_expr(parser)
-            else_expr = read_expr(parser)
-
-            return(CLExpr(expr_line_num, expr_type, CLIf(predicate, then_expr, else_expr)))
-        case 'while':
-            predicate = read_expr(parser)
-            body = read_expr(parser)
-
-            return(CLExpr(expr_line_num, expr_type, CLWhile(predicate, body)))
-        case 'block':
-            exp_ls = []
-            exp_cnt = int(parser.it)
-            parser.get_next()
+    parser.set_parse_state(ParseStates.CLLIST)
+    for i in range(exp_cnt):
+        exp_ls.append((yield))
+    
+    return(CLExpr(expr_line_num, expr_type, CLBlock(exp_ls)))
 
-            parser.set_parse_state(ParseStates.CLLIST)
-            for i in range(exp_cnt):
-                exp_ls.append(read_expr(parser))
-            
-            return(CLExpr(expr_line_num, expr_type, CLBlock(exp_ls)))
-        case 'let':
-            bind_cnt = int(parser.it)
-            parser.get_next()
+def read_expr_let(parser: COOLParser, expr_line_num: int, expr_type: str) -> Generator[None, CLExpr, CLExpr]:
+    bind_cnt = int(parser.it)
+    parser.get_next()
 
-            bind_list = []
+    bind_list = []
 
-            parser.set_parse_state(ParseStates.CLLIST)
-            for i in range(bind_cnt):
-                bind_type = parser.it
-                parser.get_next()
-
-                match bind_type:
-                    case 'let_binding_no_init':
-                        var_name = read_var_ident(parser)
-                        var_type = read_type_ident(parser)
-                        bind_list.append(CLLetBindingElem(bind_type, var_name, var_type))
-                    case 'let_binding_init':
-                        var_name = read_var_ident(parser)
-                        var_type = read_type_ident(parser)
-                        init_expr = read_expr(parser)
-                        bind_list.append(CLLetBindingElem(bind_type, var_name, var_type, init_expr))
-            
-            let_body = read_expr(parser)
-            
-            return(CLExpr(expr_line_num, expr_type, CLLet(bind_list, let_body)))
-        case 'case':
-            case_expr = read_expr(parser)
-            case_cnt = int(parser.it)
-            parser.get_next()
+    parser.set_parse_state(ParseStates.CLLIST)
+    for i in range(bind_cnt):
+        bind_type = parser.it
+        parser.get_next()
+
+        match bind_type:
+            case 'let_binding_no_init':
+                var_name = read_var_ident(parser)
+                var_type = read_type_ident(parser)
+                bind_list.append(CLLetBindingElem(bind_type, var_name, var_type))
+            case 'let_binding_init':
+                var_name = read_var_ident(parser)
+                var_type = read_type_ident(parser)
+                init_expr = yield
+                bind_list.append(CLLetBindingElem(bind_type, var_name, var_type, init_expr))
+    
+    let_body = yield
+    
+    return(CLExpr(expr_line_num, expr_type, CLLet(bind_list, let_body)))
 
-            case_list = []
+def read_expr_case(parser: COOLParser, expr_line_num: int, expr_type: str) -> Generator[None, CLExpr, CLExpr]:
+    case_expr = yield
+    case_cnt = int(parser.it)
+    parser.get_next()
 
-            parser.set_parse_state(ParseStates.CLLIST)
-            for i in range(case_cnt):
-                # Now reading case elements:
-                case_var = read_var_ident(parser)
-                case_type = read_type_ident(parser)
-                case_body = read_expr(parser)
-                case_list.append(CLCaseElem(case_var, case_type, case_body))
-            
-            return(CLExpr(expr_line_num, expr_type, CLCase(expr_line_num, case_expr, case_list)))
+    case_list = []
 
-        case _:     # Unknown error
-            parser.print_curr_state()
-            print(f"expr_line_num: {expr_line_num}")
-            print(f"expr_type: {expr_type}")
-            sys.exit('unknown expr type')
+    parser.set_parse_state(ParseStates.CLLIST)
+    for i in range(case_cnt):
+        # Now reading case elements:
+        case_var = read_var_ident(parser)
+        case_type = read_type_ident(parser)
+        case_body = yield
+        case_list.append(CLCaseElem(case_var, case_type, case_body))
+    
+    return(CLExpr(expr_line_num, expr_type, CLCase(expr_line_num, case_expr, case_list)))
+
+# Generator step of `read_expr` for each kind of non-leaf expression
+EXPR_READERS = {
+    'assign': read_expr_assign,
+    'isvoid': read_expr_unary,
+    'not': read_expr_unary,
+    'negate': read_expr_unary,
+    'plus': read_expr_binary,
+    'minus': read_expr_binary,
+    'times': read_expr_binary,
+    'divide': read_expr_binary,
+    'lt': read_expr_binary,
+    'le': read_expr_binary,
+    'eq': read_expr_binary,
+    'dynamic_dispatch': read_expr_dispatch,
+    'static_dispatch': read_expr_dispatch,
+    'self_dispatch': read_expr_dispatch,
+    'if': read_expr_if,
+    'while': read_expr_while,
+    'block': read_expr_block,
+    'let': read_expr_let,
+    'case': read_expr_case,
+}
 
 def read_expr_ident(parser: COOLParser) -> CLSelfIdent | CLVarIdent:
-    expr_line_num = parser.it
+    expr_line_num = int(parser.it)
     parser.get_next()
 
     expr_var = parser.it
@@ -365,22 +504,15 @@ def read_expr_ident(parser: COOLParser) -> CLSelfIdent | CLVarIdent:
         case _:
             return(CLVarIdent(expr_line_num, expr_var))
 
-def read_expr_constant(parser: COOLParser, line_num: str) -> CLConstant:
-    const_val = parser.it
+def read_expr_constant(parser: COOLParser) -> CLConstant:
+    # A binary cl-ast gives an int for a constant that reads like one
+    const_val = str(parser.it)
     parser.get_next()
 
-    match const_val:
-        case 'true' | 'false':
-            return(CLConstant(CLTypeIdent(line_num, 'Bool'), const_val))
-        case _:
-            try:
-                int_v = int(const_val)
-                return(CLConstant(CLTypeIdent(line_num, 'Int'), int_v))
-            except:
-                return(CLConstant(CLTypeIdent(line_num, 'String'), const_val))
+    return(mkCLConstant(const_val))
 
 def read_class_ident(parser: COOLParser) -> CLClassIdent:
-    line_num = parser.it
+    line_num = int(parser.it)
     parser.get_next()
 
     class_name = parser.it
@@ -389,7 +521,7 @@ def read_class_ident(parser: COOLParser) -> CLClassIdent:
     return(CLClassIdent(line_num, class_name))
 
 def read_var_ident(parser: COOLParser) -> CLVarIdent:
-    line_num = parser.it
+    line_num = int(parser.it)
     parser.get_next()
 
     var_name = parser.it
@@ -398,7 +530,7 @@ def read_var_ident(parser: COOLParser) -> CLVarIdent:
     return(CLVarIdent(line_num, var_name))
 
 def read_method_ident(parser: COOLParser) -> CLMethodIdent:
-    line_num = parser.it
+    line_num = int(parser.it)
     parser.get_next()
 
     var_name = parser.it
@@ -407,7 +539,7 @@ def read_method_ident(parser: COOLParser) -> CLMethodIdent:
     return(CLMethodIdent(line_num, var_name))
 
 def read_type_ident(parser: COOLParser) -> CLTypeIdent:
-    line_num = parser.it
+    line_num = int(parser.it)
     parser.get_next()
 
     type_name = parser.it
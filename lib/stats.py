@@ -0,0 +1,77 @@
+import contextlib
+import json
+import time
+import tracemalloc
+from typing import IO
+
+# Version of the layout of the JSON written by `CLStats.write`; bumped when a key is
+# renamed or removed, so dashboards can tell runs of an older checker apart
+STATS_VERSION = 1
+
+class CLStats:
+    """Timings and counters of one run of the checker, written as JSON by `write`.
+
+    Each phase of the pipeline (see `phase`) records its wall time and the CPU time of
+    this process (so not the time of `-j` workers). With `memory`, tracemalloc is
+    started by `__init__` and each phase also records the peak of memory allocated
+    during it above what was allocated when it started. Tracing makes the run several
+    times slower and skews the phase times, so it is off unless asked for; times are
+    only comparable between runs made with the same setting.
+
+    Attributes:
+        phases (dict[str, dict[str, float | int]]): the measures of each phase, in the
+            order they ran; a phase run more than once adds up
+        counts (dict[str, int | dict[str, int]]): counters of the program checked, see `check_prog`
+        memory: whether memory is traced
+        started_tracing: whether tracemalloc was started here, and is stopped by `write`
+    """
+    __slots__ = ('phases', 'counts', 'memory', 'started_tracing')
+
+    def __init__(self, memory: bool = False):
+        self.phases = dict()
+        self.counts = dict()
+        self.memory = memory
+        self.started_tracing = memory and (not tracemalloc.is_tracing())
+        if (self.started_tracing):
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Measure the `with` block as the phase `name`, see `phase`"""
+        if (self.memory):
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            cpu = time.process_time() - cpu
+            wall = time.perf_counter() - wall
+            rec = self.phases.setdefault(name, {'wall_s': 0.0, 'cpu_s': 0.0})
+            rec['wall_s'] += wall
+            rec['cpu_s'] += cpu
+            if (self.memory):
+                rec['peak_bytes'] = max(rec.get('peak_bytes', 0), tracemalloc.get_traced_memory()[1] - base)
+
+    def to_dict(self) -> dict:
+        """Return the stats as written by `write`"""
+        return {'version': STATS_VERSION,
+                'memory_traced': self.memory,
+                'phases': self.phases,
+                'counts': self.counts}
+
+    def write(self, out_file: IO):
+        """Write the stats to `out_file` as one JSON object, stopping tracemalloc if it was started here"""
+        if (self.started_tracing):
+            tracemalloc.stop()
+            self.started_tracing = False
+        json.dump(self.to_dict(), out_file, indent=2)
+        out_file.write('\n')
+
+def phase(stats: CLStats | None, name: str):
+    """Return a context manager measuring its block as the phase `name` of `stats`,
+    or doing nothing if `stats` is None"""
+    if (stats is None):
+        return contextlib.nullcontext()
+    return stats.phase(name)
@@ -1,159 +1,99 @@
+import io
+import multiprocessing
+import sys
+import threading
+from collections.abc import Generator, Iterator
+from concurrent.futures import ProcessPoolExecutor
+
 from .cl_types import *
+from .emitter import *
 from .util import *
 
 """Helper functions"""
-def oe_c(oe: dict[tuple[str, str], CLTypeIdent], c: CLClass) -> dict[tuple[str, str], CLTypeIdent]:
-    """Produce a copy of an object environment where any instance of
-    SELF_TYPE is annotated with the associted enclosing class
-
-    :param oe: object env
-    :type oe: dict[tuple[str,str], CLTypeIdent]
-    :return: a copy of the object env 
-    :rtype: dict of (str, str): CLTypeIdent
-    """
-    oe_rtn = copy.deepcopy(oe)
-    for k, v in oe.items():
-        if (v.name == 'SELF_TYPE'):
-            oe_rtn[k].self_type_resolve = c.ident.name
-        else:
-            oe_rtn[k] = v
-    return oe_rtn
-
 def join(cst: dict[str, CLClass], 
-         type_A: CLTypeIdent, 
-         type_B: CLTypeIdent) -> CLTypeIdent | None:
-    """Calculate the 'least type' between 2 types, used in type checking if expr
+         type_A: CLType, 
+         type_B: CLType) -> CLType | None:
+    """Calculate the 'least type' between 2 types, used in type checking if expr. 
+    The least common ancestor comes from the class table's inheritance index
 
     :param cst: the dict produced by `init_class_table`
     :type cst: dict[str, CLClass]
     :param type_A: Type of true block
-    :type type_A: CLTypeIdent
+    :type type_A: CLType
     :param type_A: Type of false block
-    :type type_A: CLTypeIdent
+    :type type_A: CLType
     :return: The type of the least common ancestor
-    :rtype: CLTypeIdent
+    :rtype: CLType
     """
-    # Return the least type C s.t. A<=C and B<=C
+    # Return the least type C s.t. A<=C and B<=C; the error type is left out
+    if (type_A is CLERRORTYPE):
+        return type_B
+    if (type_B is CLERRORTYPE):
+        return type_A
     if ((type_A.name == type_B.name) or
         (type_A.name == 'Object') or
         (type_B.name == 'Object')):
         return type_A
-    # Get the ancestors of A and B
-    anc_A = get_ancestors(cst, cst[type_A.name]) if type_A.name != 'SELF_TYPE' else \
-            get_ancestors(cst, cst[type_A.self_type_resolve])
-    anc_B = get_ancestors(cst, cst[type_B.name]) if type_B.name != 'SELF_TYPE' else \
-            get_ancestors(cst, cst[type_B.self_type_resolve])
-    len_A = len(anc_A)
-    len_B = len(anc_B)
-    
-    curr_A = cst[type_A.name] if type_A.name != 'SELF_TYPE' else \
-             cst[type_A.self_type_resolve]
-    curr_B = cst[type_B.name] if type_B.name != 'SELF_TYPE' else \
-             cst[type_B.self_type_resolve]
-    while (len_A != len_B):
-        if (len_A > len_B):
-            curr_A = anc_A.pop()
-            len_A -= 1
-        else:
-            curr_B = anc_B.pop()
-            len_B -= 1
-    while (curr_A.ident.name != curr_B.ident.name):
-        try:
-            curr_A = anc_A.pop()
-            curr_B = anc_B.pop()
-        except:
-            return None
-        else:
-            len_A -= 1
-            len_B -= 1
-    return CLTypeIdent(curr_A.ident.line, curr_A.ident.name)
+    # The least common ancestor of the (SELF_TYPE resolved) classes of A and B
+    name_A = type_A.self_type_resolve if type_A.name == 'SELF_TYPE' else type_A.name
+    name_B = type_B.self_type_resolve if type_B.name == 'SELF_TYPE' else type_B.name
+    lub = cst.hierarchy.lca(name_A, name_B)
+    return mkCLType(lub.ident.name)
 
-def join_case(cst: dict[str, CLClass], types: list[CLTypeIdent]) -> CLTypeIdent | None:
-    """Calculate the 'least type' between a list types, used in type checking `case` expr
+def join_case(cst: dict[str, CLClass], types: list[CLType]) -> CLType | None:
+    """Calculate the 'least type' between a list types, used in type checking `case` expr. 
+    Folds one least common ancestor query of the class table's inheritance index per type
 
     :param cst: the dict produced by `init_class_table`
     :type cst: dict[str, CLClass]
     :param types: List of type in case expression
-    :type types: list[CLTypeIdent]
+    :type types: list[CLType]
     :return: The type of the least common ancestor among all cases
-    :rtype: CLTypeIdent
+    :rtype: CLType
     """
+    # The error type is left out
+    types = [t for t in types if (t is not CLERRORTYPE)]
+    if (not types):
+        return CLERRORTYPE
     for t in types:
         if (t.name == 'Object'):
             return t
     
-    # Helper functions
-    def ti2cs(ti: CLTypeIdent) -> str:
+    # Fold the pairwise least common ancestor over all (SELF_TYPE resolved) types
+    def ti2cs(ti: CLType) -> str:
         if (ti.name == 'SELF_TYPE'):
             return ti.self_type_resolve
         else:
             return ti.name
-    def cst_val(cs: str) -> CLClass:
-        return cst[cs]
-    def get_anc(c: CLClass) -> deque[CLClass]:
-        d = get_ancestors(cst, c)
-        d.append(c)
-        return d
-    
-    str_types = map(ti2cs, types)
-    cls_types = map(cst_val, str_types)
-    anc_types = list(map(get_anc, cls_types))
-    anc_types_lens = map(len, anc_types)
-    min_len = min(anc_types_lens)
-    # make all deques the same len
-    for anc_deque in anc_types:
-        while (len(anc_deque) != min_len):
-            anc_deque.pop()
-    
-    # peek at left most items in all deques
-    try:
-        curr_its = [d[-1].ident.name for d in anc_types]
-    except:
-        return None
-    
-    # lots of side effects here - careful!!!
-    while (not all(it == curr_its[0] for it in curr_its)):              # While not all items in curr_its are the same, 
-        try: 
-            #(d.pop() for d in anc_types)    # Pop from right on all deques of anc_types
-            #map(lambda d: d.pop(), anc_types)
-            for d in anc_types:
-                d.pop()
-        except:                                         # If something goes wrong just return None
-            return None
-        else:
-            curr_its = [d[-1].ident.name for d in anc_types]    # reassign curr_its to be the list of the last item of all deques
-    # now, hopefully all items in the deques of anc_types are the same
-    # so, get the rightmost item of the deque (which should be the least common ancestor of all `types`)
+    lub = cst.hierarchy.classes[ti2cs(types[0])]
+    for t in types[1:]:
+        lub = cst.hierarchy.lca(lub.ident.name, ti2cs(t))
     if (all(it.name == 'SELF_TYPE' for it in types)):
         return types[0]
     else:
-        return CLTypeIdent(anc_types[0][-1].ident.line, anc_types[0][-1].ident.name)
+        return mkCLType(lub.ident.name)
 
 
 
 """Type checking functions"""
-def tc_basic_class_inheritance(cst: dict[str, CLClass]) -> bool:
+def tc_basic_class_inheritance(cst: dict[str, CLClass], errors: list[CLCheckError] | None = None) -> bool:
     """Type checks all classes to check inheritance from Int, String, or Bool"""
     # Look for inheritance for Int, String, or Bool
     for cls in cst.values():
         if (cls.inherits):
             match cls.superclass.name:
                 case 'Int':
-                    print(f'ERROR: {cls.ident.line}: Type-Check: class {cls.ident.name} inherits from Int')
-                    sys.exit()
+                    report_error(errors, CLCheckError(cls.ident.line, f'class {cls.ident.name} inherits from Int'))
                 case 'String':
-                    print(f'ERROR: {cls.ident.line}: Type-Check: class {cls.ident.name} inherits from String')
-                    sys.exit()
+                    report_error(errors, CLCheckError(cls.ident.line, f'class {cls.ident.name} inherits from String'))
                 case 'Bool':
-                    print(f'ERROR: {cls.ident.line}: Type-Check: class {cls.ident.name} inherits from Bool')
-                    sys.exit()
+                    report_error(errors, CLCheckError(cls.ident.line, f'class {cls.ident.name} inherits from Bool'))
                 case _:
                     if (cls.superclass.name not in cst):
-                        print(f'ERROR: {cls.superclass.line}: Type-Check: class {cls.ident.name} inherits from unknown class {cls.superclass.name}')
-                        sys.exit()
+                        report_error(errors, CLCheckError(cls.superclass.line, f'class {cls.ident.name} inherits from unknown class {cls.superclass.name}'))
     return True 
 
-def tc_main_method(cst: dict[str, CLClass]) -> bool:
+def tc_main_method(cst: dict[str, CLClass], errors: list[CLCheckError] | None = None) -> bool:
     """Type checks the Main class for method main. Aborts if main is declared with more than 0 parameters"""
     # Check for main method in Main declared with 0 params
     if ('Main' in cst):
@@ -163,523 +103,766 @@ def tc_main_method(cst: dict[str, CLClass]) -> bool:
                 curr_method = main_fs.popleft()
                 if ((curr_method.f_ident.name == 'main') and
                     (len(curr_method.m_formals)) != 0):
-                    print(f'ERROR: 0: Type-Check: class Main method main with 0 parameters not found')
-                    sys.exit()
-                    return False
+                    report_error(errors, CLCheckError(0, 'class Main method main with 0 parameters not found'))
                 if (len(main_fs) == 0):
                     break
     else:
-        print(f'ERROR: 0: Type-Check: class Main not found')
-        sys.exit()
-        return False
+        report_error(errors, CLCheckError(0, 'class Main not found'))
     return True
 
-def tc_class_self_type(cst: dict[str, CLClass]) -> bool:
+def tc_class_self_type(cst: dict[str, CLClass], errors: list[CLCheckError] | None = None) -> bool:
     """Checks program if there exists a declared class with name SELF_TYPE"""
     if ('SELF_TYPE' in cst):
-        print(f'ERROR: {cst["SELF_TYPE"].ident.line}: Type-Check: class named SELF_TYPE')
-        sys.exit()
-        return False
+        report_error(errors, CLCheckError(cst["SELF_TYPE"].ident.line, 'class named SELF_TYPE'))
     return True
 
 def type_check(cst: dict[str, CLClass], 
-               me: dict[tuple[str, str], list[CLTypeIdent]], 
-               oe: dict[tuple[str, str], CLTypeIdent]) -> list[list[CLTypeIdent]]:
+               me: CLEnv, 
+               oe: CLObjectEnv,
+               workers: int = 1,
+               errors: list[CLCheckError] | None = None) -> list[list[CLType]]:
     """Given an ast, type check all classes. Returns a list of lists, where each item corresponds to a class. 
-    Each item in each list contains a CLTypeIdent, the static type of each class's feature"""
-    tc_basic_class_inheritance(cst)
-    tc_main_method(cst)
-    tc_class_self_type(cst)
+    Each item in each list contains a CLType, the static type of each class's feature.
+    With more than one worker, the classes are checked by `tc_classes_parallel`.
+
+    Aborts on the first error, unless `errors` is given: then every error is recorded
+    in it (see `report_error`), in the order they are found, and the whole program is
+    checked, whatever fails to check getting the error type"""
+    tc_basic_class_inheritance(cst, errors)
+    tc_main_method(cst, errors)
+    tc_class_self_type(cst, errors)
+    if (workers > 1):
+        return tc_classes_parallel(cst, me, oe, workers, errors=errors)
     c_types = []
     for c in cst.values():
-        res = tc_class(cst, me, oe, c)
+        res = tc_class(cst, me, oe, c, errors)
         if (res is None):
             return None
         c_types.append(res)
     return c_types
 
 def tc_class(cst: dict[str, CLClass], 
-             me: dict[tuple[str, str], list[CLTypeIdent]], 
-             oe: dict[tuple[str, str], CLTypeIdent], 
-             c: CLClass) -> list[CLTypeIdent] | None:
+             me: CLEnv, 
+             oe: CLObjectEnv, 
+             c: CLClass,
+             errors: list[CLCheckError] | None = None) -> list[CLType] | None:
     """Type check a class. Return None iff None is a member of `f_types`.
 
-    `tc_class` will resolve any instance of SELF_TYPE in the object env by calling `oe_c` on the obj env passed to it. 
-    The extended object env is then passed to type check frame called for each feature of the class.
+    The object env resolves any instance of SELF_TYPE it looks up under `c` to `c`. 
+    It is passed to type check frame called for each feature of the class, 
+    which push and pop their own scopes on it.
+
+    A builtin class is frozen, annotated once for all programs (see `mkCLBuiltin`), 
+    and always checks: its types are returned as they are
     """
-    oe_ext = oe_c(oe, c)
+    if (isinstance(c, CLFrozen)):
+        return [f.s_type for f in c.features]
     f_types = []
     for f in c.features:
         match f.f_type:
             case 'attribute_no_init' | 'attribute_init':
-                res = tc_attr(cst, me, oe_ext, c, f)
+                res = tc_attr(cst, me, oe, c, f, errors)
             case 'method':
-                res = tc_method(cst, me, oe_ext, c, f)
+                res = tc_method(cst, me, oe, c, f, errors)
             case _:
-                print('ERROR: 0: Type-Check: feature is not attribute or method')   # is this a type checking error or syntax error?
-                sys.exit()
-                return None
+                report_error(errors, CLCheckError(0, 'feature is not attribute or method'))   # is this a type checking error or syntax error?
+                res = CLERRORTYPE
         f_types.append(res)
     if (None in f_types):
         return None
     return f_types
 
+# Number of chunks of classes `tc_classes_parallel` makes per worker, so that workers
+# that finish early can take more
+TC_CHUNKS_PER_WORKER = 4
+# What the workers of a `tc_classes_parallel` pool check: the class table, both environments,
+# the classes in order and whether errors are collected. Only ever set in a worker process,
+# by `tc_worker_init`, so each call gives its own workers its own program
+TC_WORKER_STATE: tuple[dict[str, CLClass], CLEnv, CLObjectEnv, list[CLClass], bool] | None = None
+
+def tc_check_workers(workers: int):
+    """Raise a ValueError if more than one worker can't be used here. `tc_classes_parallel`
+    forks its workers, and a fork only copies the thread calling it: a lock another thread
+    holds stays locked in the workers for good. So the classes are only checked on workers
+    where fork is safe (not on Windows, which has none, nor on macOS, whose system
+    libraries don't survive one), and while no other thread runs; check with one worker
+    on threads"""
+    if (workers <= 1):
+        return
+    if (('fork' not in multiprocessing.get_all_start_methods()) or (sys.platform == 'darwin')):
+        raise ValueError(f'cannot check with {workers} workers: they are forked, which is not safe on {sys.platform}')
+    if (threading.active_count() > 1):
+        raise ValueError(f'cannot check with {workers} workers while other threads run: they are forked, '\
+                         'which is only safe from the only thread of a process')
+
+def tc_classes_parallel(cst: dict[str, CLClass], 
+                        me: CLEnv, 
+                        oe: CLObjectEnv,
+                        workers: int,
+                        classes: list[CLClass] | None = None,
+                        errors: list[CLCheckError] | None = None) -> list[list[CLType]] | None:
+    """Type check all classes (or the given ones, in class table order), like the loop 
+    of `type_check`, on forked worker processes. Raises a ValueError where they can't
+    be forked safely, see `tc_check_workers`.
+
+    The classes are split in contiguous chunks, in class table order, which the 
+    workers check with `tc_class_chunk`. The static types a worker assigns are 
+    sent back in `walk_exprs` order and set on the same nodes here. Results are 
+    merged in chunk order, so the error reported (the first one of the first 
+    chunk with an error) is the error the serial loop reports. Errors collected 
+    in `errors` are merged in chunk order too
+    """
+    tc_check_workers(workers)
+    if (classes is None):
+        classes = list(cst.values())
+    # Contiguous chunks, of about the same number of features
+    weights = [1 + len(c.features) for c in classes]
+    n_chunks = workers * TC_CHUNKS_PER_WORKER
+    chunk_weight = sum(weights) / n_chunks
+    bounds: list[int] = [0]
+    acc = 0
+    for i, w in enumerate(weights):
+        acc += w
+        if ((acc >= chunk_weight * len(bounds)) and (i + 1 < len(classes))):
+            bounds.append(i + 1)
+    bounds.append(len(classes))
+
+    # The forked workers get the program as it is in memory, nothing is pickled
+    with ProcessPoolExecutor(max_workers=workers, 
+                             mp_context=multiprocessing.get_context('fork'),
+                             initializer=tc_worker_init, initargs=(cst, me, oe, classes, errors is not None)) as pool:
+        futures = [pool.submit(tc_class_chunk, lo, hi) for lo, hi in zip(bounds, bounds[1:])]
+        c_types = []
+        for (lo, hi), fut in zip(zip(bounds, bounds[1:]), futures):
+            status, res, annots, chunk_errors = fut.result()
+            if (status == 'error'):
+                # The error the worker found. Waiting for the chunks already running
+                # keeps the pool from being torn down while the interpreter exits
+                pool.shutdown(cancel_futures=True)
+                raise res
+            if (res is None):
+                return None
+            if (errors is not None):
+                errors += chunk_errors
+            c_types += res
+            annots = iter(annots)
+            for c in classes[lo:hi]:
+                if (isinstance(c, CLFrozen)):
+                    continue
+                for e in class_exprs(c):
+                    e.s_type = next(annots)
+    return c_types
+
+def tc_worker_init(cst: dict[str, CLClass], me: CLEnv, oe: CLObjectEnv, classes: list[CLClass], collect: bool):
+    """Set the `TC_WORKER_STATE` of a worker of `tc_classes_parallel` when it starts"""
+    global TC_WORKER_STATE
+    TC_WORKER_STATE = (cst, me, oe, classes, collect)
+
+def tc_class_chunk(lo: int, hi: int) -> tuple[str, CLCheckError | list[list[CLType]] | None, list[CLType | None], list[CLCheckError]]:
+    """Type check classes `lo` to `hi` (excluded) of `TC_WORKER_STATE` in a worker of `tc_classes_parallel`
+
+    :return: ('ok' X the `tc_class` result of each class (None if any is None) X the static 
+        type of every expression of the classes but builtin ones, in `walk_exprs` order X the 
+        errors collected, if errors are collected), or ('error' X the error raised by the 
+        checker X [] X []) on the first type error
+    :rtype: tuple(str, CLCheckError | list[list[CLType]] | None, list[CLType | None], list[CLCheckError])
+    """
+    cst, me, oe, classes, collect = TC_WORKER_STATE
+    errors: list[CLCheckError] | None = [] if (collect) else None
+    c_types = []
+    annots: list[CLType | None] = []
+    for c in classes[lo:hi]:
+        try:
+            res = tc_class(cst, me, oe, c, errors)
+        except CLCheckError as e:
+            return ('error', e, [], [])
+        if (res is None):
+            return ('ok', None, [], [])
+        c_types.append(res)
+        if (not isinstance(c, CLFrozen)):
+            annots += [e.s_type for e in class_exprs(c)]
+    return ('ok', c_types, annots, errors or [])
+
+def class_exprs(c: CLClass) -> Iterator[CLExpr]:
+    """Yield every expression of the features of a class, see `walk_exprs`"""
+    for f in c.features:
+        match f.f_type:
+            case 'attribute_init':
+                yield from walk_exprs(f.att_init)
+            case 'method':
+                yield from walk_exprs(f.m_body)
+
+def walk_exprs(e: CLExpr) -> Iterator[CLExpr]:
+    """Yield an expression and all of its sub-expressions in pre-order, without recursion"""
+    stack: list[CLExpr] = [e]
+    while (stack):
+        e = stack.pop()
+        yield e
+        body = e.body
+        match(e.type):
+            case 'assign':
+                stack.append(body.rhs)
+            case 'isvoid'|'not'|'negate':
+                stack.append(body.expr)
+            case 'plus'|'minus'|'times'|'divide'|'lt'|'le'|'eq':
+                stack += (body.rhs, body.lhs)
+            case 'while':
+                stack += (body.body, body.pred)
+            case 'if':
+                stack += (body.false_case, body.true_case, body.pred)
+            case 'block':
+                stack.extend(reversed(body.expr_list))
+            case 'self_dispatch':
+                stack.extend(reversed(body.args))
+            case 'dynamic_dispatch'|'static_dispatch':
+                stack.extend(reversed(body.args))
+                stack.append(body.caller)
+            case 'let':
+                stack.append(body.let_body)
+                stack.extend(b.v_init for b in reversed(body.bind_list) if (b.bind_type == 'let_binding_init'))
+            case 'case':
+                stack.extend(cs.body for cs in reversed(body.c_list))
+                stack.append(body.c_expr)
+
+def sub_exprs(e: CLExpr) -> list[CLExpr]:
+    """Return the direct sub-expressions of an expression, in source order (`walk_exprs`
+    has the same cases inlined, as it is on the path of every check)"""
+    body = e.body
+    match(e.type):
+        case 'assign':
+            return [body.rhs]
+        case 'isvoid'|'not'|'negate':
+            return [body.expr]
+        case 'plus'|'minus'|'times'|'divide'|'lt'|'le'|'eq':
+            return [body.lhs, body.rhs]
+        case 'while':
+            return [body.pred, body.body]
+        case 'if':
+            return [body.pred, body.true_case, body.false_case]
+        case 'block':
+            return list(body.expr_list)
+        case 'self_dispatch':
+            return list(body.args)
+        case 'dynamic_dispatch'|'static_dispatch':
+            return [body.caller, *body.args]
+        case 'let':
+            return [*(b.v_init for b in body.bind_list if (b.bind_type == 'let_binding_init')), body.let_body]
+        case 'case':
+            return [body.c_expr, *(cs.body for cs in body.c_list)]
+    return []
+
+def count_program(ast: CLAST) -> dict[str, int | dict[str, int]]:
+    """Count the nodes of the user classes of a program, by kind and by expression type,
+    and the depth of its deepest expression (a feature's own expression being at 1)"""
+    nodes = {'class': 0, 'attribute': 0, 'method': 0, 'formal': 0, 'expr': 0}
+    expr_types: dict[str, int] = dict()
+    max_depth = 0
+    for c in ast.classes:
+        nodes['class'] += 1
+        for f in c.features:
+            if (f.f_type == 'method'):
+                nodes['method'] += 1
+                nodes['formal'] += len(f.m_formals or ())
+                root = f.m_body
+            else:
+                nodes['attribute'] += 1
+                root = f.att_init if (f.f_type == 'attribute_init') else None
+            if (root is None):
+                continue
+            stack: list[tuple[CLExpr, int]] = [(root, 1)]
+            while (stack):
+                e, depth = stack.pop()
+                nodes['expr'] += 1
+                expr_types[e.type] = expr_types.get(e.type, 0) + 1
+                if (depth > max_depth):
+                    max_depth = depth
+                stack.extend((sub, depth + 1) for sub in sub_exprs(e))
+    return {'ast_nodes': nodes,
+            'expr_types': dict(sorted(expr_types.items())),
+            'max_expr_depth': max_depth}
+
 def tc_attr(cst: dict[str, CLClass],
-            me: dict[tuple[str, str], list[CLTypeIdent]], 
-            oe: dict[tuple[str, str], CLTypeIdent], 
+            me: CLEnv, 
+            oe: CLObjectEnv, 
             c: CLClass, 
-            expr: CLFeature) -> CLTypeIdent | None:
-    '''This should be called from tc_class, where tc_class already calls `oe_c()` on oe'''
+            expr: CLFeature,
+            errors: list[CLCheckError] | None = None) -> CLType | None:
+    '''This should be called from tc_class'''
     if ((expr.att_type.name != 'SELF_TYPE') and (expr.att_type.name not in cst)):
-        print(f'ERROR: {expr.att_type.line}: Type-Check: unknown type {expr.att_type.name}')
-        sys.exit()
-        return None
-    c1 = (c.ident.name, expr.f_ident.name) in oe.keys()
+        # Its type in the object env is the error type, see `decl_type`
+        report_error(errors, CLCheckError(expr.att_type.line, f'unknown type {expr.att_type.name}'))
+    c1 = (c.ident.name, expr.f_ident.name) in oe
     if (not c1):
-        print(f'ERROR: {expr.f_ident.line}: Type-Check: unbound attribute identifier {expr.f_ident.name}')
-        sys.exit()
-        return None
+        report_error(errors, CLCheckError(expr.f_ident.line, f'unbound attribute identifier {expr.f_ident.name}'))
+        return CLERRORTYPE
     if (expr.f_type == 'attribute_init'):
-        oe_ext = copy.deepcopy(oe)
-        oe_ext.update({(c.ident.name, 'self'): CLTypeIdent('0', 'SELF_TYPE')})
-        oe_ext[(c.ident.name, 'self')].self_type_resolve = c.ident.name
-        # Check the initializer
-        c2 = tc_expr(cst, me, oe_ext, c, expr.att_init)
+        # Check the initializer with `self` in scope
+        oe.push({(c.ident.name, 'self'): mkCLType('SELF_TYPE', c.ident.name)})
+        c2 = tc_expr(cst, me, oe, c, expr.att_init, errors)
+        oe.pop()
         if (c2 is None):
-            print(f'ERROR: tc_expr with expr {expr} returned none')
-            sys.exit()
-            return None
+            raise CLCheckError(expr.f_ident.line, f'tc_expr with expr {expr} returned none',
+                               f'ERROR: tc_expr with expr {expr} returned none')
         if (((oe[(c.ident.name, expr.f_ident.name)].name == 'SELF_TYPE') and (c2.name == 'SELF_TYPE') and 
-             (not conforms(cst, c, CLTypeIdent(expr.att_init.line_num, c.ident.name), oe[(c.ident.name, expr.f_ident.name)]))) or
+             (not conforms(cst, c, mkCLType(c.ident.name), oe[(c.ident.name, expr.f_ident.name)]))) or
             ((oe[(c.ident.name, expr.f_ident.name)].name == 'SELF_TYPE') and 
              (not conforms(cst, c, c2, oe[(c.ident.name, expr.f_ident.name)]))) or 
             ((c2.name == 'SELF_TYPE') and 
-             (not conforms(cst, c, CLTypeIdent(expr.att_init.line_num, c.ident.name), oe[(c.ident.name, expr.f_ident.name)]))) or 
+             (not conforms(cst, c, mkCLType(c.ident.name), oe[(c.ident.name, expr.f_ident.name)]))) or 
             (not conforms(cst, c, c2, oe[(c.ident.name, expr.f_ident.name)]))
         ):
-            print(f'ERROR: {expr.f_ident.line}: Type-Check: initializer of attribute {expr.f_ident.name} does not conform to {oe_ext[(c.ident.name, expr.f_ident.name)]}')
-            sys.exit()
-            return None
+            report_error(errors, CLCheckError(expr.f_ident.line, f'initializer of attribute {expr.f_ident.name} does not conform to {oe[(c.ident.name, expr.f_ident.name)]}'))
     expr.s_type = oe[(c.ident.name, expr.f_ident.name)]
     return oe[(c.ident.name, expr.f_ident.name)]
 
 def tc_method(cst: dict[str, CLClass],
-              me: dict[tuple[str, str], list[CLTypeIdent]], 
-              oe: dict[tuple[str, str], CLTypeIdent], 
+              me: CLEnv, 
+              oe: CLObjectEnv, 
               c: CLClass, 
-              expr: CLFeature) -> CLTypeIdent | None:
-    '''This should be called from tc_class, where tc_class already calls `oe_c()` on oe'''
+              expr: CLFeature,
+              errors: list[CLCheckError] | None = None) -> CLType | None:
+    '''This should be called from tc_class'''
     if ((expr.m_type.name != 'SELF_TYPE') and (expr.m_type.name not in cst)):
-        print(f'ERROR: {expr.m_type.line}: Type-Check: unknown type {expr.m_type.name}')
-        sys.exit()
-        return None
-    c1 = (c.ident.name, expr.f_ident.name) in me.keys()
+        # Its return type in the method env is the error type, see `decl_type`
+        report_error(errors, CLCheckError(expr.m_type.line, f'unknown type {expr.m_type.name}'))
+    c1 = (c.ident.name, expr.f_ident.name) in me
     if (not c1):    # Method name not found somehow
-        print(f'ERROR: {expr.f_ident.line}: Type-Check: unknown method {expr.f_ident.name}')
-        sys.exit()
-        return None
+        report_error(errors, CLCheckError(expr.f_ident.line, f'unknown method {expr.f_ident.name}'))
+        return CLERRORTYPE
     # Extend the object environment with `self` identifier and each formal
-    oe_ext = copy.deepcopy(oe)
-    oe_ext.update({(c.ident.name, 'self'): CLTypeIdent('0', 'SELF_TYPE')})
-    oe_ext[(c.ident.name, 'self')].self_type_resolve = c.ident.name
+    scope: dict[tuple[str, str], CLType] = {(c.ident.name, 'self'): mkCLType('SELF_TYPE', c.ident.name)}
     visited: set[str]
     visited = set()
     for f in expr.m_formals:
         if (f.name.name == 'self'):
-            print(f'ERROR: {expr.f_ident.line}: Type-Check: class {c.ident.name} has method {expr.f_ident.name} with formal parameter named self')
-            sys.exit()
-            return None
+            report_error(errors, CLCheckError(expr.f_ident.line, f'class {c.ident.name} has method {expr.f_ident.name} with formal parameter named self'))
+            # What `self` stands for in the body is anyone's guess
+            scope[(c.ident.name, 'self')] = CLERRORTYPE
+            continue
         if (f.type.name not in cst):
-            print(f'ERROR: {f.type.line}: Type-Check: unknown type {f.type.name}')
-            sys.exit()
-            return None
+            report_error(errors, CLCheckError(f.type.line, f'unknown type {f.type.name}'))
+            new_v = CLERRORTYPE
+        else:
+            new_v = mkCLType(f.type.name)
         if (f.name.name in visited):
-            print(f'ERROR: {expr.f_ident.line}: Type-Check: class {c.ident.name} has method {expr.f_ident.name} with duplicate formal parameter {f.name.name}')
-            sys.exit()
-            return None
+            report_error(errors, CLCheckError(expr.f_ident.line, f'class {c.ident.name} has method {expr.f_ident.name} with duplicate formal parameter {f.name.name}'))
+            continue
         visited.add(f.name.name)
         new_k = (c.ident.name, f.name.name)
-        new_v = f.type
-        oe_ext.update({new_k: new_v})
+        scope.update({new_k: new_v})
     
     # Check the static type of the method body and compare it against declared type
-    c2 = tc_expr(cst, me, oe_ext, c, expr.m_body)
-    expected_rtn = copy.deepcopy(me[c.ident.name, expr.f_ident.name][-1])
+    oe.push(scope)
+    c2 = tc_expr(cst, me, oe, c, expr.m_body, errors)
+    oe.pop()
+    expected_rtn = me[c.ident.name, expr.f_ident.name][-1]
     # We do this SELF_TYPE resolution for the sake of type checking
     if (expected_rtn.name == 'SELF_TYPE'):
-        expected_rtn.self_type_resolve = c.ident.name
+        expected_rtn = mkCLType('SELF_TYPE', c.ident.name)
     if (c2 is None):
         return None
     # Accd to type checking rules for methods, we only need to CHECK the 
     # method body static type and ensure it conforms to the declared return type
     if ((not conforms(cst, c, c2, expected_rtn))):
-        print(f'ERROR: {expr.f_ident.line}: Type-Check: body of method {expr.f_ident.name} with type {c2.name} does not conform to {expected_rtn.name}')
-        sys.exit()
-        return None
+        report_error(errors, CLCheckError(expr.f_ident.line, f'body of method {expr.f_ident.name} with type {c2.name} does not conform to {expected_rtn.name}'))
     # We return the declared type
     expr.s_type = me[c.ident.name, expr.f_ident.name][-1]
     return expr.s_type
 
 def tc_expr(cst: dict[str, CLClass],
-            me: dict[tuple[str, str], list[CLTypeIdent]], 
-            oe: dict[tuple[str, str], CLTypeIdent], 
+            me: CLEnv, 
+            oe: CLObjectEnv, 
             c: CLClass, 
-            expr: CLExpr) -> CLTypeIdent | None:
-    res: CLTypeIdent = None
+            expr: CLExpr,
+            errors: list[CLCheckError] | None = None) -> CLType | None:
+    """Type check an expression and all of its sub-expressions, without recursion.
+
+    Each expression is checked by a `tc_expr_step` generator, which yields every 
+    sub-expression it needs the static type of and is sent that type back. 
+    Expressions waiting on a sub-expression stay on an explicit stack, so nesting 
+    depth is only limited by memory. Checks (and errors) happen in the same order 
+    as a recursive traversal. When collecting errors, see `tc_expr_recover`
+    """
+    if (errors is not None):
+        return tc_expr_recover(cst, me, oe, c, expr, errors)
+    stack: list[Generator[CLExpr, CLType | None, CLType | None]]
+    stack = [tc_expr_step(cst, me, oe, c, expr)]
+    res: CLType | None = None
+    while (True):
+        try:
+            sub_expr = stack[-1].send(res)
+        except StopIteration as done:
+            stack.pop()
+            res = done.value
+            if (not stack):
+                return res
+        else:
+            stack.append(tc_expr_step(cst, me, oe, c, sub_expr))
+            res = None
+
+def tc_expr_recover(cst: dict[str, CLClass],
+                    me: CLEnv, 
+                    oe: CLObjectEnv, 
+                    c: CLClass, 
+                    expr: CLExpr,
+                    errors: list[CLCheckError]) -> CLType:
+    """`tc_expr` collecting errors in `errors`. An error the check of an expression 
+    raises is recorded; the scopes the check opened are closed, and the expression 
+    gets the error type, which the expression around it is sent as its static type. 
+    Each step keeps going after the errors it reports itself (see `report_error`)
+    """
+    # Each step with the expression it checks and the number of scopes open before it
+    stack: list[tuple[Generator[CLExpr, CLType | None, CLType | None], CLExpr, int]]
+    stack = [(tc_expr_step(cst, me, oe, c, expr, errors), expr, len(oe.frames))]
+    res: CLType | None = None
+    while (True):
+        try:
+            sub_expr = stack[-1][0].send(res)
+        except StopIteration as done:
+            stack.pop()
+            res = done.value
+        except CLCheckError as e:
+            errors.append(e)
+            _, failed, scopes = stack.pop()
+            while (len(oe.frames) > scopes):
+                oe.pop()
+            failed.s_type = CLERRORTYPE
+            res = CLERRORTYPE
+        else:
+            stack.append((tc_expr_step(cst, me, oe, c, sub_expr, errors), sub_expr, len(oe.frames)))
+            res = None
+            continue
+        if (not stack):
+            return res
+
+def tc_expr_step(cst: dict[str, CLClass],
+                 me: CLEnv, 
+                 oe: CLObjectEnv, 
+                 c: CLClass, 
+                 expr: CLExpr,
+                 errors: list[CLCheckError] | None = None) -> Generator[CLExpr, CLType | None, CLType | None]:
+    """Generator step of `tc_expr` for one expression: yields each sub-expression 
+    to check, and returns the static type of `expr`"""
+    res: CLType = None
     match expr.type:
         case 'integer'|'string'|'true'|'false'|'internal':
             res = tc_const(expr.body)
         case 'identifier':
             if (((c.ident.name, expr.body.name) not in oe)):
-                print(f'ERROR: {expr.body.line}: Type-Check: unbound variable {expr.body.name}')
-                sys.exit()
-                return None
+                raise CLCheckError(expr.body.line, f'unbound variable {expr.body.name}')
             if (not (isinstance(expr.body, CLVarIdent) or isinstance(expr.body, CLSelfIdent))):
-                print(f'not an identifier..?')
-                sys.exit()
-                return None
-            res = tc_var(oe, c, expr.body)
-            if (res.name == 'SELF_TYPE'):
-                res.self_type_resolve = c.ident.name
+                raise CLCheckError(expr.line_num, 'not an identifier..?', 'not an identifier..?')
+            res = tc_var(oe, c, expr.body)     # SELF_TYPE is looked up as SELF_TYPE_c
         case 'assign':
             expr_assign: CLAssign = expr.body
-            res = tc_assign(cst, me, oe, c, expr_assign.rhs, expr_assign.var)
+            res = yield from tc_assign(cst, me, oe, c, expr_assign.rhs, expr_assign.var)
             if (res is None):
-                print(f'ERROR: {expr.line_num}: Type-Check: rhs does not conform to {oe[(c.ident.name, expr.body.var.name)]}')
-                sys.exit()
-                return None
+                raise CLCheckError(expr.line_num, f'rhs does not conform to {oe[(c.ident.name, expr.body.var.name)]}')
             expr_assign.s_type = res
         case 'new':
             expr_new: CLNew = expr.body
             if (expr_new.type_id.name != 'SELF_TYPE' and expr_new.type_id.name not in cst):
-                print(f'ERROR: {expr_new.type_id.line}: Type-Check: unknown type {expr_new.type_id.name}')
-                sys.exit()
-                return None
+                raise CLCheckError(expr_new.type_id.line, f'unknown type {expr_new.type_id.name}')
             res = tc_new(c, expr_new.type_id)
-            if (res.name == 'SELF_TYPE'):
-                res.self_type_resolve = c.ident.name
             expr_new.s_type = res
         case 'isvoid':
             expr_isvoid: CLIsvoid = expr.body
-            res = tc_isvoid(cst, me, oe, c, expr_isvoid)
+            res = yield from tc_isvoid(cst, me, oe, c, expr_isvoid)
         case 'plus'|'minus'|'times'|'divide':
             expr_arith: (CLPlus|CLMinus|CLTimes|CLDivide) = expr.body
-            res = tc_arith(cst, me, oe, c, expr_arith)
+            res = yield from tc_arith(cst, me, oe, c, expr_arith)
             if (res is None):
-                print(f'ERROR: {expr.line_num}: Type-Check: Non-integer types used in arithmetic')
-                sys.exit()
-                return None
+                raise CLCheckError(expr.line_num, 'Non-integer types used in arithmetic')
             expr_arith.s_type = res
         case 'lt'|'le'|'eq':
             expr_cmp: (CLLT|CLLE|CLEQ) = expr.body
-            res = tc_equal(cst, me, oe, c, expr_cmp)
+            res = yield from tc_equal(cst, me, oe, c, expr_cmp)
             if (res is None):
-                print(f'ERROR: {expr.line_num}: Type-Check: Incompatible type comparison')
-                sys.exit()
-                return None
+                raise CLCheckError(expr.line_num, 'Incompatible type comparison')
             expr_cmp.s_type = res
         case 'not':
             expr_not: CLNOT = expr.body
-            res = tc_not(cst, me, oe, c, expr_not)
+            res = yield from tc_not(cst, me, oe, c, expr_not)
             if (res is None):
-                print(f'ERROR: {expr.line_num}: Type-Check: not applied to non-boolean type')
-                sys.exit()
-                return None
+                raise CLCheckError(expr.line_num, 'not applied to non-boolean type')
             expr_not.s_type = res
         case 'negate':
             expr_neg: CLNegate = expr.body
-            res = tc_neg(cst, me, oe, c, expr_neg)
+            res = yield from tc_neg(cst, me, oe, c, expr_neg)
             if (res is None):
-                print(f'ERROR: {expr.line_num}: Type-Check: negate applied to non-integer type')
-                sys.exit()
-                return None
+                raise CLCheckError(expr.line_num, 'negate applied to non-integer type')
             expr_neg.s_type = res
         case 'block':
             expr_block: CLBlock = expr.body
-            res = tc_sequence(cst, me, oe, c, expr_block)
+            res = yield from tc_sequence(cst, me, oe, c, expr_block)
             if (res is None):
-                print(f'ERROR: {expr.line_num}: empty block expr not allowed')
-                sys.exit()
-                return None
+                raise CLCheckError(expr.line_num, 'empty block expr not allowed',
+                                   f'ERROR: {expr.line_num}: empty block expr not allowed')
             expr_block.s_type = res
         case 'dynamic_dispatch':
             expr_dyn_disp: CLDynDispatch = expr.body
-            res = tc_dispatch(cst, me, oe, c, 
-                              expr_dyn_disp.caller, 
-                              expr_dyn_disp.method_name, 
-                              expr_dyn_disp.args)
-            if (res.name == 'SELF_TYPE'):
-                expr_dyn_disp.s_type = expr_dyn_disp.caller.s_type
-                res = CLTypeIdent(res.line, expr_dyn_disp.s_type.name)
-                if (res.name == 'SELF_TYPE'):
-                    res.self_type_resolve = expr_dyn_disp.s_type.self_type_resolve
-            else:
-                expr_dyn_disp.s_type = res
+            res = yield from tc_dispatch(cst, me, oe, c, 
+                                         expr_dyn_disp.caller, 
+                                         expr_dyn_disp.method_name, 
+                                         expr_dyn_disp.args)
+            if (res.name == 'SELF_TYPE'):   # The method's formal return type is SELF_TYPE
+                res = expr_dyn_disp.caller.s_type
+            expr_dyn_disp.s_type = res
         case 'self_dispatch':
             expr_self_disp: CLSelfDispatch = expr.body
-            self_caller = CLExpr(expr_self_disp.method_name.line, 
-                                 'identifier', 
-                                 CLSelfIdent(expr_self_disp.method_name.line, 'self')) 
-            res = tc_dispatch(cst, me, oe, c, 
-                              self_caller,
-                              expr_self_disp.method_name, 
-                              expr_self_disp.args)
+            # The caller is `self`
+            res = yield from tc_dispatch(cst, me, oe, c, 
+                                         None,
+                                         expr_self_disp.method_name, 
+                                         expr_self_disp.args)
             if (res.name == 'SELF_TYPE'):   # The method's formal return type is SELF_TYPE
-                expr_self_disp.s_type = self_caller.s_type
-                res = CLTypeIdent(res.line, expr_self_disp.s_type.name)
-                if (res.name == 'SELF_TYPE'):   # The caller's static type is SELF_TYPE
-                    res.self_type_resolve = expr_self_disp.s_type.self_type_resolve
-            else:
-                expr_self_disp.s_type = res
+                res = oe[(c.ident.name, 'self')]
+            expr_self_disp.s_type = res
         case 'static_dispatch':
             expr_disp: CLStaticDispatch = expr.body
             if (expr_disp.type.name not in cst):
-                print(f'ERROR: {expr_disp.type.line}: unknown type {expr_disp.type.name}')
-                sys.exit()
-                return None
-            res = tc_static_dispatch(cst, me, oe, c, 
-                                     expr_disp.caller, 
-                                     expr_disp.type, 
-                                     expr_disp.method_name, 
-                                     expr_disp.args)
-            if (res.name == 'SELF_TYPE'):
-                expr_disp.s_type = expr_disp.caller.s_type
-                res = CLTypeIdent(res.line, expr_disp.s_type.name)
-            else:
-                expr_disp.s_type = res
+                raise CLCheckError(expr_disp.type.line, f'unknown type {expr_disp.type.name}',
+                                   f'ERROR: {expr_disp.type.line}: unknown type {expr_disp.type.name}')
+            res = yield from tc_static_dispatch(cst, me, oe, c, 
+                                                expr_disp.caller, 
+                                                expr_disp.type, 
+                                                expr_disp.method_name, 
+                                                expr_disp.args)
+            if (res.name == 'SELF_TYPE'):   # The method's formal return type is SELF_TYPE
+                res = expr_disp.caller.s_type
+            expr_disp.s_type = res
         case 'if':
             expr_if: CLIf = expr.body
-            res = tc_if(cst, me, oe, c, expr_if)
+            res = yield from tc_if(cst, me, oe, c, expr_if, errors, expr.line_num)
             if (res is None):
-                print(f'ERROR: {expr.line_num}: Type-Check: error in if expression')
-                sys.exit()
-                return None
+                raise CLCheckError(expr.line_num, 'error in if expression')
             expr_if.s_type = res
         case 'while':
             expr_while: CLWhile = expr.body
-            res = tc_loop(cst, me, oe, c, expr_while)
+            res = yield from tc_loop(cst, me, oe, c, expr_while, errors, expr.line_num)
             if (res is None):
-                print(f'ERROR: {expr.line_num}: Type-Check: error in while expression')
-                sys.exit()
-                return None
+                raise CLCheckError(expr.line_num, 'error in while expression')
             expr_while.s_type = res
         case 'let':
             expr_let: CLLet = expr.body
-            res = tc_let(cst, me, oe, c, 
-                         expr_let.bind_list, 
-                         expr_let.let_body)
+            res = yield from tc_let(cst, me, oe, c, 
+                                    expr_let.bind_list, 
+                                    expr_let.let_body,
+                                    errors, expr.line_num)
             if (res is None):
-                print(f'ERROR: {expr.line_num}: Type-Check: binding does not conform in let initialization')
-                sys.exit()
-                return None
+                raise CLCheckError(expr.line_num, 'binding does not conform in let initialization')
             expr_let.s_type = res
         case 'case':
             expr_case: CLCase = expr.body
-            res = tc_case(cst, me, oe, c, expr_case)
+            res = yield from tc_case(cst, me, oe, c, expr_case, errors)
             if (res is None):
-                print(f'ERROR: {expr.line_num}: Type-Check: Error with LUB in case')
-                sys.exit()
-                return None
+                raise CLCheckError(expr.line_num, 'Error with LUB in case')
             expr_case.s_type = res
         case _:
-            print(f'ERROR: {expr.line_num}: Type-Check: expr is not in language')
-            sys.exit()
-            return None
+            raise CLCheckError(expr.line_num, 'expr is not in language')
     expr.s_type = res
     return res
 
-def tc_const(id: CLConstant) -> CLTypeIdent:
+def tc_const(id: CLConstant) -> CLType:
     return id.type
 
-def tc_var(oe: dict[tuple[str, str], CLTypeIdent], 
+def tc_var(oe: CLObjectEnv, 
            c: CLClass, 
-           id: CLVarIdent|CLSelfIdent) -> CLTypeIdent | None:
-    if ((c.ident.name, id.name) in oe.keys()): 
+           id: CLVarIdent|CLSelfIdent) -> CLType | None:
+    if ((c.ident.name, id.name) in oe): 
         return oe[(c.ident.name, id.name)]
     return None
 
 def tc_assign(cst: dict[str, CLClass],
-              me: dict[tuple[str, str], list[CLTypeIdent]],
-              oe: dict[tuple[str, str], CLTypeIdent], 
+              me: CLEnv,
+              oe: CLObjectEnv, 
               c: CLClass, 
               expr: CLExpr,
-              id: CLVarIdent) -> CLTypeIdent | None:
+              id: CLVarIdent) -> Generator[CLExpr, CLType | None, CLType | None]:
     c1 = tc_var(oe, c, id)
     if (c1 is None):
-        print(f'ERROR: {id.line}: unbound variable {id.name} in assign')
-        sys.exit()
-        return None
-    c2 = tc_expr(cst, me, oe, c, expr)
+        raise CLCheckError(id.line, f'unbound variable {id.name} in assign',
+                           f'ERROR: {id.line}: unbound variable {id.name} in assign')
+    c2 = (yield expr)
     if ((c2 is not None) and (conforms(cst, c, c2, oe[c.ident.name, id.name]))):
         return c2
     return None
 
-def tc_new(c: CLClass, t_id: CLTypeIdent) -> CLTypeIdent:
+def tc_new(c: CLClass, t_id: CLTypeIdent) -> CLType:
     if (t_id.name == 'SELF_TYPE'):
-        t_id.self_type_resolve = c.ident.name
-    return t_id
+        return mkCLType('SELF_TYPE', c.ident.name)
+    return mkCLType(t_id.name)
 
 def tc_dispatch(cst: dict[str, CLClass],
-                me: dict[tuple[str, str], list[CLTypeIdent]],
-                oe: dict[tuple[str, str], CLTypeIdent], 
+                me: CLEnv,
+                oe: CLObjectEnv, 
                 c: CLClass, 
-                caller: CLExpr,
+                caller: CLExpr | None,
                 m_name: CLMethodIdent,
-                args: list[CLExpr]) -> CLTypeIdent | None:
+                args: list[CLExpr]) -> Generator[CLExpr, CLType | None, CLType | None]:
     # "To type check a dispatch, each of the subexpressions must first be type checked"
     # The type T0 of e0 determines which declaration of the method f is used
-    # 1) Type check the caller object
-    subexpr_types: list[CLTypeIdent] = [tc_expr(cst, me, oe, c, caller)]
+    # 1) Type check the caller object; None for a self dispatch, whose caller is `self`
+    subexpr_types: list[CLType] = [(yield caller) if (caller is not None) else oe[(c.ident.name, 'self')]]
     # 2) Type check each argument and append the result to subexpr_types
     for arg in args:
-        subexpr_types.append(tc_expr(cst, me, oe, c, arg))
+        subexpr_types.append((yield arg))
+    # A caller that failed to check has no methods to look up
+    if (subexpr_types[0] is CLERRORTYPE):
+        return CLERRORTYPE
     # 3) Resolve SELF_TYPE if the caller is of type SELF_TYPE
     t_0prime = subexpr_types[0].self_type_resolve if subexpr_types[0].name == 'SELF_TYPE' else subexpr_types[0].name
     # 4) Then check the caller indeed has access to the method being dispatched
     if ((t_0prime, m_name.name) not in me):
-        print(f'ERROR: {m_name.line}: Type-Check: unknown method {m_name.name}')
-        sys.exit()
-        return None
+        raise CLCheckError(m_name.line, f'unknown method {m_name.name}')
     # 5) Then compare the formal method signature against the provided args
     m_signature = me[(t_0prime, m_name.name)]
-    m_decl_ret = copy.deepcopy(m_signature[-1])
+    m_decl_ret = m_signature[-1]
+    if (len(args) != len(m_signature) - 1):
+        raise CLCheckError(m_name.line, f'wrong number of actual arguments ({len(args)} vs. {len(m_signature) - 1})')
     # "The argument types of the dispatch must conform to the declared argument types"
     for i in range(0, len(m_signature) - 1):
         if (not conforms(cst, c, subexpr_types[i + 1], m_signature[i])):
-            print(f'ERROR: {m_name.line}: Type-Check: argument #{i+1} in dispatch does not conform to declared formal param type {m_signature[i]}')
-            sys.exit()
-            return None
+            raise CLCheckError(m_name.line, f'argument #{i+1} in dispatch does not conform to declared formal param type {m_signature[i]}')
 
     if (m_decl_ret.name == 'SELF_TYPE'):
-        m_decl_ret.self_type_resolve = subexpr_types[0].self_type_resolve if subexpr_types[0].name == 'SELF_TYPE' else subexpr_types[0].name
+        m_decl_ret = mkCLType('SELF_TYPE', t_0prime)
     return m_decl_ret
 
 def tc_static_dispatch(cst: dict[str, CLClass],
-                       me: dict[tuple[str, str], list[CLTypeIdent]],
-                       oe: dict[tuple[str, str], CLTypeIdent], 
+                       me: CLEnv,
+                       oe: CLObjectEnv, 
                        c: CLClass, 
                        caller: CLExpr,
                        called_class: CLTypeIdent,
                        m_name: CLMethodIdent,
-                       args: list[CLExpr]) -> CLTypeIdent | None:
+                       args: list[CLExpr]) -> Generator[CLExpr, CLType | None, CLType | None]:
     # "To type check a dispatch, each of the subexpressions must first be type checked"
-    subexpr_types: list[CLTypeIdent] = [tc_expr(cst, me, oe, c, caller)]
+    subexpr_types: list[CLType] = [(yield caller)]
     for arg in args:
-        subexpr_types.append(tc_expr(cst, me, oe, c, arg))
+        subexpr_types.append((yield arg))
 
-    if (not conforms(cst, c, subexpr_types[0], called_class)):
-        print(f'ERROR: {caller.line_num}: Type-Check: caller object does not conform to static class {called_class.name}')
-        sys.exit()
-        return None
+    if (not conforms(cst, c, subexpr_types[0], mkCLType(called_class.name))):
+        raise CLCheckError(caller.line_num, f'caller object does not conform to static class {called_class.name}')
     if ((called_class.name, m_name.name) not in me):
-        print(f'ERROR: {m_name.line}: Type-Check: unknown method {m_name.name}')
-        sys.exit()
-        return None
+        raise CLCheckError(m_name.line, f'unknown method {m_name.name}')
     m_signature = me[(called_class.name, m_name.name)]
+    if (len(args) != len(m_signature) - 1):
+        raise CLCheckError(m_name.line, f'wrong number of actual arguments ({len(args)} vs. {len(m_signature) - 1})')
 
     # "The argument types of the dispatch must conform to the declared argument types"
     for i in range(0, len(m_signature) - 1):
         if (not conforms(cst, c, subexpr_types[i + 1], m_signature[i])):
-            print(f'ERROR: {m_name.line}: Type-Check: argument #{i+1} in dispatch does not conform to declared formal param type {m_signature[i]}')
-            sys.exit()
-            return None
+            raise CLCheckError(m_name.line, f'argument #{i+1} in dispatch does not conform to declared formal param type {m_signature[i]}')
 
     return m_signature[-1]
 
 def tc_if(cst: dict[str, CLClass],
-          me: dict[tuple[str, str], list[CLTypeIdent]], 
-          oe: dict[tuple[str, str], CLTypeIdent], 
+          me: CLEnv, 
+          oe: CLObjectEnv, 
           c: CLClass, 
-          expr: CLIf) -> CLTypeIdent | None:
-    c1 = tc_expr(cst, me, oe, c, expr.pred)
-    if (c1.name != 'Bool'):
-        return None
-    c2 = tc_expr(cst, me, oe, c, expr.true_case)
-    c3 = tc_expr(cst, me, oe, c, expr.false_case)
+          expr: CLIf,
+          errors: list[CLCheckError] | None = None,
+          line: int = 0) -> Generator[CLExpr, CLType | None, CLType | None]:
+    c1 = (yield expr.pred)
+    if ((c1.name != 'Bool') and (c1 is not CLERRORTYPE)):
+        # Reported here, so the branches are still checked when collecting errors
+        report_error(errors, CLCheckError(line, 'error in if expression'))
+    c2 = (yield expr.true_case)
+    c3 = (yield expr.false_case)
     if ((c2 is not None) and (c3 is not None)):
         return join(cst, c2, c3)
     return None
 
 def tc_sequence(cst: dict[str, CLClass],
-                me: dict[tuple[str, str], list[CLTypeIdent]], 
-                oe: dict[tuple[str, str], CLTypeIdent], 
+                me: CLEnv, 
+                oe: CLObjectEnv, 
                 c: CLClass, 
-                expr: CLBlock) -> CLTypeIdent | None:
+                expr: CLBlock) -> Generator[CLExpr, CLType | None, CLType | None]:
     if (len(expr.expr_list) == 0):
         return None
     for e in expr.expr_list:
         if e is expr.expr_list[-1]:
-            return tc_expr(cst, me, oe, c, e)
-        if (tc_expr(cst, me, oe, c, e) is None):
+            return (yield e)
+        if ((yield e) is None):
             return None
 
 def tc_let(cst: dict[str, CLClass],
-           me: dict[tuple[str, str], list[CLTypeIdent]], 
-           oe: dict[tuple[str, str], CLTypeIdent], 
+           me: CLEnv, 
+           oe: CLObjectEnv, 
            c: CLClass, 
            bindings: list[CLLetBindingElem],
-           expr_body: CLExpr) -> CLTypeIdent | None:
-    # idea is to recurse into itself for each binding, where previous bindings are visible in the next
-    if (len(bindings) > 0):
-        if ((bindings[0].v_type.name != 'SELF_TYPE') and (bindings[0].v_type.name not in cst)):
-            print(f'ERROR: {bindings[0].v_type.line}: unknown type {bindings[0].v_type.name}')
-            sys.exit()
-            return None
-        t_prime_0 = bindings[0].v_type
-        if (bindings[0].v_type.name == 'SELF_TYPE'):
-            t_prime_0.self_type_resolve = c.ident.name
+           expr_body: CLExpr,
+           errors: list[CLCheckError] | None = None,
+           line: int = 0) -> Generator[CLExpr, CLType | None, CLType | None]:
+    # idea is to open a scope for each binding, where previous bindings are visible in the next
+    scopes = 0
+    for binding in bindings:
+        if ((binding.v_type.name != 'SELF_TYPE') and (binding.v_type.name not in cst)):
+            report_error(errors, CLCheckError(binding.v_type.line, f'unknown type {binding.v_type.name}',
+                                              f'ERROR: {binding.v_type.line}: unknown type {binding.v_type.name}'))
+            t_prime_0 = CLERRORTYPE
+        elif (binding.v_type.name == 'SELF_TYPE'):
+            t_prime_0 = mkCLType('SELF_TYPE', c.ident.name)
+        else:
+            t_prime_0 = mkCLType(binding.v_type.name)
 
-        if (bindings[0].bind_type == 'let_binding_init'):
-            t_1 = tc_expr(cst, me, oe, c, bindings[0].v_init)
+        if (binding.bind_type == 'let_binding_init'):
+            t_1 = (yield binding.v_init)
             if (t_1 is None):
-                print(f'expr from let in line {bindings[0].v_init.line_num} is none')
-                sys.exit()
-                return None
+                raise CLCheckError(binding.v_init.line_num, 'let initializer has no type',
+                                   f'expr from let in line {binding.v_init.line_num} is none')
             elif (not conforms(cst, c, t_1, t_prime_0)):
-                return None
-        if (bindings[0].v_name.name == 'self'):
-            print(f'ERROR: {bindings[0].v_name.line}: Type-Check: binding to self not allowed in let')
-            sys.exit()
-            return None
-        oe_ext = copy.deepcopy(oe)
-        oe_ext.update({(c.ident.name, bindings[0].v_name.name): t_prime_0})
-        return tc_let(cst, me, oe_ext, c, bindings[1:], expr_body)
-    else:   # No more bindings to extend the object env with
-        return tc_expr(cst, me, oe, c, expr_body)
+                if (errors is None):
+                    for i in range(scopes):
+                        oe.pop()
+                    return None
+                # Reported here, so the bindings after it and the body are still checked
+                errors.append(CLCheckError(line, 'binding does not conform in let initialization'))
+        if (binding.v_name.name == 'self'):
+            report_error(errors, CLCheckError(binding.v_name.line, 'binding to self not allowed in let'))
+            t_prime_0 = CLERRORTYPE
+        oe.push({(c.ident.name, binding.v_name.name): t_prime_0})
+        scopes += 1
+    # No more bindings to extend the object env with
+    rtn = (yield expr_body)
+    for i in range(scopes):
+        oe.pop()
+    return rtn
 
 def tc_case(cst: dict[str, CLClass],
-            me: dict[tuple[str, str], list[CLTypeIdent]], 
-            oe: dict[tuple[str, str], CLTypeIdent], 
+            me: CLEnv, 
+            oe: CLObjectEnv, 
             c: CLClass, 
-            expr: CLCase) -> CLTypeIdent | None:
-    t_0 = tc_expr(cst, me, oe, c, expr.c_expr)
+            expr: CLCase,
+            errors: list[CLCheckError] | None = None) -> Generator[CLExpr, CLType | None, CLType | None]:
+    t_0 = (yield expr.c_expr)
     if (t_0 is None):
         return None
     
     visited: set[str] = set()
-    branch_types: list[CLTypeIdent] = []
+    branch_types: list[CLType] = []
     for branch in expr.c_list:
+        # When collecting errors, a branch in error is still checked, its variable
+        # bound to the error type if it can't be bound as written
+        b_type = mkCLType(branch.type.name)
         if (branch.type.name not in cst):
-            print(f'ERROR: {branch.type.line}: Type-Check: unknown type {branch.type.name}')
-            sys.exit()
-            return None
+            report_error(errors, CLCheckError(branch.type.line, f'unknown type {branch.type.name}'))
+            b_type = CLERRORTYPE
         if (branch.type.name in visited):
-            print(f'ERROR: {branch.ident.line}: Type-Check: case branch type {branch.type.line} is bound twice')
-            sys.exit()
-            return None
+            report_error(errors, CLCheckError(branch.ident.line, f'case branch type {branch.type.line} is bound twice'))
         if (branch.ident.name == 'self'):
-            print(f'ERROR: {branch.ident.line}: Type-Check: bind to self in case not allowed')
-            sys.exit()
-            return None
-        if (branch.type.name == 'SELF_TYPE'):
-            print(f'ERROR: {branch.type.line}: Type-Check: using SELF_TYPE as case branch type not allowed')
-            sys.exit()
-            return None
-        oe_ext = copy.deepcopy(oe)
-        oe_ext.update({(c.ident.name, branch.ident.name): branch.type})
+            report_error(errors, CLCheckError(branch.ident.line, 'bind to self in case not allowed'))
+            b_type = CLERRORTYPE
+        # (SELF_TYPE is no class, so this is only reached if a class was named so)
+        if ((branch.type.name == 'SELF_TYPE') and (branch.type.name in cst)):
+            report_error(errors, CLCheckError(branch.type.line, 'using SELF_TYPE as case branch type not allowed'))
+            b_type = CLERRORTYPE
         visited.add(branch.type.name)
         # Evaluate static type of each branch
-        branch_type = tc_expr(cst, me, oe_ext, c, branch.body)
+        oe.push({(c.ident.name, branch.ident.name): b_type})
+        branch_type = (yield branch.body)
+        oe.pop()
         if (branch_type is None):
             return None
         # Then add to list of evaluated static types
@@ -688,222 +871,273 @@ def tc_case(cst: dict[str, CLClass],
     return join_case(cst, branch_types)
 
 def tc_loop(cst: dict[str, CLClass],
-            me: dict[tuple[str, str], list[CLTypeIdent]], 
-            oe: dict[tuple[str, str], CLTypeIdent], 
+            me: CLEnv, 
+            oe: CLObjectEnv, 
             c: CLClass, 
-            expr: CLWhile) -> CLTypeIdent | None:
-    if ((tc_expr(cst, me, oe, c, expr.pred).name != 'Bool') or
-        (tc_expr(cst, me, oe, c, expr.body) is None)):
+            expr: CLWhile,
+            errors: list[CLCheckError] | None = None,
+            line: int = 0) -> Generator[CLExpr, CLType | None, CLType | None]:
+    c1 = (yield expr.pred)
+    if ((c1.name != 'Bool') and (c1 is not CLERRORTYPE)):
+        # Reported here, so the body is still checked when collecting errors
+        report_error(errors, CLCheckError(line, 'error in while expression'))
+    if ((yield expr.body) is None):
         return None
-    return CLTypeIdent(expr.pred.line_num, 'Object')
+    return CLOBJECTTYPE
 
 def tc_isvoid(cst: dict[str, CLClass],
-              me: dict[tuple[str, str], list[CLTypeIdent]], 
-              oe: dict[tuple[str, str], CLTypeIdent], 
+              me: CLEnv, 
+              oe: CLObjectEnv, 
               c: CLClass, 
-              expr: CLIsvoid) -> CLTypeIdent | None:
-    if (tc_expr(cst, me, oe, c, expr.expr) is None):
+              expr: CLIsvoid) -> Generator[CLExpr, CLType | None, CLType | None]:
+    if ((yield expr.expr) is None):
         return None
-    return CLTypeIdent(expr.expr.line_num, 'Bool')
+    return CLBOOLTYPE
 
 def tc_not(cst: dict[str, CLClass],
-           me: dict[tuple[str, str], list[CLTypeIdent]], 
-           oe: dict[tuple[str, str], CLTypeIdent], 
+           me: CLEnv, 
+           oe: CLObjectEnv, 
            c: CLClass, 
-           expr: CLNOT) -> CLTypeIdent | None:
-    c1 = tc_expr(cst, me, oe, c, expr.expr)
-    if ((c1 is None) or (c1.name != 'Bool')):
+           expr: CLNOT) -> Generator[CLExpr, CLType | None, CLType | None]:
+    c1 = (yield expr.expr)
+    if ((c1 is None) or ((c1.name != 'Bool') and (c1 is not CLERRORTYPE))):
         return None
-    return c1
+    return CLBOOLTYPE
 
 def tc_neg(cst: dict[str, CLClass],
-           me: dict[tuple[str, str], list[CLTypeIdent]], 
-           oe: dict[tuple[str, str], CLTypeIdent], 
+           me: CLEnv, 
+           oe: CLObjectEnv, 
            c: CLClass, 
-           expr: CLNegate) -> CLTypeIdent | None:
-    c1 = tc_expr(cst, me, oe, c, expr.expr)
-    if ((c1 is None) or (c1.name != 'Int')):
+           expr: CLNegate) -> Generator[CLExpr, CLType | None, CLType | None]:
+    c1 = (yield expr.expr)
+    if ((c1 is None) or ((c1.name != 'Int') and (c1 is not CLERRORTYPE))):
         return None
-    return c1
+    return CLINTTYPE
 
 def tc_arith(cst: dict[str, CLClass],
-             me: dict[tuple[str, str], list[CLTypeIdent]], 
-             oe: dict[tuple[str, str], CLTypeIdent], 
+             me: CLEnv, 
+             oe: CLObjectEnv, 
              c: CLClass, 
-             expr: CLPlus|CLMinus|CLTimes|CLDivide) -> CLTypeIdent | None:
+             expr: CLPlus|CLMinus|CLTimes|CLDivide) -> Generator[CLExpr, CLType | None, CLType | None]:
     if (not ((isinstance(expr, CLPlus)) or 
              (isinstance(expr, CLMinus)) or 
              (isinstance(expr, CLDivide)) or 
              (isinstance(expr, CLTimes)))):
         return None
-    c1 = tc_expr(cst, me, oe, c, expr.lhs)
-    c2 = tc_expr(cst, me, oe, c, expr.rhs)
+    c1 = (yield expr.lhs)
+    c2 = (yield expr.rhs)
     if (((c1 is None) or (c2 is None)) or
-        ((c1.name != 'Int') or (c2.name != 'Int'))):
+        ((c1.name != 'Int') and (c1 is not CLERRORTYPE)) or 
+        ((c2.name != 'Int') and (c2 is not CLERRORTYPE))):
         return None
     
-    return c1
+    return CLINTTYPE
 
 def tc_equal(cst: dict[str, CLClass],
-             me: dict[tuple[str, str], list[CLTypeIdent]], 
-             oe: dict[tuple[str, str], CLTypeIdent], 
+             me: CLEnv, 
+             oe: CLObjectEnv, 
              c: CLClass, 
-             expr: CLEQ|CLLT|CLLE) -> CLTypeIdent | None:
-    c1 = tc_expr(cst, me, oe, c, expr.lhs)
-    c2 = tc_expr(cst, me, oe, c, expr.rhs)
+             expr: CLEQ|CLLT|CLLE) -> Generator[CLExpr, CLType | None, CLType | None]:
+    c1 = (yield expr.lhs)
+    c2 = (yield expr.rhs)
     consts = set(('Int', 'String', 'Bool'))
     if ((c1 is None) or (c2 is None) or
         ((c1.name in consts) or (c2.name in consts)) and 
-        (c1.name != c2.name)):
+        (c1.name != c2.name) and (c1 is not CLERRORTYPE) and (c2 is not CLERRORTYPE)):
         return None
     
-    return CLTypeIdent(expr.lhs.line_num, 'Bool')
+    return CLBOOLTYPE
 
 """Print functions"""
-def print_class_map(cst: dict[str,CLClass]):
-    """Print class map accd to `spec <https://kelloggm.github.io/martinjkellogg.com/teaching/cs485-sp25/projects/pa2.html>`_"""
+def emit_class_map(em: CLEmitter, cst: dict[str,CLClass]):
+    """Emit class map accd to `spec <https://kelloggm.github.io/martinjkellogg.com/teaching/cs485-sp25/projects/pa2.html>`_"""
     cm = gen_class_map_a(cst)
-    print('class_map')
-    print(len(cst))
+    em.lines(('class_map', len(cst)))
     for c in cm:
-        print(c[0])
-        print(len(c[1]))
+        em.lines((c[0], len(c[1])))
         for att in c[1]:
             has_init = (not isinstance(att[2], CLConstant))
             if (not has_init):
-                print('no_initializer')
-                print(att[0])
-                print(att[1])
+                em.lines(('no_initializer', att[0], att[1]))
             else:
-                print('initializer')
-                print(att[0])
-                print(att[1])
-                CLExpr_print(att[2])
+                em.lines(('initializer', att[0], att[1]))
+                emit_shared_expr(em, att[2])
 
-def print_implementation_map(cst: dict[str,CLClass]):
-    """Print implementation map accd to `spec <https://kelloggm.github.io/martinjkellogg.com/teaching/cs485-sp25/projects/pa2.html>`_"""
+def emit_implementation_map(em: CLEmitter, cst: dict[str,CLClass]):
+    """Emit implementation map accd to `spec <https://kelloggm.github.io/martinjkellogg.com/teaching/cs485-sp25/projects/pa2.html>`_"""
     im = gen_implementation_map(cst)
-    print('implementation_map')
-    print(len(cst))
+    em.lines(('implementation_map', len(cst)))
     for it in im:
-        print(it[0])
-        print(len(it[1]))
+        em.lines((it[0], len(it[1])))
         for m in it[1]:
-            print(m[0].f_ident.name)
-            print(len(m[0].m_formals))
-            for f in m[0].m_formals:
-                print(f.name.name)
-            print(m[1].ident.name)
-            CLExpr_print(m[0].m_body)
+            em.lines((m[0].f_ident.name, len(m[0].m_formals)))
+            em.lines([f.name.name for f in m[0].m_formals])
+            em.line(m[1].ident.name)
+            emit_shared_expr(em, m[0].m_body)
 
-def print_parent_map(cst: dict[str,CLClass]):
-    """Print parent map accd to `spec <https://kelloggm.github.io/martinjkellogg.com/teaching/cs485-sp25/projects/pa2.html>`_"""
+def emit_parent_map(em: CLEmitter, cst: dict[str,CLClass]):
+    """Emit parent map accd to `spec <https://kelloggm.github.io/martinjkellogg.com/teaching/cs485-sp25/projects/pa2.html>`_"""
     pm = gen_parent_map(cst)
-    print('parent_map')
-    print(len(pm))
+    em.lines(('parent_map', len(pm)))
     for it in pm:
-        print(it[0])
-        print(it[1])
+        em.lines(it)
 
-def print_annot_ast(ast: CLAST):
-    """Print annotated AST accd to `spec <https://kelloggm.github.io/martinjkellogg.com/teaching/cs485-sp25/projects/pa2.html>`_"""
-    print(len(ast.classes))
+def emit_annot_ast(em: CLEmitter, ast: CLAST):
+    """Emit annotated AST accd to `spec <https://kelloggm.github.io/martinjkellogg.com/teaching/cs485-sp25/projects/pa2.html>`_"""
+    em.line(len(ast.classes))
     for c in ast.classes:
-        CLIdent_print(c.ident)
+        emit_ident(em, c.ident)
         if (c.inherits):
-            print('inherits')
-            CLIdent_print(c.superclass)
+            em.line('inherits')
+            emit_ident(em, c.superclass)
         else:
-            print('no_inherits')
-        print(len(c.features))
+            em.line('no_inherits')
+        em.line(len(c.features))
         for f in c.features:
-            print(f.f_type)
+            em.line(f.f_type)
             match f.f_type:
                 case 'attribute_no_init':
-                    CLIdent_print(f.f_ident)
-                    CLIdent_print(f.att_type)
+                    emit_ident(em, f.f_ident)
+                    emit_ident(em, f.att_type)
                 case 'attribute_init':
-                    CLIdent_print(f.f_ident)
-                    CLIdent_print(f.att_type)
-                    CLExpr_print(f.att_init)
+                    emit_ident(em, f.f_ident)
+                    emit_ident(em, f.att_type)
+                    emit_shared_expr(em, f.att_init)
                 case 'method':
-                    CLIdent_print(f.f_ident)
-                    print(len(f.m_formals))
+                    emit_ident(em, f.f_ident)
+                    em.line(len(f.m_formals))
                     for fl in f.m_formals:
-                        CLIdent_print(fl.name)
-                        CLIdent_print(fl.type)
-                    CLIdent_print(f.m_type)
-                    CLExpr_print(f.m_body)
+                        emit_ident(em, fl.name)
+                        emit_ident(em, fl.type)
+                    emit_ident(em, f.m_type)
+                    emit_shared_expr(em, f.m_body)
 
-def CLExpr_print(e: CLExpr):
-    print(e.line_num)                               # Output line num of expr
-    print(e.s_type)                                 # Output type associated with the expr
-    print(e.type)                                   # Output name of expression
-    match(e.type):
-        case 'true'|'false':
-            pass
-        case 'integer'|'string'|'internal':
-            print(e.body.value)
-        case 'identifier':
-            CLIdent_print(e.body)
-        case 'new':
-            CLIdent_print(e.body.type_id)
-        case 'assign':
-            CLIdent_print(e.body.var)
-            CLExpr_print(e.body.rhs)
-        case 'isvoid'|'not'|'negate':
-            CLExpr_print(e.body.expr)
-        case 'plus'|'minus'|'times'|'divide'|'lt'|'le'|'eq':
-            CLExpr_print(e.body.lhs)
-            CLExpr_print(e.body.rhs)
-        case 'while':
-            CLExpr_print(e.body.pred)
-            CLExpr_print(e.body.body)
-        case 'if':
-            CLExpr_print(e.body.pred)
-            CLExpr_print(e.body.true_case)
-            CLExpr_print(e.body.false_case)
-        case 'block':
-            print(len(e.body.expr_list))
-            for ex in e.body.expr_list:
-                CLExpr_print(ex)
-        case 'self_dispatch':
-            CLIdent_print(e.body.method_name)
-            print(len(e.body.args))
-            for arg in e.body.args:
-                CLExpr_print(arg)
-        case 'dynamic_dispatch':
-            CLExpr_print(e.body.caller)
-            CLIdent_print(e.body.method_name)
-            print(len(e.body.args))
-            for arg in e.body.args:
-                CLExpr_print(arg)
-        case 'static_dispatch':
-            CLExpr_print(e.body.caller)
-            CLIdent_print(e.body.type)
-            CLIdent_print(e.body.method_name)
-            print(len(e.body.args))
-            for arg in e.body.args:
-                CLExpr_print(arg)
-        case 'let':
-            print(len(e.body.bind_list))
-            for binding in e.body.bind_list:
-                print(binding.bind_type)
-                CLIdent_print(binding.v_name)
-                CLIdent_print(binding.v_type)
-                if (binding.bind_type == 'let_binding_init'):
-                    CLExpr_print(binding.v_init)
-            CLExpr_print(e.body.let_body)
-        case 'case':
-            CLExpr_print(e.body.c_expr)
-            print(len(e.body.c_list))
-            for cs in e.body.c_list:
-                CLIdent_print(cs.ident)
-                CLIdent_print(cs.type)
-                CLExpr_print(cs.body)
+def emit_expr(em: CLEmitter, e: CLExpr):
+    """Emit an expression and all of its sub-expressions, without recursion.
+
+    The parts of an expression still to emit wait on an explicit stack, last
+    part first: sub-expressions are expanded when they reach the top, any other
+    part (line numbers, names, counts) is emitted as is
+    """
+    out = em.parts                                  # Flushing clears it in place
+    limit = em.limit
+    stack: list[CLExpr | str | int] = [e]
+    while (stack):
+        e = stack.pop()
+        if (not isinstance(e, CLExpr)):
+            out.append(e)
+            continue
+        body = e.body
+        # Line num of expr, type associated with the expr, name of expression
+        out += (e.line_num, e.s_type, e.type)
+        match(e.type):
+            case 'true'|'false':
+                pass
+            case 'integer'|'string'|'internal':
+                out.append(body.value)
+            case 'identifier':
+                out += (body.line, body.name)
+            case 'new':
+                out += (body.type_id.line, body.type_id.name)
+            case 'assign':
+                out += (body.var.line, body.var.name)
+                stack.append(body.rhs)
+            case 'isvoid'|'not'|'negate':
+                stack.append(body.expr)
+            case 'plus'|'minus'|'times'|'divide'|'lt'|'le'|'eq':
+                stack += (body.rhs, body.lhs)
+            case 'while':
+                stack += (body.body, body.pred)
+            case 'if':
+                stack += (body.false_case, body.true_case, body.pred)
+            case 'block':
+                out.append(len(body.expr_list))
+                stack.extend(reversed(body.expr_list))
+            case 'self_dispatch':
+                out += (body.method_name.line, body.method_name.name, len(body.args))
+                stack.extend(reversed(body.args))
+            case 'dynamic_dispatch':
+                stack.extend(reversed(body.args))
+                stack += (len(body.args), body.method_name.name, body.method_name.line,
+                          body.caller)
+            case 'static_dispatch':
+                stack.extend(reversed(body.args))
+                stack += (len(body.args), body.method_name.name, body.method_name.line,
+                          body.type.name, body.type.line,
+                          body.caller)
+            case 'let':
+                parts: list[CLExpr | str | int] = [len(body.bind_list)]
+                for binding in body.bind_list:
+                    parts += [binding.bind_type,
+                              binding.v_name.line, binding.v_name.name,
+                              binding.v_type.line, binding.v_type.name]
+                    if (binding.bind_type == 'let_binding_init'):
+                        parts.append(binding.v_init)
+                parts.append(body.let_body)
+                stack.extend(reversed(parts))
+            case 'case':
+                parts = [body.c_expr, len(body.c_list)]
+                for cs in body.c_list:
+                    parts += [cs.ident.line, cs.ident.name,
+                              cs.type.line, cs.type.name,
+                              cs.body]
+                stack.extend(reversed(parts))
+        if (len(out) >= limit):
+            em.flush()
+    return
+
+def emit_shared_expr(em: CLEmitter, e: CLExpr):
+    """Emit an expression that recurs in the output: method bodies and attribute
+    initializers are printed for the declaring class and every subclass, and again
+    in the annotated AST. The expression is rendered to text the first time only,
+    and the cached fragment is spliced in every time after that"""
+    if (not em.splice(e)):
+        em.add_fragment(e, render_expr(e))
+        em.splice(e)
     return
 
+def render_expr(e: CLExpr) -> str:
+    """Return the text `emit_expr` emits for an expression, newline terminated"""
+    frag = CLEmitter(io.StringIO())
+    emit_expr(frag, e)
+    frag.flush()
+    return frag.sink.getvalue()
+
+def emit_ident(em: CLEmitter, id: CLClassIdent|CLMethodIdent|CLVarIdent|CLSelfIdent|CLTypeIdent):
+    em.lines((id.line, id.name))
+    return
+
+def print_class_map(cst: dict[str,CLClass]):
+    """Print class map to stdout, see `emit_class_map`"""
+    em = CLEmitter(sys.stdout)
+    emit_class_map(em, cst)
+    em.flush()
+
+def print_implementation_map(cst: dict[str,CLClass]):
+    """Print implementation map to stdout, see `emit_implementation_map`"""
+    em = CLEmitter(sys.stdout)
+    emit_implementation_map(em, cst)
+    em.flush()
+
+def print_parent_map(cst: dict[str,CLClass]):
+    """Print parent map to stdout, see `emit_parent_map`"""
+    em = CLEmitter(sys.stdout)
+    emit_parent_map(em, cst)
+    em.flush()
+
+def print_annot_ast(ast: CLAST):
+    """Print annotated AST to stdout, see `emit_annot_ast`"""
+    em = CLEmitter(sys.stdout)
+    emit_annot_ast(em, ast)
+    em.flush()
+
+def CLExpr_print(e: CLExpr):
+    """Print an expression and all of its sub-expressions to stdout, see `emit_expr`"""
+    em = CLEmitter(sys.stdout)
+    emit_expr(em, e)
+    em.flush()
+
 def CLIdent_print(id: CLClassIdent|CLMethodIdent|CLVarIdent|CLSelfIdent|CLTypeIdent):
-    print(id.line)
-    print(id.name)
-    return
\ No newline at end of file
+    em = CLEmitter(sys.stdout)
+    emit_ident(em, id)
+    em.flush()
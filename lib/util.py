@@ -1,8 +1,11 @@
-import sys
+from __future__ import annotations
+
 from .cl_types import *
+from .stats import CLStats, phase
 
 import copy
 from collections import deque
+from collections.abc import Iterator
 
 def set_object_as_ancestor(ast: CLAST) -> CLAST:
     """Return a copy of a CLAST where all classes explicitly inherit from `Object` if they don't have any explicity inheritance declarations from the source file"""
@@ -13,123 +16,385 @@ def set_object_as_ancestor(ast: CLAST) -> CLAST:
             c.superclass = CLOBJECTINSTANCE.ident
     return ast_copy
 
-def init_class_table(ast: CLAST) -> dict[str, CLClass]:
+class CLClassHierarchy:
+    """Inheritance index over a class table, built once by `init_class_table`.
+
+    Attributes:
+        classes (dict[str, CLClass]): every indexed class by name
+        parent (dict[str, CLClass | None]): direct ancestor of each class; None iff the class is Object
+        depth (dict[str, int]): number of edges between each class and Object
+        ancestors (dict[str, tuple[CLClass, ...]]): ancestors of each class, starting from Object, not including the class itself
+        children (dict[str, list[str]]): direct descendants of each class, by name
+        pre (dict[str, int]): pre-order number of each class in a DFS of the class tree
+        post (dict[str, int]): post-order number of each class in a DFS of the class tree
+        euler (list[str]): Euler tour of the class tree from the same DFS
+        first (dict[str, int]): index of the first occurrence of each class in `euler`
+        sparse (list[list[str]]): sparse table over `euler`; sparse[k][i] is the least deep class in euler[i:i + 2**k]
+        lca_cache (dict[tuple[str, str], CLClass]): memoized results of `lca`
+    """
+    classes: dict[str, CLClass]
+    parent: dict[str, CLClass | None]
+    depth: dict[str, int]
+    ancestors: dict[str, tuple[CLClass, ...]]
+    children: dict[str, list[str]]
+    pre: dict[str, int]
+    post: dict[str, int]
+    euler: list[str]
+    first: dict[str, int]
+    sparse: list[list[str]]
+    lca_cache: dict[tuple[str, str], CLClass]
+
+    def __init__(self, ct: dict[str, CLClass], errors: list[CLCheckError] | None = None):
+        self.classes = dict()
+        self.parent = dict()
+        self.depth = dict()
+        self.ancestors = dict()
+        for c in ct.values():
+            self.index_class(ct, c, errors)
+        self.number_classes()
+        self.build_sparse_table()
+        self.lca_cache = dict()
+
+    def index_class(self, ct: dict[str, CLClass], c: CLClass, errors: list[CLCheckError] | None = None):
+        """Index `c` and every not yet indexed class on its path to Object.
+        Aborts on an inheritance cycle or an unknown superclass; when collecting
+        errors (see `report_error`), the class that closes the cycle or has the
+        unknown superclass inherits from Object instead"""
+        # 1) Walk up the parent pointers until an indexed class (or Object) is reached
+        chain: list[CLClass] = []
+        visited: set[str] = set()
+        curr = c
+        while (curr.ident.name not in self.ancestors):
+            if (curr.ident.name == 'Object'):
+                self.classes['Object'] = curr
+                self.parent['Object'] = None
+                self.depth['Object'] = 0
+                self.ancestors['Object'] = ()
+                break
+            if (curr.ident.name in visited):
+                # Cycle, broken at the last class walked
+                report_error(errors, CLCheckError(0, 'inheritance cycle'))
+                curr = CLOBJECTINSTANCE
+                continue
+            visited.add(curr.ident.name)
+            chain.append(curr)
+            # If no declared inheritance, a class only inherits from object by def
+            if ((not curr.inherits) or (curr.superclass is None)):
+                curr = CLOBJECTINSTANCE
+            elif (curr.superclass.name in ct):
+                curr = ct[curr.superclass.name]
+            else:
+                report_error(errors, CLCheckError(curr.superclass.line, f'class {curr.ident.name} inherits from unknown class {curr.superclass.name}'))
+                curr = CLOBJECTINSTANCE
+        # 2) Then fill in the walked classes from the top down
+        while (chain):
+            child = chain.pop()
+            self.classes[child.ident.name] = child
+            self.parent[child.ident.name] = curr
+            self.depth[child.ident.name] = self.depth[curr.ident.name] + 1
+            self.ancestors[child.ident.name] = self.ancestors[curr.ident.name] + (curr,)
+            curr = child
+
+    def number_classes(self):
+        """Number the class tree in one DFS from Object, so the interval 
+        [pre, post] of a class contains the intervals of all of its descendants. 
+        The same DFS records the Euler tour of the tree"""
+        self.children = {name: [] for name in self.parent}
+        for name, p in self.parent.items():
+            if (p is not None):
+                self.children[p.ident.name].append(name)
+        self.pre = dict()
+        self.post = dict()
+        self.euler = []
+        self.first = dict()
+        # Explicit stack so deep hierarchies don't hit the recursion limit
+        cnt = 0
+        stack: list[tuple[str, bool]] = [('Object', False)]
+        while (stack):
+            name, visited = stack.pop()
+            if (visited):
+                self.post[name] = cnt
+                # Back in the parent after leaving this subtree
+                if (self.parent[name] is not None):
+                    self.euler.append(self.parent[name].ident.name)
+            else:
+                self.pre[name] = cnt
+                self.first[name] = len(self.euler)
+                self.euler.append(name)
+                stack.append((name, True))
+                stack.extend((child, False) for child in reversed(self.children[name]))
+            cnt += 1
+
+    def build_sparse_table(self):
+        """Build the sparse table of least deep classes over the Euler tour"""
+        def shallower(a: str, b: str) -> str:
+            return a if self.depth[a] <= self.depth[b] else b
+        self.sparse = [self.euler]
+        k = 1
+        while ((1 << k) <= len(self.euler)):
+            prev = self.sparse[-1]
+            half = 1 << (k - 1)
+            self.sparse.append([shallower(prev[i], prev[i + half]) 
+                                for i in range(len(self.euler) - (1 << k) + 1)])
+            k += 1
+
+    def lca(self, c1: str, c2: str) -> CLClass:
+        """Return the least common ancestor of two classes, 
+        with a constant time range-minimum query over the Euler tour.
+        Results are memoized per pair
+
+        :param c1: name of a class
+        :type c1: str
+        :param c2: name of a class
+        :type c2: str
+        :return: the least deep class between the first occurrences of c1 and c2 in the Euler tour
+        :rtype: CLClass
+        """
+        key = (c1, c2) if c1 <= c2 else (c2, c1)
+        if (key in self.lca_cache):
+            return self.lca_cache[key]
+        l = self.first[key[0]]
+        r = self.first[key[1]]
+        if (l > r):
+            l, r = r, l
+        k = (r - l + 1).bit_length() - 1
+        a = self.sparse[k][l]
+        b = self.sparse[k][r - (1 << k) + 1]
+        rtn = self.classes[a if self.depth[a] <= self.depth[b] else b]
+        self.lca_cache[key] = rtn
+        return rtn
+
+    def is_subclass(self, c1: str, c2: str) -> bool:
+        """Check class c1 is c2 or inherits from c2, with two integer comparisons
+
+        :param c1: name of the class of interest
+        :type c1: str
+        :param c2: name of the class to check against
+        :type c2: str
+        :return: true if c1 <= c2; false if not, or if c2 is not a known class
+        :rtype: bool
+        """
+        if (c2 not in self.pre):
+            return False
+        return ((self.pre[c2] <= self.pre[c1]) and (self.post[c1] <= self.post[c2]))
+
+class CLClassTable(dict):
+    """The `dict[str, CLClass]` produced by `init_class_table`
+
+    Attributes:
+        hierarchy (CLClassHierarchy): inheritance index of the classes in the table
+    """
+    hierarchy: CLClassHierarchy = None
+
+def init_class_table(ast: CLAST, errors: list[CLCheckError] | None = None) -> CLClassTable:
     """Given a de-serialized ast from .cl-ast, return a table as a 
     `dict[str, CLClass]` where the name of a class as a string 
     maps to the `CLClass` object in the ast. Includes COOL basic 
     classes (Object, IO, Int, String, Bool)
 
-    Each value of the dict is a CLClass pointer into the AST
+    Each value of the dict is a CLClass pointer into the AST. The 
+    table also carries the inheritance index of its classes, so it 
+    aborts on inheritance cycles and unknown superclasses
 
     :param ast: the generated ast produced by ``./cool -parse``  
     :type ast: CLAST
+    :param errors: where errors are collected, see `report_error`; None to abort on the first
+    :type errors: list[CLCheckError] | None
 
     :returns: A dictionary that maps a class name to the instance of the class in the ast
-    :rtype: dict {str: CLClass}
+    :rtype: CLClassTable {str: CLClass}
     """
-    global CLOBJECTINSTANCE
-    global CLSTRINGINSTANCE
-    global CLIOINSTANCE
-    global CLINTINSTANCE
-    global CLBOOLINSTANCE
-
     ct = dict(zip([c.ident.name for c in ast.classes], ast.classes))
-    ct.update({CLOBJECTINSTANCE.ident.name: CLOBJECTINSTANCE})
-    ct.update({CLSTRINGINSTANCE.ident.name: CLSTRINGINSTANCE})
-    ct.update({CLINTINSTANCE.ident.name: CLINTINSTANCE})
-    ct.update({CLIOINSTANCE.ident.name: CLIOINSTANCE})
-    ct.update({CLBOOLINSTANCE.ident.name: CLBOOLINSTANCE})
-    return(dict(sorted(ct.items())))
-
-def get_method_env_dict(ct: dict[str, CLClass]) -> dict[tuple[str, str], list[CLTypeIdent]]:
-    """Produces a dictionary of strings, mapping class name and method 
+    # The builtin classes are shared by every table, read-only (see `mkCLBuiltin`)
+    ct.update(CLBUILTINS)
+    rtn = CLClassTable(sorted(ct.items()))
+    rtn.hierarchy = CLClassHierarchy(rtn, errors)
+    return rtn
+
+class CLEnvTable:
+    """Table of one class in an environment, keyed by attribute or method name. 
+    Entries not declared by the class itself are looked up in the table of its 
+    direct ancestor, which is shared by reference instead of copied. What a name
+    resolves to is kept once found, in this table and in every table walked to
+    find it, so each class x name walks the ancestors at most once and is then
+    looked up in O(1), without copying the whole of the ancestors' tables
+
+    Attributes:
+        own (dict[str, CLType | list[CLType]]): entries declared by the class itself;
+            final once the environment is built
+        parent (CLEnvTable | None): table of the direct ancestor; None iff the class is Object
+        resolved (dict[str, CLType | list[CLType] | None]): what each name looked up
+            so far resolves to, None if neither the class nor its ancestors declare it
+    """
+    own: dict[str, CLType | list[CLType]]
+    parent: CLEnvTable | None
+    resolved: dict[str, CLType | list[CLType] | None]
+
+    def __init__(self, parent: CLEnvTable | None):
+        self.own = dict()
+        self.parent = parent
+        self.resolved = dict()
+
+    def get(self, name: str, default=None):
+        try:
+            rtn = self.resolved[name]
+        except KeyError:
+            rtn = self.resolve(name)
+        return default if rtn is None else rtn
+
+    def resolve(self, name: str) -> CLType | list[CLType] | None:
+        """Find what `name` resolves to up the ancestors' tables, keeping it in every table walked"""
+        walked: list[CLEnvTable] = []
+        t = self
+        rtn = None
+        while (t is not None):
+            if (name in t.resolved):
+                rtn = t.resolved[name]
+                break
+            walked.append(t)
+            if (name in t.own):
+                rtn = t.own[name]
+                break
+            t = t.parent
+        for t in walked:
+            t.resolved[name] = rtn
+        return rtn
+
+    def __contains__(self, name: str) -> bool:
+        return self.get(name) is not None
+
+    def __getitem__(self, name: str):
+        rtn = self.get(name)
+        if (rtn is None):
+            raise KeyError(name)
+        return rtn
+
+class CLEnv:
+    """An environment partitioned into one `CLEnvTable` per class, 
+    looked up with `class name` x `name` tuples like a flat dict
+
+    Attributes:
+        tables (dict[str, CLEnvTable]): table of each class by class name
+    """
+    tables: dict[str, CLEnvTable]
+
+    def __init__(self, ct: dict[str, CLClass]):
+        """Make an empty table for every class of the class table, 
+        linked to the table of its direct ancestor"""
+        self.tables = dict()
+        for c in sorted(ct.values(), key=lambda c: ct.hierarchy.depth[c.ident.name]):
+            p = ct.hierarchy.parent[c.ident.name]
+            self.tables[c.ident.name] = CLEnvTable(self.tables[p.ident.name] if p is not None else None)
+
+    def top_down(self, ct: dict[str, CLClass]) -> Iterator[tuple[CLClass, dict[str, CLType | list[CLType]]]]:
+        """Yield every class of the class table after its ancestors, in one DFS of the 
+        class tree, with the entries it inherits: the entries of its ancestors' tables, 
+        the nearest shadowing the others. The dict is shadowed by the entries of a class 
+        once its subtree is entered and restored once it is left, like the scopes of
+        `CLObjectEnv`, so building it costs O(1) per entry; the entries of the class 
+        yielded must be in its table when the next class is asked for"""
+        inherited: dict[str, CLType | list[CLType]] = dict()
+        frames: list[list[tuple[str, CLType | list[CLType] | None]]] = []
+        # Explicit stack so deep hierarchies don't hit the recursion limit
+        stack: list[tuple[str, bool]] = [('Object', False)]
+        while (stack):
+            name, visited = stack.pop()
+            if (visited):
+                for k, v in reversed(frames.pop()):
+                    if (v is None):
+                        del inherited[k]
+                    else:
+                        inherited[k] = v
+                continue
+            yield (ct[name], inherited)
+            own = self.tables[name].own
+            frames.append([(k, inherited.get(k)) for k in own])
+            inherited.update(own)
+            stack.append((name, True))
+            stack.extend((child, False) for child in reversed(ct.hierarchy.children[name]))
+
+    def get(self, key: tuple[str, str], default=None):
+        t = self.tables.get(key[0])
+        return default if t is None else t.get(key[1], default)
+
+    def __contains__(self, key: tuple[str, str]) -> bool:
+        return self.get(key) is not None
+
+    def __getitem__(self, key: tuple[str, str]):
+        rtn = self.get(key)
+        if (rtn is None):
+            raise KeyError(key)
+        return rtn
+
+def decl_type(ct: dict[str, CLClass], name: str, errors: list[CLCheckError] | None, self_type: bool = True) -> CLType:
+    """Return the static type declared as `name`. When collecting errors (see `report_error`),
+    a type that is no class (nor SELF_TYPE, if `self_type`) is the error type: the
+    declaration is reported as an unknown type where it is checked, and its uses check
+    as if it were right"""
+    if ((errors is not None) and (name not in ct) and ((not self_type) or (name != 'SELF_TYPE'))):
+        return CLERRORTYPE
+    return mkCLType(name)
+
+def get_method_env_dict(ct: dict[str, CLClass], errors: list[CLCheckError] | None = None) -> CLEnv:
+    """Produces an environment of strings, mapping class name and method 
     name to a list of param types and a return type
+
+    Each class only stores the methods it declares; inherited methods 
+    are found through its ancestors' tables. When collecting errors, an
+    override that doesn't match is reported and kept, and unknown types
+    are the error type (see `decl_type`)
     
     :param ct: the dict produced by `init_class_table`
-    :type ct: dict[str, CLClass]
+    :type ct: CLClassTable
+    :param errors: where errors are collected, see `report_error`; None to abort on the first
+    :type errors: list[CLCheckError] | None
     :return: Desc
-    :rtype: dict[tuple[str,str], list[CLTypeIdent]]
+    :rtype: CLEnv of (str, str): list[CLType]
     """
-    rtn: dict[tuple[str, str], list[CLTypeIdent]]
-    rtn = dict()
+    rtn = CLEnv(ct)
 
     def check_redefine(curr_cls: CLClass,
                        curr_method: CLFeature, 
-                       r: dict[tuple[str, str], list[CLTypeIdent]]) -> bool:
-        # 1) Check each key in the rtn dict;
-        for key in r.keys():
-            # a) check the 
-            #   - method name of current key
-            #   - class of the current key, if it is equal to curr_cls
-            if ((curr_method.f_ident.name == key[1]) and
-                (curr_cls.ident.name == key[0])):
-                # i) check the method override formals len match
-                if ((curr_method.m_formals is not None) and
-                    (len(curr_method.m_formals) != (len(r[key]) - 1))):
-                    print(f'ERROR: {curr_method.f_ident.line}: Type-Check: formal params not matching length')
-                    sys.exit()
-                    return False
-                # ii) for each param, check newly declared param type match inherited param type
-                if (curr_method.m_formals is not None):
-                    for i in range(len(curr_method.m_formals)):
-                        if (curr_method.m_formals[i].type.name != r[key][i].name):
-                            print(f'ERROR: {curr_method.m_formals[i].type.line}: Type-Check: formal param {curr_method.m_formals[i].name.name}: {curr_method.m_formals[i].type.name}' \
-                                  f' does not match param with type {r[key][i].name}')
-                            sys.exit()
-                            return False
-                # iii) check return type of overridden method is exactly the return type of inherited method
-                #if (not conforms(ct, curr_anc, curr_method.m_type, r[key][-1])):
-                if (curr_method.m_type.name != r[key][-1].name):
-                    print(f'ERROR: {curr_method.m_type.line}: Type-Check: return type of method {curr_method.f_ident.name}: {curr_method.m_type.name} in class {curr_cls.ident.name}'\
-                          f' does not match inherited method return type {r[key][-1].name}')
-                    sys.exit()
-                    return False
+                       inherited: list[CLType]) -> bool:
+        # i) check the method override formals len match
+        if ((curr_method.m_formals is not None) and
+            (len(curr_method.m_formals) != (len(inherited) - 1))):
+            report_error(errors, CLCheckError(curr_method.f_ident.line, 'formal params not matching length'))
+        # ii) for each param, check newly declared param type match inherited param type
+        #     (an inherited param of the error type is of an unknown type, reported where it is declared)
+        elif (curr_method.m_formals is not None):
+            for i in range(len(curr_method.m_formals)):
+                if ((curr_method.m_formals[i].type.name != inherited[i].name) and (inherited[i] is not CLERRORTYPE)):
+                    report_error(errors, CLCheckError(curr_method.m_formals[i].type.line,
+                                                      f'formal param {curr_method.m_formals[i].name.name}: {curr_method.m_formals[i].type.name}' \
+                                                      f' does not match param with type {inherited[i].name}'))
+        # iii) check return type of overridden method is exactly the return type of inherited method
+        if ((curr_method.m_type.name != inherited[-1].name) and (inherited[-1] is not CLERRORTYPE)):
+            report_error(errors, CLCheckError(curr_method.m_type.line,
+                                              f'return type of method {curr_method.f_ident.name}: {curr_method.m_type.name} in class {curr_cls.ident.name}'\
+                                              f' does not match inherited method return type {inherited[-1].name}'))
         return True
-    def iterate_methods(curr_anc: CLClass,
-                        methods: deque[CLFeature], 
-                        r: dict[tuple[str, str], list[CLTypeIdent]],
-                        enclosing_cls: CLClass):
-        if (len(methods) == 0):
-            return
-        curr_method = methods.popleft()
-        # i) check for redefinitions
-        check_redefine(curr_anc, curr_method, r)
-        # ii) make a new key for rtn
-        new_key = (enclosing_cls.ident.name, curr_method.f_ident.name)
-        # iii) the associated value is a tuple of the current
-        #     method's params in order, 
-        new_val = []
-        if (curr_method.m_formals is not None):
-            for f in curr_method.m_formals:
-                new_val += [f.type]
-        #     then it's return type
-        new_val += [curr_method.m_type]
-        # iv) Then add the assoc k-v pair to rtn iff the key not in rtn already
-        #if (new_key not in r):
-        r[new_key] = new_val
-        return
-    def iterate_ancestors(ct: dict[str, CLClass], 
-                          ancestors: deque[CLClass], 
-                          r: dict[tuple[str, str], list[CLTypeIdent]],
-                          enclosing_cls: CLClass):
-        curr_anc = ancestors.popleft()
-        # a) Get current ancestor's methods
-        anc_methods = get_class_methods(curr_anc)
-            
-        # b) Loop through the curr_anc's methods
-        while (len(anc_methods) != 0):
-            iterate_methods(curr_anc, anc_methods, r, enclosing_cls)
-    def iterate_class_table(ct: dict[str, CLClass], v_class: CLClass):
-        # 1) Get current class ancestors
-        ancestors = get_ancestors(ct, v_class)
-        ancestors.append(v_class)
-        # 2) Loop through all ancestors starting from Object
-        while (len(ancestors) != 0):
-            iterate_ancestors(ct, ancestors, rtn, v_class)
-
-    for v_class in ct.values():
-        iterate_class_table(ct, v_class)
-    
+
+    # 1) Fill each class's table with the signatures of its own methods:
+    #    the params types in order, then the return type
+    for c in ct.values():
+        for m in get_class_methods(c):
+            new_val = []
+            if (m.m_formals is not None):
+                for f in m.m_formals:
+                    new_val += [decl_type(ct, f.type.name, errors, self_type=False)]
+            new_val += [decl_type(ct, m.m_type.name, errors)]
+            rtn.tables[c.ident.name].own[m.f_ident.name] = new_val
+    # 2) Then find the signature each override inherits, in O(1) going down the class tree
+    overrides: dict[str, list[tuple[CLFeature, list[CLType]]]] = dict()
+    for c, inherited in rtn.top_down(ct):
+        overrides[c.ident.name] = [(m, inherited[m.f_ident.name]) for m in get_class_methods(c)
+                                   if (m.f_ident.name in inherited)]
+    # 3) And check them class by class, in the order of the class table
+    for c in ct.values():
+        for m, signature in overrides[c.ident.name]:
+            check_redefine(c, m, signature)
+
     return rtn
 
 def get_class_methods(c: CLClass) -> deque[CLFeature]:
@@ -161,52 +426,156 @@ def get_class_methods_a(ct: dict[str, CLClass], c: CLClass) -> deque[CLFeature]:
     """
     rtn = deque()
 
-    c_a = get_ancestors(ct, c)
-    while (len(c_a) != 0):
-        rtn += get_class_methods(c_a.popleft())
+    for anc in ct.hierarchy.ancestors[c.ident.name]:
+        rtn += get_class_methods(anc)
     
     rtn += get_class_methods(c)
 
     return rtn
 
-def get_obj_env_dict(ct: dict[str, CLClass]) -> dict[tuple[str, str], CLTypeIdent]:
-    """Produce a dictionary that maps class name and variable name to 
+class CLObjectEnv(CLEnv):
+    """The object environment produced by `get_obj_env_dict`, mapping 
+    `class name` x `variable name` to a CLType.
+
+    Scopes (`self`, method formals, let and case bindings) are pushed onto 
+    and popped off the env in place; each scope only records the entries it 
+    shadows, so entering and leaving a scope costs O(bindings) instead of a 
+    copy of the whole env. Any SELF_TYPE looked up under a class C is 
+    returned as SELF_TYPE_C
+
+    Attributes:
+        scope (dict[tuple[str, str], CLType]): bindings of the open scopes, shadowing the class tables
+        frames (list[list[tuple[tuple[str, str], CLType | None]]]): for each open scope, the shadowed entries (None iff unbound before the scope)
+    """
+    scope: dict[tuple[str, str], CLType]
+    frames: list[list[tuple[tuple[str, str], CLType | None]]]
+
+    def __init__(self, ct: dict[str, CLClass]):
+        super().__init__(ct)
+        self.scope = dict()
+        self.frames = []
+
+    def get(self, key: tuple[str, str], default=None):
+        rtn = self.scope[key] if key in self.scope else super().get(key)
+        if (rtn is None):
+            return default
+        if (rtn.name == 'SELF_TYPE'):
+            return mkCLType('SELF_TYPE', key[0])
+        return rtn
+
+    def push(self, bindings: dict[tuple[str, str], CLType]):
+        """Open a scope binding each key of `bindings` to its value"""
+        frame = []
+        for k, v in bindings.items():
+            frame.append((k, self.scope.get(k)))
+            self.scope[k] = v
+        self.frames.append(frame)
+
+    def pop(self):
+        """Close the innermost scope, restoring the entries it shadowed"""
+        for k, v in reversed(self.frames.pop()):
+            if (v is None):
+                del self.scope[k]
+            else:
+                self.scope[k] = v
+
+def get_obj_env_dict(ct: dict[str, CLClass], errors: list[CLCheckError] | None = None) -> CLObjectEnv:
+    """Produce an environment that maps class name and variable name to 
     it's declared type
 
-    :param ct: dict with references to all COOL classes in the AST
-    :type ct: dict[str,CLClass]
-    :return: a dictionary that maps `class name` x `variable name` (as a tuple) to a CLTypeIdent
-    :rtype: dict of (str, str): CLTypeIdent
+    Each class only stores the attributes it declares; inherited attributes 
+    are found through its ancestors' tables. When collecting errors, an
+    attribute named self is reported and kept, a redefined attribute is
+    reported and keeps its first type, and unknown types are the error type
+    (see `decl_type`)
+
+    :param ct: the dict produced by `init_class_table`
+    :type ct: CLClassTable
+    :param errors: where errors are collected, see `report_error`; None to abort on the first
+    :type errors: list[CLCheckError] | None
+    :return: an environment that maps `class name` x `variable name` (as a tuple) to a CLType
+    :rtype: CLObjectEnv of (str, str): CLType
     """
-    rtn: dict[tuple[str,str], CLTypeIdent] = dict()
-    # iterate through every class in class table
-    for c in ct.values():
-        # For each class, get all the declared attributes up to Object
-        curr_attrs = get_class_attr_a(ct, c)
+    rtn: CLObjectEnv = CLObjectEnv(ct)
+    # 1) Fill each class's table going down the class tree, so a redefinition is
+    #    found in O(1) among the attributes the class inherits; keep what is found
+    found: dict[str, list[CLCheckError]] = dict()
+    for c, inherited in rtn.top_down(ct):
+        curr_table = rtn.tables[c.ident.name]
+        curr_found = found[c.ident.name] = []
+        curr_attrs = get_class_attr(c)
         a_names = [a.f_ident.name for a in curr_attrs]
         if ('self' in a_names):
             self_idx = a_names.index('self')
-            print(f'ERROR: {curr_attrs[self_idx].f_ident.line}: Type-Check: self is used as name of attribute')
-            sys.exit()
-            return
-        # For each class, keep track of all declared attributes; 
-        # Print an error if there is a re-define
-        decl_ident: set[str] = set()
-        while (curr_attrs):
-            # For the current class, add to its obj env attributes from ancestors first
-            curr_var = curr_attrs.popleft()
-            # Re-define is found if the current attribute name is already in `decl_ident`
-            if (curr_var.f_ident.name in decl_ident):
-                print(f'ERROR: {curr_var.f_ident.line}: Type-Check: attribute {curr_var.f_ident.name} redefined')
-                sys.exit()
-                return
-            decl_ident.add(curr_var.f_ident.name)
-            # Make the new k-v pair then add it to the return dict
-            new_key = (c.ident.name, curr_var.f_ident.name)
-            new_val = curr_var.att_type
-            rtn[new_key] = new_val
+            curr_found.append(CLCheckError(curr_attrs[self_idx].f_ident.line, 'self is used as name of attribute'))
+        for curr_var in curr_attrs:
+            # Re-define is found if the current attribute name is already 
+            # declared by the class itself or one of its ancestors
+            if ((curr_var.f_ident.name in curr_table.own) or (curr_var.f_ident.name in inherited)):
+                curr_found.append(CLCheckError(curr_var.f_ident.line, f'attribute {curr_var.f_ident.name} redefined'))
+                continue
+            curr_table.own[curr_var.f_ident.name] = decl_type(ct, curr_var.att_type.name, errors)
+    # 2) Then report them class by class in the order of the class table,
+    #    each class after its ancestors and only once
+    checked: set[str] = set()
+    for c in ct.values():
+        chain: list[CLClass] = []
+        curr = c
+        while ((curr is not None) and (curr.ident.name not in checked)):
+            chain.append(curr)
+            curr = ct.hierarchy.parent[curr.ident.name]
+        while (chain):
+            curr = chain.pop()
+            checked.add(curr.ident.name)
+            for e in found[curr.ident.name]:
+                report_error(errors, e)
     return rtn
         
+class CLCheckContext:
+    """Everything checking one program reads and changes, made by `init_context`.
+    Programs checked at the same time, on several threads, each have their own; all
+    they share is the frozen builtin classes, read-only, and the table of interned types,
+    which only holds the types of a program while it is in use (see `CLTYPES`)
+
+    Attributes:
+        ast (CLAST): the program; its expressions are annotated in place
+        classes (CLClassTable): its class table, with its inheritance index
+        me (CLEnv): its method environment
+        oe (CLObjectEnv): its object environment, where checking pushes and pops scopes
+        fragments (list[tuple[CLExpr, str]]): text of expressions already rendered for
+            the output, see `type_check_cached`
+        errors (list[CLCheckError] | None): the errors found so far when collecting
+            all the errors, see `report_error`; None when stopping at the first
+    """
+    ast: CLAST
+    classes: CLClassTable
+    me: CLEnv
+    oe: CLObjectEnv
+    fragments: list[tuple[CLExpr, str]]
+    errors: list[CLCheckError] | None
+
+    def __init__(self, ast: CLAST, classes: CLClassTable, me: CLEnv, oe: CLObjectEnv,
+                 errors: list[CLCheckError] | None = None):
+        self.ast = ast
+        self.classes = classes
+        self.me = me
+        self.oe = oe
+        self.fragments = []
+        self.errors = errors
+
+def init_context(ast: CLAST, all_errors: bool = False, stats: CLStats | None = None) -> CLCheckContext:
+    """Build the class table and environments of a program, raising a `CLCheckError`
+    on the errors found while building them; with `all_errors`, they are collected
+    in the context instead. Each step is a phase of `stats`, if given"""
+    errors = [] if (all_errors) else None
+    with phase(stats, 'init_class_table'):
+        ct = init_class_table(ast, errors)
+    with phase(stats, 'get_obj_env_dict'):
+        oe = get_obj_env_dict(ct, errors)
+    with phase(stats, 'get_method_env_dict'):
+        me = get_method_env_dict(ct, errors)
+    return CLCheckContext(ast, ct, me, oe, errors)
+
 def get_class_attr(c: CLClass) -> deque[CLFeature]:
     """Given a CLClass object, return a deque of the class's attributes not including ancestors
 
@@ -235,28 +604,31 @@ def get_class_attr_a(ct: dict[str, CLClass], c: CLClass) -> deque[CLFeature]:
     """
     rtn = deque()
 
-    c_a = get_ancestors(ct, c)
-    while (len(c_a) != 0):
-        rtn += get_class_attr(c_a.popleft())
+    for anc in ct.hierarchy.ancestors[c.ident.name]:
+        rtn += get_class_attr(anc)
     
     rtn += get_class_attr(c)
 
     return rtn
 
-def conforms(ct: dict[str, CLClass], enclosing_cls: CLClass, c1: CLTypeIdent, c2: CLTypeIdent) -> bool:
-    """Check c1 <= c2
+def conforms(ct: dict[str, CLClass], enclosing_cls: CLClass, c1: CLType, c2: CLType) -> bool:
+    """Check c1 <= c2, in constant time using the DFS numbering of the class table's inheritance index
     
-    :param ct: dict with references to all COOL classes in the AST
-    :type ct: dict[str,CLClass]
+    :param ct: the dict produced by `init_class_table`
+    :type ct: CLClassTable
     :param enclosing_cls: Used to "dereference" SELF_TYPE or self identifier
     :type enclosing_cls: CLClass
     :param c1: COOL type of interest
-    :type c1: CLTypeIdent
+    :type c1: CLType
     :param c1: COOL type to check conformance against
-    :type c1: CLTypeIdent
+    :type c1: CLType
     :return: true if c1 <= c2; false if not
     :rtype: bool
     """
+    if (c1 is c2):                                          # Types are interned
+        return True
+    if ((c1 is CLERRORTYPE) or (c2 is CLERRORTYPE)):        # Already reported
+        return True
     if ((c1.name == 'Object' and c2.name != 'Object') or    # Object only conforms to object
         ((c1.name != c2.name) and c2.name in ('String', 'Bool', 'Int'))):            # Nothing conforms to String, Int, or Bool because no class can inherit from them
         return False                                        # UNLESS c1 is also the same
@@ -265,94 +637,45 @@ def conforms(ct: dict[str, CLClass], enclosing_cls: CLClass, c1: CLTypeIdent, c2
         (c1.name == c2.name)):
         return True
     
-    if (c1.name == 'SELF_TYPE'):
-        c1_a = get_ancestors(ct, ct[c1.self_type_resolve])
-        c1_a.append(ct[c1.self_type_resolve])
-    else:
-        c1_a = get_ancestors(ct, ct[c1.name])
-        c1_a.append(ct[c1.name])
-
-    c2_is_ST = False
-    if (c2.name == 'SELF_TYPE'):
-        c2_is_ST = True
-
-    while (c1_a):
-        curr_cls = c1_a.pop()
-        if (((not c2_is_ST) and (curr_cls.ident.name == c2.name)) or
-            ((c2_is_ST) and (curr_cls.ident.name == c2.self_type_resolve))):
-            return True
-    return False
+    c1_name = c1.self_type_resolve if c1.name == 'SELF_TYPE' else c1.name
+    c2_name = c2.self_type_resolve if c2.name == 'SELF_TYPE' else c2.name
+
+    return ct.hierarchy.is_subclass(c1_name, c2_name)
 
 def get_direct_ancestor(ct: dict[str, CLClass], c: CLClass) -> CLClass | None:
     """Given a class table and CLClass object, 
     return the direct ancestor of the class.
     if a class has no declared ancestors, it implicitly inherits from Object
 
-    :param ct: dict with references to all COOL classes in the AST
-    :type ct: dict[str,CLClass]
+    :param ct: the dict produced by `init_class_table`
+    :type ct: CLClassTable
     :param c: class to find immediate ancestor of
     :type c: CLClass
     :return: the instance of the class that c is a child of
     :rtype: CLClass | None
     """
-    if (c.ident.name == 'Object'):
-        return None
-    else:
-        try:
-            if (c.superclass is not None):
-                return ct[c.superclass.name]
-            else:
-                return CLOBJECTINSTANCE
-        except:
-            print(f'ERROR: {c.superclass.line}: Type-Check: class {c.ident.name} inherits from unknown class {c.superclass.name}')
-            sys.exit()
-            return
+    return ct.hierarchy.parent[c.ident.name]
 
 def get_ancestors(ct: dict[str, CLClass], c: CLClass) -> deque[CLClass]:
     """Given a class table and CLClass object reference,
     return a deque of the class's ancestor classes until Object. 
-    The deque contains deep copies (i.e. allocated on heap probably)
+    The deque is a fresh copy of the chain in the class table's inheritance index, 
+    holding references to the classes in the table
 
-    :param ct: dict with references to all COOL classes in the AST
-    :type ct: dict[str,CLClass]
+    :param ct: the dict produced by `init_class_table`
+    :type ct: CLClassTable
     :param c: class to find all ancestors of, up to object
     :type c: CLClass
     :return: the deque of instances of classes that c is a child of
     :rtype: deque of CLClass
     """
-    rtn: deque[CLClass] = deque()
-    visited: set[str] = set()
-    curr = copy.deepcopy(c)
-    if (c.ident.name == 'Object'):
-        return rtn
-    # If no declared inheritance, a class only inherits from object by def
-    if (not c.inherits):
-        rtn.appendleft(CLOBJECTINSTANCE)
-        return rtn
-    #while curr.ident.name != 'Object':
-    # Loop while current class does have a declared inheritance
-    while (curr.inherits):
-        if (curr.ident.name in visited):
-            # Cycle
-            print('ERROR: 0: Type-Check: inheritance cycle')
-            sys.exit()
-            return None
-        # Create a copy of the curr class's ancestor
-        curr_anc: CLClass = copy.deepcopy(get_direct_ancestor(ct, curr))
-        # Push at front of rtn deque the ancestor of the current class 
-        rtn.appendleft(curr_anc)
-        visited.add(curr.ident.name)
-        curr = ct[curr.superclass.name]
-    if ('Object' not in {c.ident.name for c in rtn}):
-        rtn.appendleft(CLOBJECTINSTANCE)
-    return(rtn)
+    return deque(ct.hierarchy.ancestors[c.ident.name])
 
-def gen_class_map(ct: dict[str, CLClass], c: CLClass) -> (list[tuple[str, str, CLConstant | CLExpr]]|list):
-    """Produce a class map. `See CRM page here for spec <https://weimer.github.io/csci2320/crm/Class%20definitions.html>`_
-    
-    :param ct: dict with references to all COOL classes in the AST
-    :type ct: dict[str,CLClass]
-    :param c: class to find all declared attributes of, up to object
+def gen_attr_map(c: CLClass) -> list[tuple[str, str, CLConstant | CLExpr]]:
+    """Produce the class map entries of the attributes declared in `c`, not including ancestors.
+    An attribute without an initializer gets the shared default constant of its type
+
+    :param c: class to find the declared attributes of
     :type c: CLClass
     :return: a list of tuples: (attribute name X attribute type X initial value)
     :rtype: list (tuple(str, str, CLConstant | CLExpr))
@@ -360,56 +683,76 @@ def gen_class_map(ct: dict[str, CLClass], c: CLClass) -> (list[tuple[str, str, C
     # tuple(str: f_ident, str: att_type, CLConstant|CLExpr)
     rtn: list[tuple[str,str,CLConstant|CLExpr]]
     rtn = []
-    c_attrs = get_class_attr_a(ct, c)
-    while (c_attrs):
-        curr_attr = c_attrs.popleft()
+    for curr_attr in get_class_attr(c):
         match curr_attr.f_type:
             case 'attribute_no_init':
                 match curr_attr.att_type.name:
                     case 'Int':
-                        rtn.append((curr_attr.f_ident.name,
-                                    curr_attr.att_type.name,
-                                    CLConstant(curr_attr.att_type, 0)))
+                        default = CLINTDEFAULT
                     case 'String':
-                        rtn.append((curr_attr.f_ident.name,
-                                    curr_attr.att_type.name,
-                                    CLConstant(curr_attr.att_type, '')))
+                        default = CLSTRINGDEFAULT
                     case 'Bool':
-                        rtn.append((curr_attr.f_ident.name,
-                                    curr_attr.att_type.name,
-                                    CLConstant(curr_attr.att_type, 'false')))
+                        default = CLBOOLDEFAULT
                     case _:
-                        rtn.append((curr_attr.f_ident.name,
-                                    curr_attr.att_type.name,
-                                    CLConstant(curr_attr.att_type, 'void')))
+                        default = CLVOIDDEFAULT
+                rtn.append((curr_attr.f_ident.name,
+                            curr_attr.att_type.name,
+                            default))
             case 'attribute_init':
                 rtn.append((curr_attr.f_ident.name, 
                             curr_attr.att_type.name,
-                            copy.deepcopy(curr_attr.att_init)))
+                            curr_attr.att_init))
             case _:
-                print('unknown error')
-                sys.exit()
-                return None
+                raise CLCheckError(curr_attr.f_ident.line, 'unknown error', 'unknown error')
+    return rtn
+
+def gen_class_map(ct: dict[str, CLClass], c: CLClass) -> (list[tuple[str, str, CLConstant | CLExpr]]|list):
+    """Produce a class map. `See CRM page here for spec <https://weimer.github.io/csci2320/crm/Class%20definitions.html>`_
+    
+    :param ct: dict with references to all COOL classes in the AST
+    :type ct: dict[str,CLClass]
+    :param c: class to find all declared attributes of, up to object
+    :type c: CLClass
+    :return: a list of tuples: (attribute name X attribute type X initial value)
+    :rtype: list (tuple(str, str, CLConstant | CLExpr))
+    """
+    rtn: list[tuple[str,str,CLConstant|CLExpr]] = []
+    for anc in ct.hierarchy.ancestors[c.ident.name]:
+        rtn += gen_attr_map(anc)
+    rtn += gen_attr_map(c)
     return rtn
 
 def gen_class_map_a(ct: dict[str, CLClass]) -> list[tuple[str, list[tuple[str, str, CLConstant|CLExpr]]]]:
-    """Wrapper for `gen_class_map`. `See CRM page here for spec <https://weimer.github.io/csci2320/crm/Class%20definitions.html>`_.
+    """Produce the class map of every class. `See CRM page here for spec <https://weimer.github.io/csci2320/crm/Class%20definitions.html>`_.
     produces a list of tuples - (str X `gen_class_map`)
+
+    The maps are built top-down: a class's map is its parent's map followed by
+    the entries of its own attributes, so each class's attributes are only read
+    once and all the entries (and initializer expressions) are shared by reference
     
     :param ct: dict with references to all COOL classes in the AST
     :type ct: dict[str,CLClass]
     :return: a list of tuples: (class name X list of tuples: (attribute name X attribute type X initial value))
     :rtype: list(tuple(str, list(tuple(str, str, CLConstant | CLExpr)))
     """
-    rtn = []
-    for cls in ct:
-        rtn.append((cls, gen_class_map(ct, ct[cls])))
-    return rtn
+    hierarchy: CLClassHierarchy = ct.hierarchy
+    class_maps: dict[str, list[tuple[str, str, CLConstant|CLExpr]]] = dict()
+    # Parents come before their children when the classes are taken by depth
+    for cls in sorted(ct, key=hierarchy.depth.__getitem__):
+        parent = hierarchy.parent[cls]
+        own = gen_attr_map(ct[cls])
+        class_maps[cls] = own if (parent is None) else (class_maps[parent.ident.name] + own)
+    return [(cls, class_maps[cls]) for cls in ct]
 
 
 def gen_implementation_map(ct: dict[str, CLClass]) -> list[tuple[str,list[tuple[CLFeature, CLClass]]]]:
     """Produce an implementation map. `See CRM page here for spec <https://weimer.github.io/csci2320/crm/Class%20definitions.html>`_
 
+    Each class gets a method slot table (like a vtable): a copy of its parent's
+    table, where each of its own methods either overrides a slot or appends one.
+    A slot table is a dict from method name to (method, declaring class) kept in
+    slot order, so both a lookup and a move to the end are O(1)
+
     :param ct: dict with references to all COOL classes in the AST
     :type ct: dict[str,CLClass]
     :return: a list where each item is a tuple that corresponds to a class in the ast + the basic COOL classes, paired with a list of all methods (declared, inherited and overridden)
@@ -417,39 +760,30 @@ def gen_implementation_map(ct: dict[str, CLClass]) -> list[tuple[str,list[tuple[
     """
     def alpha_cmp_CLFeature(f: CLFeature):
         return f.f_ident.name
+    internal_methods = {'abort', 'copy', 'type_name', 
+                        'in_int', 'in_string', 'out_int', 'out_string'}
+    hierarchy: CLClassHierarchy = ct.hierarchy
+    slot_tables: dict[str, dict[str, tuple[CLFeature, CLClass]]] = dict()
+    # Parents come before their children when the classes are taken by depth
+    for k_cls in sorted(ct, key=hierarchy.depth.__getitem__):
+        c = ct[k_cls]
+        parent = hierarchy.parent[k_cls]
+        slots = dict() if (parent is None) else dict(slot_tables[parent.ident.name])
+        methods: list[CLFeature] = list(get_class_methods(c))
+        # Sort the methods by method name iff internal methods
+        if (k_cls in {'Object', 'IO', 'String'}):
+            methods = sorted(methods, key=alpha_cmp_CLFeature)
+        for m in methods:
+            name = m.f_ident.name
+            if ((name in slots) and (name not in internal_methods)):
+                # If m overrides a method that is not an internal method,
+                # its slot moves to the end
+                del slots[name]
+            # Otherwise an internal method's slot is replaced in place, or a new slot is added
+            slots[name] = (m, c)
+        slot_tables[k_cls] = slots
     #[(Class.str,[(Method, Class)])]
-    # ts crazy i know
-    rtn: list[tuple[str,list[tuple[CLFeature,CLClass]]]] = []
-    # For each class in the class symbol table,
-    for k_cls, v_cls in ct.items():
-        # get the path of classes to object
-        path_to_obj: deque[CLClass] = get_ancestors(ct, v_cls)
-        path_to_obj.append(copy.deepcopy(v_cls))
-        c_methods: list[tuple[CLFeature, CLClass]] = []
-        for c in path_to_obj:
-            # Starting from Object, get the list of methods for each class 
-            methods: list[CLFeature] = list(get_class_methods(c))
-            # and sort them by method name iff internal methods
-            if (c.ident.name in {'Object', 'IO', 'String'}):
-                methods = sorted(methods, key=alpha_cmp_CLFeature)
-            for m in methods: 
-                nm_names = [c_mthd[0].f_ident.name for c_mthd in c_methods]
-                if (m.f_ident.name in set(nm_names)):
-                    override_idx = list(nm_names).index(m.f_ident.name)
-                    if (m.f_ident.name in {'abort', 'copy', 'type_name', 
-                                           'in_int', 'in_string', 'out_int', 'out_string'}):
-                        # If m already exists in nm_names, and an internal method,
-                        # replace the entry
-                        c_methods[override_idx] = (copy.deepcopy(m), copy.deepcopy(c))
-                    else:
-                        # If m already exists in nm_names, and not an internal method,
-                        # remove it from c_methods and add to end
-                        c_methods.remove(c_methods[override_idx])
-                        c_methods.append((copy.deepcopy(m), copy.deepcopy(c)))
-                else:
-                    c_methods.append((copy.deepcopy(m), copy.deepcopy(c)))
-        rtn += [(k_cls, c_methods)]
-    return rtn
+    return [(k_cls, list(slot_tables[k_cls].values())) for k_cls in ct]
 
 def gen_parent_map(ct: dict[str, CLClass]) -> list[tuple[str,str]]:
     """Produce a parent map; the parent-child inheritance relations of a given COOL program
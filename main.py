@@ -1,31 +1,51 @@
 #!/usr/bin/python3
 import sys
-from contextlib import redirect_stdout
 
 import lib
 
 def main():
-    # Get all lines from the file
-    # TODO probably need to verify the arg & filename etc. :(
-    lines = [ l.strip() for l in tuple(open(sys.argv[1], 'r')) ]
-
-    # Initialize a parser object and give it the lines from the file
-    p = lib.COOLParser(lines)
-    p.reset_parser()
+    # main.py --batch [-j N] [--arena] [--cache DIR] [--ast-cache] [--binary] [--all-errors] files, directories or @manifests...
+    if (sys.argv[1] == '--batch'):
+        sys.exit(lib.batch_main(sys.argv[2:]))
+    # main.py --daemon SOCKET [-j N]: keeps the checker resident, serving checks on a Unix socket
+    if (sys.argv[1] == '--daemon'):
+        sys.exit(lib.daemon_main(sys.argv[2:]))
+    # main.py --client SOCKET [options] file: checks the file on that daemon, like main.py file [options]
+    if (sys.argv[1] == '--client'):
+        sys.exit(lib.client_main(sys.argv[2:]))
+    # main.py --convert SRC DST: a text .cl-ast/.cl-type to the binary format, or back
+    if (sys.argv[1] == '--convert'):
+        sys.exit(lib.convert_main(sys.argv[2:]))
 
-    ast = lib.read_prog(p)
-    class_symbol_table = lib.init_class_table(ast)
-    obj_env = lib.get_obj_env_dict(class_symbol_table)
-    met_env = lib.get_method_env_dict(class_symbol_table)
-    # This should annotate ast_ext nodes' s_type field with the static types calculated
-    lib.type_check(class_symbol_table, met_env, obj_env)
-
-    with open(sys.argv[1].split('.')[0] + '.cl-type', 'w') as out_file:
-        with redirect_stdout(out_file):
-            lib.print_class_map(class_symbol_table)
-            lib.print_implementation_map(class_symbol_table)
-            lib.print_parent_map(class_symbol_table)
-            lib.print_annot_ast(ast)
+    # TODO probably need to verify the arg & filename etc. :(
+    # With --arena, expressions are stored in flat columns instead of one object per node
+    # With -j N, the classes are checked by N worker processes
+    workers = int(sys.argv[sys.argv.index('-j') + 1]) if ('-j' in sys.argv[2:]) else 1
+    # With --cache DIR, only classes whose results are not cached in DIR are checked
+    cache = sys.argv[sys.argv.index('--cache') + 1] if ('--cache' in sys.argv[2:]) else None
+    # With --ast-cache, the program is loaded from the .cl-astc next to the input (written
+    # on the first run, and again whenever the input changes) instead of parsed
+    # With --binary, the binary .cl-typeb is written instead of the .cl-type; the
+    # .cl-ast may be in either format
+    # With --all-errors, the whole program is checked and every type error printed,
+    # one per line, instead of only the first
+    # With --stats FILE, the time of each phase and the counts of the program are written
+    # to FILE as JSON, even if the program doesn't type check; with --stats-memory too, the
+    # peak memory of each phase as well (tracing it slows the run down several times)
+    stats_path = sys.argv[sys.argv.index('--stats') + 1] if ('--stats' in sys.argv[2:]) else None
+    stats = lib.CLStats(memory=('--stats-memory' in sys.argv[2:])) if (stats_path is not None) else None
+    try:
+        lib.check_file(sys.argv[1], arena=('--arena' in sys.argv[2:]), workers=workers, cache=cache,
+                       ast_cache=('--ast-cache' in sys.argv[2:]), binary=('--binary' in sys.argv[2:]),
+                       all_errors=('--all-errors' in sys.argv[2:]), stats=stats)
+    except lib.CLCheckError as e:
+        # Print the first type error (or all of them) and stop
+        print(e)
+        sys.exit()
+    finally:
+        if (stats is not None):
+            with open(stats_path, 'w') as stats_file:
+                stats.write(stats_file)
     return
 
 if __name__ == '__main__':
@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import lib
+
+# The reference COOL implementation, used to parse the test programs
+COOL = os.path.join(ROOT, 'cool')
+
+@pytest.fixture
+def parse(tmp_path):
+    """Return a function parsing COOL source into the bytes of its .cl-ast"""
+    def parse(src: str, name: str = 'prog') -> bytes:
+        path = tmp_path / f'{name}.cl'
+        path.write_text(src)
+        try:
+            subprocess.run([COOL, '--parse', '--out', str(tmp_path / name), str(path)],
+                           check=True, capture_output=True)
+        except OSError as e:
+            pytest.skip(f'cannot run {COOL}: {e}')
+        return (tmp_path / f'{name}.cl-ast').read_bytes()
+    return parse
+
+def uncached(data: bytes) -> str:
+    """Return what checking a .cl-ast without any cache gives: its cl-type, or its error text"""
+    result = lib.check(data)
+    return result.cl_type().decode() if (result.ok) else result.error.text
@@ -0,0 +1,36 @@
+import lib
+
+# One error per line from 3 on, each in a place the checker must recover from
+ERRORS = '''
+class A { f(a : Int) : Int { a }; };
+class Main inherits IO {
+    x : Int <- "x";
+    main() : Object {{
+        (new A).f();
+        (new A)@A.f(1, 2);
+        out_int(y);
+        if 1 then 2 else 3 fi;
+        let z : Foo <- 1 in z;
+    }};
+};
+'''
+
+def test_every_error(parse):
+    data = parse(ERRORS)
+    result = lib.check(data, all_errors=True)
+    assert [(e.line, e.message) for e in result.errors] == [
+        (4, 'initializer of attribute x does not conform to Int'),
+        (6, 'wrong number of actual arguments (0 vs. 1)'),
+        (7, 'wrong number of actual arguments (2 vs. 1)'),
+        (8, 'unbound variable y'),
+        (9, 'error in if expression'),
+        (10, 'unknown type Foo'),
+    ]
+    # Stopping at the first error finds the same first error
+    assert lib.check(data).error.text == result.error.text
+
+def test_no_error(parse):
+    data = parse('class Main { main() : Object { 0 }; };')
+    result = lib.check(data, all_errors=True)
+    assert result.ok
+    assert result.cl_type() == lib.check(data).cl_type()
@@ -0,0 +1,113 @@
+import io
+import os
+import pickle
+import sqlite3
+
+import lib
+from conftest import uncached
+
+# A program whose classes depend on each other through dispatch, inheritance and
+# inherited attributes; each test edits one part of it
+PROG = '''
+class A {
+    x : Int <- 1;
+    f() : Int { 41 };
+};
+class B inherits A {
+    g() : Int { x + f() };
+};
+class C inherits A {
+    h(a : A) : Int { a.f() + 1 };
+};
+class Main inherits IO {
+    main() : Object { out_int((new C).h(new B) + (new B).g()) };
+};
+'''
+
+def check_cached(data: bytes, directory: str) -> tuple[str, int]:
+    """Check a .cl-ast with the cache in `directory`
+
+    :return: (its cl-type, or its error text X number of classes found in the cache)
+    """
+    p = lib.COOLStreamParser(lib.bytes_tokens(data))
+    p.reset_parser()
+    ctx = lib.init_context(lib.read_prog(p))
+    cache = lib.CLCheckCache(directory)
+    try:
+        _, ctx.fragments = lib.type_check_cached(ctx.classes, ctx.me, ctx.oe, cache)
+    except lib.CLCheckError as e:
+        return (e.text, cache.hits)
+    finally:
+        cache.close()
+    out_file = io.StringIO()
+    lib.write_cl_type(out_file, ctx)
+    return (out_file.getvalue(), cache.hits)
+
+def check_edit(parse, tmp_path, old: str, new: str) -> int:
+    """Check `PROG`, then `PROG` with `old` replaced by `new`, with the same cache,
+    asserting both give what an uncached check gives
+
+    :return: number of classes of the edited program found in the cache
+    """
+    assert old in PROG
+    directory = str(tmp_path / 'cache')
+    before = parse(PROG, 'before')
+    assert check_cached(before, directory) == (uncached(before), 0)
+    after = parse(PROG.replace(old, new), 'after')
+    text, hits = check_cached(after, directory)
+    assert text == uncached(after)
+    return hits
+
+def test_warm_run_hits_every_class(parse, tmp_path):
+    assert check_edit(parse, tmp_path, PROG, PROG) == 4
+
+def test_method_body_edit(parse, tmp_path):
+    assert check_edit(parse, tmp_path, '{ 41 }', '{ 42 }') == 3
+
+def test_method_body_edit_with_error(parse, tmp_path):
+    assert check_edit(parse, tmp_path, '{ 41 }', '{ "hi" }') < 4
+
+def test_callee_return_type_change(parse, tmp_path):
+    # B and C don't change, but their dispatches to f no longer type check
+    check_edit(parse, tmp_path, 'f() : Int { 41 }', 'f() : String { "hi" }')
+
+def test_parent_attribute_type_change(parse, tmp_path):
+    # B doesn't change, but the x it adds to is now a String
+    check_edit(parse, tmp_path, 'x : Int <- 1', 'x : String <- "one"')
+
+def test_inheritance_change(parse, tmp_path):
+    # B doesn't declare f or x, so it no longer type checks once it doesn't inherit them
+    check_edit(parse, tmp_path, 'class B inherits A', 'class B inherits IO')
+
+def test_line_shift_only(parse, tmp_path):
+    # Every class is found, and its text is rendered again with the new line numbers
+    assert check_edit(parse, tmp_path, '\nclass A', '\n\n\n\nclass A') == 4
+
+def test_corrupt_entry(parse, tmp_path):
+    directory = str(tmp_path / 'cache')
+    data = parse(PROG)
+    check_cached(data, directory)
+    db = sqlite3.connect(os.path.join(directory, 'cl-check-cache.db'))
+    db.execute("UPDATE entries SET data = X'00ff'")
+    db.commit()
+    db.close()
+    # Corrupt entries are misses, replaced once checked again
+    assert check_cached(data, directory) == (uncached(data), 0)
+    assert check_cached(data, directory) == (uncached(data), 4)
+
+def test_size_bound(tmp_path):
+    directory = str(tmp_path / 'cache')
+    entry = ('lined', [], [], ['x' * 1000])
+    size = len(pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL))
+    cache = lib.CLCheckCache(directory, max_bytes=10 * size)
+    for i in range(30):
+        cache.put(f'key{i}', entry)
+    cache.close()
+    # The least recently used entries went first
+    cache = lib.CLCheckCache(directory, max_bytes=10 * size)
+    total, count = cache.db.execute('SELECT SUM(size), COUNT(*) FROM entries').fetchone()
+    assert total <= 10 * size
+    assert count == 10
+    assert cache.get('key0') is None
+    assert cache.get('key29') == entry
+    cache.close()
@@ -0,0 +1,40 @@
+import pytest
+
+import lib
+
+OK = '''
+class Main inherits IO {
+    main() : Object { out_string("hi") };
+};
+'''
+
+BAD = '''
+class Main inherits IO {
+    main() : Object { out_string(1) };
+};
+'''
+
+def test_ok_result(parse):
+    result = lib.check(parse(OK))
+    assert result.ok
+    assert result.errors == []
+    assert result.cl_type().startswith(b'class_map\n')
+
+def test_error_result(parse):
+    result = lib.check(parse(BAD))
+    assert not result.ok
+    assert result.errors == [result.error]
+    assert result.error.line == 3
+
+def test_no_cl_type_on_error(parse):
+    result = lib.check(parse(BAD))
+    with pytest.raises(ValueError, match='does not type check'):
+        result.cl_type()
+
+def test_wrong_arity_is_an_error(parse):
+    result = lib.check(parse('''
+class A { f(a : Int) : Int { a }; };
+class Main { main() : Object { (new A).f() }; };
+'''))
+    assert not result.ok
+    assert result.error.text == 'ERROR: 3: Type-Check: wrong number of actual arguments (0 vs. 1)'
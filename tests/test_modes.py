@@ -0,0 +1,46 @@
+import pytest
+
+import lib
+
+# Programs whose last expression is a constant, the last lines of their .cl-ast
+PROGS = {
+    'negate_true': 'class Main { main() : Object { ~ true }; };',
+    'not_true': 'class Main { main() : Object { not true }; };',
+    'if_false': 'class Main { main() : Object { if true then 1 else false fi }; };',
+    'bool_body': 'class Main { main() : Bool { false }; };',
+    'mixed': '''
+class A { x : Bool <- true; f(b : Bool) : Int { if b then 1 else ~2 fi }; };
+class Main inherits IO { main() : Object { out_int((new A).f(not false)) }; };
+''',
+}
+
+def check_file(path, **kwargs) -> str:
+    """Check the .cl-ast at `path` like main.py does: its cl-type, or its error text"""
+    try:
+        lib.check_file(str(path), **kwargs)
+    except lib.CLCheckError as e:
+        return e.text
+    if (kwargs.get('binary')):
+        lib.binary_to_text(lib.cl_type_path(str(path), binary=True), str(path) + '.txt')
+        return open(str(path) + '.txt').read()
+    return open(lib.cl_type_path(str(path))).read()
+
+@pytest.mark.parametrize('name', PROGS)
+def test_modes_agree(parse, tmp_path, name):
+    path = tmp_path / f'{name}.cl-ast'
+    path.write_bytes(parse(PROGS[name], name))
+    binary = tmp_path / f'{name}-b.cl-ast'
+    lib.text_to_binary(str(path), str(binary))
+    expected = check_file(path)
+    assert check_file(path, arena=True) == expected
+    # Written by the first run, read by the second
+    assert check_file(path, ast_cache=True) == expected
+    assert check_file(path, ast_cache=True) == expected
+    assert check_file(binary) == expected
+    assert check_file(binary, binary=True) == expected
+    assert lib.check(path.read_bytes()).ok == (not expected.startswith('ERROR'))
+
+def test_negate_true_is_an_error(parse, tmp_path):
+    path = tmp_path / 'prog.cl-ast'
+    path.write_bytes(parse(PROGS['negate_true']))
+    assert check_file(path) == 'ERROR: 1: Type-Check: negate applied to non-integer type'
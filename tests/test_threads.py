@@ -0,0 +1,87 @@
+import gc
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import lib
+from conftest import uncached
+
+# Programs reusing the same class names with other members, types and errors, so that
+# a check seeing another one's class table, environments or annotations gives another output
+CORPUS = [
+'''
+class A { x : Int <- 1; f() : Int { x + 1 }; };
+class Main inherits IO { main() : Object { out_int((new A).f()) }; };
+''',
+'''
+class A { x : String <- "a"; f() : String { x.concat("b") }; };
+class B inherits A { g() : String { f() }; };
+class Main inherits IO { main() : Object { out_string((new B).g()) }; };
+''',
+'''
+class A inherits IO { f(n : Int) : SELF_TYPE { out_int(n) }; };
+class Main { a : A <- new A; main() : Object { a.f(1).f(2) }; };
+''',
+'''
+class A { f() : Int { "a" }; };
+class Main { main() : Object { (new A).f() }; };
+''',
+'''
+class A { x : Bool <- true; f() : Bool { not x }; };
+class B inherits A { h() : Object { if f() then 1 else "b" fi }; };
+class Main { main() : Object { case (new B).h() of i : Int => i + 1; o : Object => o; esac }; };
+''',
+'''
+class A { f() : Int { g() }; };
+class Main { main() : Object { (new A).f() }; };
+''',
+]
+
+@pytest.fixture
+def corpus(parse):
+    """(.cl-ast X expected output) of each program of `CORPUS`, checked on one thread"""
+    programs = [parse(src, f'p{i}') for i, src in enumerate(CORPUS)]
+    return [(data, uncached(data)) for data in programs]
+
+def output(result: lib.CLCheckResult) -> str:
+    return result.cl_type().decode() if (result.ok) else result.error.text
+
+def test_concurrent_checks(corpus):
+    # 16 threads making 640 checks. Switch threads as often as possible, to interleave the checks at any point
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        rng = random.Random(0)
+        picks = [rng.choice(corpus) for _ in range(640)]
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            outputs = list(pool.map(lambda p: output(lib.check(p[0])), picks))
+    finally:
+        sys.setswitchinterval(interval)
+    assert outputs == [expected for _, expected in picks]
+
+def test_types_not_kept(parse):
+    # Programs with classes of their own names: the interned types of one must go with it
+    programs = [parse(f'''
+class A{i} {{ me() : SELF_TYPE {{ self }}; }};
+class B{i} inherits A{i} {{ b : B{i} <- new B{i}; }};
+class Main {{ main() : Object {{ (new B{i}).me() }}; }};
+''', f'n{i}') for i in range(8)]
+    gc.collect()
+    before = len(lib.CLTYPES)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        for _ in range(3):
+            assert all(pool.map(lambda data: lib.check(data).ok, programs))
+            gc.collect()
+            assert len(lib.CLTYPES) == before
+
+@pytest.mark.skipif(sys.platform in ('win32', 'darwin'), reason='workers are only forked on Linux and the BSDs')
+def test_workers_on_the_only_thread(corpus):
+    for data, expected in corpus:
+        assert output(lib.check(data, workers=2)) == expected
+
+def test_workers_refused_on_threads(corpus):
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        with pytest.raises(ValueError, match='cannot check with 2 workers'):
+            pool.submit(lib.check, corpus[0][0], workers=2).result()